@@ -0,0 +1,82 @@
+import numpy as np
+from cache import LRUCache
+
+CLASSES = {'repaid': 0, 'defaulted': 1}
+
+# Statistics of the current clients, computed from their columns
+STATISTICS = {
+    'ages': lambda data: np.round(data['DAYS_BIRTH'].to_numpy(dtype=float)/-365),
+    'total_incomes': lambda data: data['AMT_INCOME_TOTAL'].to_numpy(dtype=float),
+    'credits': lambda data: data['AMT_CREDIT'].to_numpy(dtype=float),
+    'annuity': lambda data: data['AMT_ANNUITY'].to_numpy(dtype=float),
+    'length_loan': lambda data: 12*data['AMT_CREDIT'].to_numpy(dtype=float) / data['AMT_ANNUITY'].replace(0, np.nan).to_numpy(dtype=float),
+    'payment_rate': lambda data: 100*data['PAYMENT_RATE'].to_numpy(dtype=float),
+    'credit_income_percent': lambda data: data['CREDIT_INCOME_PERCENT'].to_numpy(dtype=float)
+}
+
+def summarize(values):
+    '''Count, mean, median, min and max of sorted values'''
+    if len(values) == 0:
+        return {'count': 0, 'mean': None, 'median': None, 'min': None, 'max': None}
+    return {
+        'count': int(len(values)),
+        'mean': float(values.mean()),
+        'median': float(np.median(values)),
+        'min': float(values[0]),
+        'max': float(values[-1])
+    }
+
+class StatisticsStore:
+    '''
+    Distributions of the current clients per TARGET class, computed once at load time: endpoints
+    send summaries and histograms whose size does not depend on the number of clients
+    '''
+    def __init__(self, data, cache_size=128):
+        target = data['TARGET'].to_numpy()
+        self.masks = {name: target == value for name, value in CLASSES.items()}
+
+        self.loans = {name: int(mask.sum()) for name, mask in self.masks.items()}
+
+        gender = data['CODE_GENDER'].fillna(0).to_numpy()
+        self.genders = {label: {name: int((mask & (gender == value)).sum()) for name, mask in self.masks.items()}
+                        for label, value in [('M', 0), ('F', 1)]}
+
+        self.values = {}
+        self.summaries = {}
+        for statistic, compute in STATISTICS.items():
+            values = compute(data)
+            self.values[statistic] = {}
+            self.summaries[statistic] = {}
+            for name, mask in self.masks.items():
+                class_values = values[mask]
+                class_values = np.sort(class_values[np.isfinite(class_values)])
+                self.values[statistic][name] = class_values
+                self.summaries[statistic][name] = summarize(class_values)
+
+        self.histograms = LRUCache(cache_size)
+
+    def distribution(self, statistic, bins=20, log=False):
+        '''
+        Get the summary and the histogram of a statistic for each class. With log, bins are evenly
+        spaced in log10 and only positive values are counted; edges are always in the original unit
+        '''
+        key = (statistic, bins, log)
+        result = self.histograms.get(key)
+        if result is not None:
+            return result
+
+        result = {}
+        for name, values in self.values[statistic].items():
+            if log:
+                values = values[values > 0]
+            if len(values) == 0:
+                counts, edges = np.zeros(bins, dtype=int), np.zeros(bins + 1)
+            elif log:
+                counts, edges = np.histogram(np.log10(values), bins=bins)
+                edges = 10**edges
+            else:
+                counts, edges = np.histogram(values, bins=bins)
+            result[name] = {**self.summaries[statistic][name], 'counts': counts.tolist(), 'edges': edges.tolist()}
+
+        self.histograms.put(key, result)
+        return result
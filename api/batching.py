@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+class MicroBatcher:
+    '''
+    Collect the items submitted within max_delay seconds (or until max_batch_size items are waiting) and process
+    them with a single call, each caller getting back its own result. Collecting runs on the event loop, the
+    blocking process call is handed to run (e.g. the dispatcher) so that it does not block the loop
+    '''
+    def __init__(self, process, max_batch_size=64, max_delay=0.002, run=None):
+        self.process = process
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.run = run or (lambda func, *args: asyncio.get_running_loop().run_in_executor(None, func, *args))
+        self.pending = []
+        self.timer = None
+        self.tasks = set()
+        self.metrics = {'maxBatchSize': max_batch_size, 'maxDelay': max_delay, 'batches': 0, 'items': 0,
+                        'batchSizes': {}, 'queueTime': 0.0, 'maxQueueTime': 0.0, 'runTime': 0.0}
+
+    async def submit(self, item):
+        '''Wait for the result of an item, processed with the other items submitted meanwhile'''
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((item, future, time.perf_counter()))
+        if len(self.pending) >= self.max_batch_size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.max_delay, self.flush)
+        return await future
+
+    def flush(self):
+        '''Start processing the waiting items'''
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            # Tasks are referenced until they end, the event loop only keeps weak references
+            task = asyncio.ensure_future(self.execute(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def execute(self, batch):
+        start = time.perf_counter()
+        queue_times = [start - submitted for _, _, submitted in batch]
+        self.metrics['batches'] += 1
+        self.metrics['items'] += len(batch)
+        self.metrics['batchSizes'][len(batch)] = self.metrics['batchSizes'].get(len(batch), 0) + 1
+        self.metrics['queueTime'] += sum(queue_times)
+        self.metrics['maxQueueTime'] = max(self.metrics['maxQueueTime'], max(queue_times))
+        try:
+            results = await self.run(self.process, [item for item, _, _ in batch])
+        except Exception as error:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        finally:
+            self.metrics['runTime'] += time.perf_counter() - start
+
+        for (_, future, _), result in zip(batch, results):
+            # Callers which went away have cancelled their future
+            if not future.done():
+                future.set_result(result)
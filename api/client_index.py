@@ -0,0 +1,50 @@
+import numpy as np
+from row_buffer import RowBuffer
+
+class ClientIndex:
+    '''
+    Map each SK_ID_CURR to the row position of the client in the dataframes, built once at load time
+    then extended with the clients added
+    '''
+    def __init__(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        self.n_loaded = len(ids)
+        # Ids in a growable buffer, adding a client is amortized O(1)
+        self.buffer = RowBuffer(1, dtype=np.int64, capacity=max(len(ids), 64))
+        self.buffer.append(ids[:, np.newaxis])
+        self.positions = {int(id): position for position, id in enumerate(ids)}
+
+    @property
+    def ids(self):
+        '''Ids of the clients, by row position'''
+        return self.buffer.values()[:, 0]
+
+    def add(self, id):
+        '''Add a client after the others, returning its position'''
+        position = self.buffer.append(np.int64(id))
+        self.positions[int(id)] = position
+        return position
+
+    def added(self):
+        '''Positions of the clients added after load time'''
+        return np.arange(self.n_loaded, len(self.buffer))
+
+    def truncate(self, n_clients):
+        '''Drop the clients added after the first n_clients ones'''
+        for id in self.ids[n_clients:]:
+            self.positions.pop(int(id), None)
+        self.buffer.truncate(n_clients)
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def __contains__(self, id):
+        return int(id) in self.positions
+
+    def get(self, id):
+        '''Get the row position of a client, None if the client id is unknown'''
+        return self.positions.get(int(id))
+
+    def get_many(self, ids):
+        '''Get the row positions of several clients, -1 for unknown client ids'''
+        return np.array([self.positions.get(int(id), -1) for id in ids], dtype=np.int64)
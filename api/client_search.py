@@ -0,0 +1,116 @@
+import numpy as np
+
+class SearchSnapshot:
+    '''
+    Sorted client ids with their row positions at one time: the ids sorted at load time (or at the last merge),
+    then the few ids added since, sorted apart
+    '''
+    __slots__ = ('ids', 'positions', 'added_ids', 'added_positions')
+
+    def __init__(self, ids, positions, added_ids, added_positions):
+        self.ids = ids
+        self.positions = positions
+        self.added_ids = added_ids
+        self.added_positions = added_positions
+
+    def __len__(self):
+        return len(self.ids) + len(self.added_ids)
+
+class ClientSearch:
+    '''
+    Client ids sorted once at load time, searched by prefix of their digits (typeahead) and listed by pages: a page
+    starts after the last id of the previous one (the cursor), so pages stay consistent when clients are added.
+    Added ids go to a small sorted array searched with the others, merged into the main one once it holds
+    merge_size ids, so that adding a client does not copy every id
+    '''
+    def __init__(self, ids, merge_size=4096):
+        ids = np.asarray(ids, dtype=np.int64)
+        order = np.argsort(ids, kind='stable')
+        self.merge_size = merge_size
+        # Replaced as a whole so that a concurrent search sees either version
+        self.sorted = SearchSnapshot(ids[order], order, ids[:0], order[:0])
+
+    def __len__(self):
+        return len(self.sorted)
+
+    def snapshot(self):
+        '''Sorted ids and their row positions at this time, to search with the filters computed for them'''
+        return self.sorted
+
+    def add(self, id, position):
+        '''Insert a client added after startup'''
+        current = self.sorted
+        index = np.searchsorted(current.added_ids, id)
+        added_ids = np.insert(current.added_ids, index, id)
+        added_positions = np.insert(current.added_positions, index, position)
+        if len(added_ids) < self.merge_size:
+            self.sorted = SearchSnapshot(current.ids, current.positions, added_ids, added_positions)
+        else:
+            self.sorted = merge(current.ids, current.positions, added_ids, added_positions)
+
+    def truncate(self, n_clients):
+        '''Drop the clients whose position is not among the first n_clients ones'''
+        current = self.sorted
+        kept = current.positions < n_clients
+        added_kept = current.added_positions < n_clients
+        if not kept.all() or not added_kept.all():
+            self.sorted = SearchSnapshot(current.ids[kept], current.positions[kept],
+                                         current.added_ids[added_kept], current.added_positions[added_kept])
+
+    def ranges(self, ids, prefix):
+        '''
+        Ranges (start, stop) of the sorted ids whose digits start with a prefix: the ids with k more digits than the
+        prefix lie between prefix*10**k and (prefix + 1)*10**k, so the ranges come in increasing order
+        '''
+        if not prefix:
+            return [(0, len(ids))]
+        # Client ids are positive, none starts with 0
+        if prefix.startswith('0') or len(ids) == 0:
+            return []
+        value = int(prefix)
+        n_digits = len(str(int(ids[-1])))
+        ranges = []
+        for k in range(n_digits - len(prefix) + 1):
+            low, high = value*10**k, (value + 1)*10**k
+            ranges.append((np.searchsorted(ids, low), np.searchsorted(ids, high)))
+        return ranges
+
+    def matches(self, ids, positions, prefix, keep):
+        '''Sorted ids starting with the prefix and kept by the filters, clients past the end of the filters are left out'''
+        matches = []
+        for start, stop in self.ranges(ids, prefix):
+            range_ids = ids[start:stop]
+            if keep is not None:
+                range_positions = positions[start:stop]
+                filtered = range_positions < len(keep)
+                range_ids = range_ids[filtered][keep[range_positions[filtered]]]
+            matches.append(range_ids)
+        return matches[0] if len(matches) == 1 else np.concatenate(matches) if matches else ids[:0]
+
+    def search(self, prefix=None, cursor=None, limit=50, keep=None, snapshot=None):
+        '''
+        Get, in increasing order, the limit ids after the cursor which start with the prefix, and are kept by
+        the filters if given (a boolean array by row position, clients past its end are left out). Also get the
+        cursor of the next page (None on the last one) and the number of matching ids. Ids are searched in
+        a snapshot if given, the current ids otherwise
+        '''
+        # An empty prefix, as sent by a cleared search box, matches every id
+        if prefix and not prefix.isdigit():
+            raise ValueError(f'Client id prefix must be digits, got {prefix!r}')
+        snapshot = snapshot if snapshot is not None else self.sorted
+        matches = self.matches(snapshot.ids, snapshot.positions, prefix, keep)
+        added_matches = self.matches(snapshot.added_ids, snapshot.added_positions, prefix, keep)
+
+        # Only the ids after the cursor which can be on the page are merged
+        first = np.searchsorted(matches, cursor, side='right') if cursor is not None else 0
+        added_first = np.searchsorted(added_matches, cursor, side='right') if cursor is not None else 0
+        page = np.sort(np.concatenate([matches[first:first + limit], added_matches[added_first:added_first + limit]]))[:limit]
+        remaining = len(matches) - first + len(added_matches) - added_first
+        next_cursor = int(page[-1]) if remaining > limit else None
+        return page.tolist(), next_cursor, len(matches) + len(added_matches)
+
+def merge(ids, positions, added_ids, added_positions):
+    '''Snapshot with the added ids merged into the sorted ones'''
+    order = np.argsort(np.concatenate([ids, added_ids]), kind='stable')
+    return SearchSnapshot(np.concatenate([ids, added_ids])[order], np.concatenate([positions, added_positions])[order],
+                          added_ids[:0], added_positions[:0])
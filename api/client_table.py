@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+from row_buffer import RowBuffer
+
+class ClientTable:
+    '''
+    Rows of the clients: the ones loaded at startup stay in their (memory mapped) dataframe or compact frame,
+    the applicants added later go to a row buffer, so adding a client never copies the table. Positions of the
+    added clients follow the loaded ones
+    '''
+    def __init__(self, data):
+        self.data = data
+        self.columns = data.columns
+        self.added = RowBuffer(len(data.columns))
+
+    def __len__(self):
+        return len(self.data) + len(self.added)
+
+    def append(self, row):
+        '''Add a client (SK_ID_CURR then its features), returning its position'''
+        return len(self.data) + self.added.append(np.asarray(row, dtype=np.float64))
+
+    def truncate(self, n_clients):
+        '''Drop the clients added after the first n_clients ones'''
+        self.added.truncate(n_clients - len(self.data))
+
+    def take(self, positions):
+        '''Get the rows at some positions, in the same order, as a dataframe'''
+        positions = np.asarray(positions, dtype=np.int64)
+        n_loaded = len(self.data)
+        if (positions < n_loaded).all():
+            return self.data.take(positions)
+
+        loaded = positions < n_loaded
+        values = np.empty((len(positions), len(self.columns)))
+        values[loaded] = self.data.take(positions[loaded]).to_numpy(dtype=np.float64)
+        values[~loaded] = self.added.values()[positions[~loaded] - n_loaded]
+        rows = pd.DataFrame(values, columns=self.columns)
+        rows['SK_ID_CURR'] = rows['SK_ID_CURR'].astype(np.int64)
+        return rows
@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+
+# Storage type of a column: one-hot and other 0/1 (or small integer) columns, numerics exact in float32, the rest
+DTYPES = [np.uint8, np.float32, np.float64]
+UINT8, FLOAT32, FLOAT64 = range(3)
+PARTS = ['dtypes', 'uint8', 'float32', 'float64']
+# Missing values of the uint8 columns
+UINT8_NAN = 255
+
+def column_dtypes(values, float32=False):
+    '''
+    Smallest storage type of every column of a float64 array that keeps its values: uint8 for integers from 0 to
+    254 (missing values are stored as 255), float32 when every value round-trips, float64 otherwise. With
+    float32=True, every column which is not uint8 is stored in float32, losing precision
+    '''
+    dtypes = np.empty(values.shape[1], dtype=np.int8)
+    for column in range(values.shape[1]):
+        # One column at a time, the values may be a memory mapped snapshot
+        value = np.asarray(values[:, column], dtype=np.float64)
+        missing = np.isnan(value)
+        if (missing | ((value >= 0) & (value < UINT8_NAN) & (value == np.round(value)))).all():
+            dtypes[column] = UINT8
+        elif float32:
+            dtypes[column] = FLOAT32
+        else:
+            with np.errstate(over='ignore'):
+                exact = value.astype(np.float32).astype(np.float64) == value
+            dtypes[column] = FLOAT32 if (exact | missing).all() else FLOAT64
+    return dtypes
+
+class CompactFrame:
+    '''
+    Client rows stored with the smallest type per column: a block per type (uint8, float32, float64), row-major
+    so that the rows of a client are contiguous, instead of a float64 dataframe. Blocks can be memory mapped from
+    a feature store. Rows are read back as float64 dataframes in the original column order, only for the clients
+    requested
+    '''
+    def __init__(self, ids, columns, dtypes, blocks, id_column='SK_ID_CURR'):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.feature_names = list(columns)
+        self.dtypes = np.asarray(dtypes)
+        self.blocks = blocks
+        self.id_column = id_column
+        self.positions = [np.flatnonzero(self.dtypes == code) for code in range(len(DTYPES))]
+
+    @classmethod
+    def from_frame(cls, data, float32=False, block_size=65536):
+        '''Compact a dataframe of clients (SK_ID_CURR then the features), such as a snapshot'''
+        features = data.iloc[:, 1:]
+        values = features.to_numpy()
+        dtypes = column_dtypes(values, float32)
+        blocks = [np.empty((len(data), (dtypes == code).sum()), dtype=dtype) for code, dtype in enumerate(DTYPES)]
+        for code, block in enumerate(blocks):
+            columns = np.flatnonzero(dtypes == code)
+            for start in range(0, len(data), block_size):
+                rows = values[start:start + block_size][:, columns]
+                if code == UINT8:
+                    rows = np.where(np.isnan(rows), UINT8_NAN, rows)
+                block[start:start + block_size] = rows
+        return cls(data['SK_ID_CURR'].to_numpy(), features.columns, dtypes, blocks)
+
+    @classmethod
+    def publish(cls, store, name, ids, columns, compact):
+        '''
+        Attach to a compact frame published in a feature store, compacting (compact() returns a CompactFrame)
+        and publishing it first if it is missing. Call it inside exclusive() when several processes share the store
+        '''
+        arrays = [store.attach(f'{name}_{part}') for part in PARTS]
+        if any(array is None for array in arrays):
+            frame = compact()
+            arrays = [store.save(f'{name}_{part}', array) for part, array in zip(PARTS, [frame.dtypes] + frame.blocks)]
+        return cls(ids, columns, arrays[0], arrays[1:])
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def columns(self):
+        return pd.Index(([self.id_column] if self.id_column else []) + self.feature_names)
+
+    @property
+    def shape(self):
+        return (len(self), len(self.columns))
+
+    @property
+    def nbytes(self):
+        return sum(block.nbytes for block in self.blocks) + self.ids.nbytes
+
+    def features(self):
+        '''Same rows without the id column, sharing the blocks'''
+        return CompactFrame(self.ids, self.feature_names, self.dtypes, self.blocks, id_column=None)
+
+    def values(self, positions):
+        '''Feature rows at some positions as a float64 array, in the original column order'''
+        positions = np.asarray(positions, dtype=np.int64)
+        values = np.empty((len(positions), len(self.feature_names)))
+        for code, (columns, block) in enumerate(zip(self.positions, self.blocks)):
+            if len(columns):
+                rows = block[positions]
+                values[:, columns] = np.where(rows == UINT8_NAN, np.nan, rows) if code == UINT8 else rows
+        return values
+
+    def take(self, positions):
+        '''Rows at some positions as a float64 dataframe indexed by position, like DataFrame.iloc[positions]'''
+        positions = np.asarray(positions, dtype=np.int64)
+        data = pd.DataFrame(self.values(positions), columns=self.feature_names, index=positions, copy=False)
+        if self.id_column:
+            data.insert(0, self.id_column, self.ids[positions])
+        return data
+
+    def column(self, name):
+        '''Every value of a feature column as float64'''
+        position = self.feature_names.index(name)
+        code = self.dtypes[position]
+        values = np.asarray(self.blocks[code][:, np.searchsorted(self.positions[code], position)], dtype=np.float64)
+        if code == UINT8:
+            values[values == UINT8_NAN] = np.nan
+        return values
+
+    def memory_usage(self):
+        '''Bytes per storage type, with the bytes the same rows take as float64'''
+        usage = {np.dtype(dtype).name: int(block.nbytes) for dtype, block in zip(DTYPES, self.blocks)}
+        usage['total'] = int(self.nbytes)
+        usage['asFloat64'] = int(len(self)*len(self.feature_names)*8 + self.ids.nbytes)
+        return usage
@@ -0,0 +1,74 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+class Dispatcher:
+    '''
+    Run blocking endpoint bodies on a bounded thread pool instead of the event loop. Endpoints are grouped,
+    and a group can be limited to a number of concurrent calls, so that slow groups (e.g. neighbors) can
+    not take every worker and cheap endpoints keep a low latency: the limits must leave some workers to the
+    unlimited groups
+    '''
+    def __init__(self, max_workers, limits=None):
+        if sum((limits or {}).values()) >= max_workers:
+            raise ValueError(f'Limited groups {limits} would take every one of the {max_workers} workers')
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='dispatch')
+        self.limits = dict(limits or {})
+        self.semaphores = {}
+        self.metrics = {}
+
+    def group_metrics(self, group):
+        if group not in self.metrics:
+            self.metrics[group] = {'limit': self.limits.get(group, self.max_workers), 'running': 0, 'waiting': 0,
+                                   'maxWaiting': 0, 'completed': 0, 'waitTime': 0.0, 'maxWaitTime': 0.0, 'runTime': 0.0}
+        return self.metrics[group]
+
+    async def run(self, group, func, *args, **kwargs):
+        '''
+        Run func on the thread pool, waiting first for a free slot of its group. Metrics are only updated
+        from the event loop, so they need no lock
+        '''
+        if group not in self.semaphores:
+            self.semaphores[group] = asyncio.Semaphore(self.limits.get(group, self.max_workers))
+        metrics = self.group_metrics(group)
+
+        semaphore = self.semaphores[group]
+
+        start = time.perf_counter()
+        metrics['waiting'] += 1
+        metrics['maxWaiting'] = max(metrics['maxWaiting'], metrics['waiting'])
+        try:
+            await semaphore.acquire()
+        finally:
+            metrics['waiting'] -= 1
+
+        wait_time = time.perf_counter() - start
+        metrics['waitTime'] += wait_time
+        metrics['maxWaitTime'] = max(metrics['maxWaitTime'], wait_time)
+        metrics['running'] += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+        finally:
+            semaphore.release()
+            metrics['running'] -= 1
+            metrics['completed'] += 1
+            metrics['runTime'] += time.perf_counter() - start - wait_time
+
+    def offload(self, group):
+        '''
+        Decorator turning a blocking endpoint into an async one dispatched on the thread pool,
+        keeping its signature for FastAPI
+        '''
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                return await self.run(group, func, *args, **kwargs)
+            return wrapper
+        return decorator
+
+    def queue_depth(self):
+        '''Number of calls waiting for a slot, per group'''
+        return {group: metrics['waiting'] for group, metrics in self.metrics.items()}
@@ -0,0 +1,227 @@
+import contextlib
+import threading
+import numpy as np
+from cache import LRUCache
+from feature_store import exclusive
+
+# One-hot encoded columns of the segments, a client belongs to the category whose column is 1
+SEGMENT_PREFIXES = {'incomeType': 'NAME_INCOME_TYPE_', 'educationType': 'NAME_EDUCATION_TYPE_', 
+                    'familyStatus': 'NAME_FAMILY_STATUS_'}
+
+def score_edges(scores):
+    '''Edges of the score deciles, fixed once so that clients added later keep the same deciles'''
+    return np.quantile(scores, np.arange(1, 10) / 10)
+
+def segment_labels(data, scores, edges):
+    '''
+    Segments of every client: gender, income type, education type, family status and decile of score (1 to 10)
+    '''
+    segments = {'gender': np.where(data['CODE_GENDER'].fillna(0).to_numpy() == 0, 'Man', 'Woman')}
+    for segment, prefix in SEGMENT_PREFIXES.items():
+        columns = [column for column in data.columns if column.startswith(prefix)]
+        is_category = data[columns].to_numpy() == 1
+        labels = np.array([column[len(prefix):] for column in columns] + ['Missing'])
+        segments[segment] = labels[np.where(is_category.any(axis=1), is_category.argmax(axis=1), len(columns))]
+    segments['scoreDecile'] = (np.searchsorted(edges, scores, side='right') + 1).astype(str)
+    return segments
+
+class ImportanceSummaries:
+    '''
+    Mean absolute shap value of every feature over all the clients and over each segment, kept as sums and
+    counts so that clients can be added incrementally. Rankings are sorted when clients are added, a top k is
+    then read without touching the shap values
+    '''
+    def __init__(self, feature_names):
+        self.feature_names = np.asarray(feature_names)
+        self.sums = {}
+        self.counts = {}
+        self.rankings = {}
+        self.lock = threading.Lock()
+
+    def add(self, shap_values, segments):
+        '''Add clients with their shap values and their segments (label of each client per segment)'''
+        absolute = np.abs(shap_values)
+        groups = [('all', 'all', slice(None))]
+        for segment, labels in segments.items():
+            groups += [(segment, label, labels == label) for label in np.unique(labels)]
+
+        with self.lock:
+            for segment, label, rows in groups:
+                key = (segment, str(label))
+                values = absolute[rows]
+                self.sums[key] = self.sums.get(key, 0) + values.sum(axis=0, dtype=np.float64)
+                self.counts[key] = self.counts.get(key, 0) + len(values)
+
+                means = self.sums[key] / self.counts[key]
+                order = np.argsort(-means, kind='stable')
+                self.rankings[key] = (self.feature_names[order], means[order])
+
+    def segments(self):
+        '''Labels and number of clients of every segment'''
+        result = {}
+        for (segment, label), count in sorted(self.counts.items()):
+            result.setdefault(segment, {})[label] = count
+        return result
+
+    def top(self, segment='all', label='all', k=10):
+        '''Get the k most important features of a segment, KeyError if the segment is unknown'''
+        names, means = self.rankings[(segment, label)]
+        return dict(zip(names[:k].tolist(), means[:k].tolist()))
+
+class NativeExplainer:
+    '''
+    Exact tree shap values computed by LightGBM itself (pred_contrib) in one batched call, with the same output
+    as the shap TreeExplainer of a binary model: a list with the contributions to class 0 and to class 1
+    '''
+    def __init__(self, model):
+        self.booster = getattr(model, 'booster_', model)
+
+    def shap_values(self, features):
+        contributions = self.booster.predict(np.ascontiguousarray(features, dtype=np.float64), pred_contrib=True)
+        # Last column is the expected value, contributions to class 0 are the opposite of the ones to class 1
+        values = contributions[:, :-1]
+        return [-values, values]
+
+class ExplanationService:
+    '''
+    Shap values of the clients, computed for a client on its first request and kept in a bounded LRU cache
+    keyed by client and model version. The float32 matrix of the clients loaded at startup can be backfilled in
+    the background and published in a feature store, it is then attached at the next boot instead of being
+    computed again. Clients added later are explained on demand and included in the summaries
+    '''
+    def __init__(self, explainer, features, model_version, cache_size=4096, store=None, lock_path=None,
+                 block_size=1000, segments=None, rows=None, added=None, timings=None):
+        self.explainer = explainer
+        self.features = features
+        # Gets the features of clients by position, including the clients added after startup
+        self.rows = rows or (lambda positions: features.take(positions))
+        self.model_version = model_version
+        self.cache = LRUCache(cache_size)
+        self.store = store
+        self.lock_path = lock_path
+        self.block_size = block_size
+        self.lock = threading.Lock()
+        self.backfill_thread = None
+        self.backfilled = 0
+        # Gets the segments of clients by position, only called for the summaries
+        self.segments = segments or (lambda positions: {})
+        self.summaries = None
+        # Gets the positions of the clients added after startup, shared by every model version, and how many of
+        # them the summaries include. Summaries are updated under their own lock, held briefly, so that adding a
+        # client never waits for the matrix
+        self.added = added or (lambda: np.arange(len(features), len(features)))
+        self.merged = 0
+        self.summaries_lock = threading.Lock()
+        # Timings recording the computation of the matrix, which runs after startup
+        self.timings = timings
+        # One matrix per model version, so that versions loaded side by side do not replace each other's
+        self.matrix_name = f'shap_values_float32_{model_version}'
+        self.matrix = store.attach(self.matrix_name) if store is not None else None
+
+    def compute(self, features):
+        '''Compute the shap values of some feature rows'''
+        values = self.explainer.shap_values(features)
+        # Only the contributions to class 0 are served
+        return np.asarray(values[0], dtype=np.float32)
+
+    def explain(self, position):
+        '''Get the shap values of a client'''
+        if self.matrix is not None and position < len(self.matrix):
+            return self.matrix[position]
+
+        key = (position, self.model_version)
+        values = self.cache.get(key)
+        if values is None:
+            values = self.compute(self.rows([position]))[0]
+            self.cache.put(key, values)
+        return values
+
+    def compute_matrix(self):
+        '''Compute the shap values of every client by blocks'''
+        matrix = np.empty((len(self.features), len(self.features.columns)), dtype=np.float32)
+        for start in range(0, len(matrix), self.block_size):
+            positions = np.arange(start, min(start + self.block_size, len(matrix)))
+            matrix[start:start + self.block_size] = self.compute(self.features.take(positions))
+            self.backfilled = min(start + self.block_size, len(matrix))
+        return matrix
+
+    def load_matrix(self):
+        '''
+        Get the shap values of every client, computed and published once: a worker attaches to the matrix
+        published by another one, or computes it and publishes it unless another worker did meanwhile. The lock
+        file is only held to attach and publish, never while the matrix is computed
+        '''
+        with self.lock:
+            if self.matrix is None:
+                matrix = self.attach_matrix()
+                if matrix is None:
+                    with self.timings.stage('shap') if self.timings is not None else contextlib.nullcontext():
+                        computed = self.compute_matrix()
+                    with exclusive(self.lock_path) if self.lock_path else contextlib.nullcontext():
+                        matrix = self.store.attach(self.matrix_name) if self.store is not None else None
+                        if matrix is None:
+                            matrix = self.store.save(self.matrix_name, computed) if self.store is not None else computed
+                self.matrix = matrix
+                self.cache.clear()
+            if self.summaries is None:
+                summaries = ImportanceSummaries(self.features.columns)
+                for start in range(0, len(self.matrix), self.block_size):
+                    positions = np.arange(start, min(start + self.block_size, len(self.matrix)))
+                    summaries.add(self.matrix[positions], self.segments(positions))
+                with self.summaries_lock:
+                    self.summaries = summaries
+                    self.merged = 0
+        # Clients added while the matrix was computed
+        self.merge_added()
+        return self.matrix
+
+    def attach_matrix(self):
+        '''Attach to the matrix published by another worker, None if there is none'''
+        if self.store is None:
+            return None
+        with exclusive(self.lock_path) if self.lock_path else contextlib.nullcontext():
+            return self.store.attach(self.matrix_name)
+
+    def merge_added(self):
+        '''Include in the summaries the clients added since they were last updated'''
+        with self.summaries_lock:
+            positions = self.added()[self.merged:]
+            if self.summaries is None or len(positions) == 0:
+                return
+            self.summaries.add(np.stack([self.explain(position) for position in positions]), self.segments(positions))
+            self.merged += len(positions)
+
+    def add(self, position, values=None):
+        '''
+        Explain a client added after startup (or keep the shap values given) and include it in the summaries
+        once they are built, returning its shap values. The client must already be among the added positions
+        '''
+        if values is None:
+            values = self.explain(position)
+        else:
+            self.cache.put((position, self.model_version), values)
+        self.merge_added()
+        return values
+
+    def start_backfill(self):
+        '''Compute the matrix in a background thread, requests are served from the cache meanwhile'''
+        if self.matrix is None and self.backfill_thread is None:
+            self.backfill_thread = threading.Thread(target=self.load_matrix, name='shap-backfill', daemon=True)
+            self.backfill_thread.start()
+        return self.backfill_thread
+
+    def importance(self, segment='all', label='all', k=10):
+        '''
+        Get the k features with the largest mean absolute shap value over the clients of a segment,
+        waiting for the matrix if it is not computed yet
+        '''
+        if self.summaries is None:
+            self.load_matrix()
+        else:
+            # Clients added while another version was active
+            self.merge_added()
+        return self.summaries.top(segment, label, k)
+
+    def status(self):
+        return {'modelVersion': self.model_version, 'matrix': self.matrix is not None, 'cached': len(self.cache),
+                'backfilled': self.backfilled if self.matrix is None else len(self.matrix), 'clients': len(self.features) + len(self.added())}
@@ -0,0 +1,81 @@
+import contextlib
+import fcntl
+import json
+import os
+import numpy as np
+
+@contextlib.contextmanager
+def exclusive(lock_path):
+    '''
+    Hold an exclusive lock shared by every process of the node: with several uvicorn workers, the first one
+    builds and publishes the data while the others wait, then attach to what was published
+    '''
+    try:
+        file = open(lock_path, 'w')
+    except OSError:
+        # Read-only data folder: nothing can be published, each process works alone
+        yield
+        return
+    with file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+class FeatureStore:
+    '''
+    Arrays derived from the data (imputed and scaled features, shap values...) published once as .npy files
+    and attached read-only with memory mapping: every worker shares the same pages of the OS page cache,
+    so memory stays roughly flat when workers are added
+    '''
+    def __init__(self, store_dir, signature):
+        self.store_dir = store_dir
+        self.signature = signature
+
+    def manifest(self):
+        try:
+            with open(os.path.join(self.store_dir, 'manifest.json')) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+
+    def attach(self, name):
+        '''Attach to a published array with memory mapping, None if it is missing or was computed from other data'''
+        path = os.path.join(self.store_dir, name + '.npy')
+        if self.signature is not None and self.manifest().get(name) == self.signature and os.path.exists(path):
+            return np.load(path, mmap_mode='r')
+        return None
+
+    def save(self, name, array):
+        '''
+        Publish an array and attach to it, the array itself is returned when the store can not be written
+        '''
+        if self.signature is None:
+            return array
+        try:
+            os.makedirs(self.store_dir, exist_ok=True)
+            # File is written aside then renamed, so a worker attached to the previous version keeps valid pages
+            path_tmp = os.path.join(self.store_dir, name + '.tmp.npy')
+            np.save(path_tmp, array)
+            os.replace(path_tmp, os.path.join(self.store_dir, name + '.npy'))
+
+            manifest = self.manifest()
+            manifest[name] = self.signature
+            manifest_tmp = os.path.join(self.store_dir, 'manifest.json.tmp')
+            with open(manifest_tmp, 'w') as file:
+                json.dump(manifest, file)
+            os.replace(manifest_tmp, os.path.join(self.store_dir, 'manifest.json'))
+        except OSError:
+            return array
+        return self.attach(name)
+
+    def publish(self, name, compute):
+        '''
+        Attach to a published array, computing and publishing it first if it is missing or was computed from
+        other data. Call it inside exclusive() when several processes share the store
+        '''
+        array = self.attach(name)
+        if array is None:
+            array = self.save(name, np.asarray(compute()))
+        return array
@@ -1,580 +1,895 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel
+from typing import Literal, Optional
 import pandas as pd
 import joblib
-from datetime import date, timedelta
-from sklearn.impute import SimpleImputer
-from sklearn.neighbors import NearestNeighbors
 import numpy as np
 import shap
-from sklearn.preprocessing import StandardScaler
-import gzip
-import io
-
-def read(file_path):
-    with gzip.open(file_path, 'rb') as file:
-        content = file.read().decode('utf-8')
-    data = pd.read_csv(io.StringIO(content))
-    data = data.replace([np.inf, -np.inf], np.nan)
-    return data
-
-def impute(data):
-    idx = data[['SK_ID_CURR']]
-    features = data.drop(columns=['SK_ID_CURR'])
-    features_names = data.drop(columns=['SK_ID_CURR']).columns.to_list()
-
-    imp_median = SimpleImputer(missing_values=np.nan, strategy='median')
-
-    imp_median.fit(features)
-
-    features_fill = imp_median.transform(features)
-    features_fill = pd.DataFrame(features_fill, columns=features_names)
-
-    df = pd.concat([idx, features_fill], axis=1)
-
-    return df
-
-def scale(data):
-    idx = data[['SK_ID_CURR']]
-    features = data.drop(columns=['SK_ID_CURR'])
-    features_names = data.drop(columns=['SK_ID_CURR']).columns.to_list()
-
-    scaler = StandardScaler()
-    df_scaled = scaler.fit_transform(features)
-    df_scaled = pd.DataFrame(df_scaled, columns=features_names)
-
-    df = pd.concat([idx, df_scaled], axis=1)
-
-    return df
+import functools
+import asyncio
+import hashlib
+import threading
+import os
+from snapshot import snapshot_signature
+from preprocessing import read, Preprocessor
+from client_index import ClientIndex
+from client_search import ClientSearch
+from client_table import ClientTable
+from cache import LRUCache
+from neighbors import build_index, save_index, load_index, load_graph
+from aggregates import StatisticsStore, STATISTICS
+from dispatch import Dispatcher
+from batching import MicroBatcher
+from feature_store import FeatureStore, exclusive
+from compact import CompactFrame
+from profiles import ProfileStore
+from tree_predictor import CompiledPredictor
+from explanations import ExplanationService, NativeExplainer, score_edges, segment_labels
+from registry import ClientProbabilities, ModelRegistry, ModelVersion
+from timings import StageTimings
+from metrics import Metrics, MetricsMiddleware, instrumented_json_response
+
+# Duration histograms served on /metrics, requests and spans are only timed with METRICS_ENABLED=true
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'false').lower() == 'true'
+metrics = Metrics(METRICS_ENABLED)
 
 # Set FastAPI app
 app = FastAPI(title='Home Credit Default Risk', 
               description='Get information related to the probability of a client not repaying a loan', 
-              version='0.1.0')
+              version='0.1.0',
+              default_response_class=instrumented_json_response(metrics) if METRICS_ENABLED else JSONResponse)
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware, metrics=metrics)
 
 # Set global variables
 N_NEIGHBORS = 1000
 CUSTOM_THRESHOLD = 0.274
+BATCH_MAX_SIZE = 10000
+# Client ids returned per page by /api/clients
+CLIENTS_PAGE_SIZE = 50
+CLIENTS_PAGE_MAX_SIZE = 1000
+COHORT_CACHE_SIZE = 256
+# Clients scored and explained before a new model version is swapped in
+WARM_UP_SIZE = 256
+SHAP_CACHE_SIZE = 4096
+# Compute the shap values of every client in the background after startup, and keep them for the next boot
+SHAP_BACKFILL = os.environ.get('SHAP_BACKFILL', 'true').lower() == 'true'
+# native to get the shap values from LightGBM contributions, explainer to use the pickled shap TreeExplainer
+SHAP_ENGINE = os.environ.get('SHAP_ENGINE', 'native')
+NEIGHBORS_ENGINE = os.environ.get('NEIGHBORS_ENGINE', 'exact')
+# numba or numpy to score with the trees exported to arrays, lightgbm to score through the sklearn wrapper
+PREDICTION_ENGINE = os.environ.get('PREDICTION_ENGINE')
+# Maximum number of concurrent calls per group of endpoints
+DISPATCH_LIMITS = {'neighbors': 2, 'batch': 1, 'shap': 2, 'statistics': 2, 'ingest': 1}
+# Workers kept for the unlimited groups (lookups, batched single client predictions) when every limited group is full
+DISPATCH_RESERVED = int(os.environ.get('DISPATCH_RESERVED', 4))
+DISPATCH_WORKERS = sum(DISPATCH_LIMITS.values()) + DISPATCH_RESERVED
+
+# Concurrent single client predictions received within PREDICTION_BATCH_DELAY ms are scored in one call
+PREDICTION_BATCH_SIZE = int(os.environ.get('PREDICTION_BATCH_SIZE', 64))
+PREDICTION_BATCH_DELAY = float(os.environ.get('PREDICTION_BATCH_DELAY', 2))
+
+# exact keeps the numeric features in float32 only where no value changes, float32 stores them all in float32
+FEATURE_PRECISION = os.environ.get('FEATURE_PRECISION', 'exact')
+# Columns of the current clients read by the statistics endpoints, the others are not kept in memory
+CURRENT_CLIENTS_COLUMNS = ['SK_ID_CURR', 'TARGET', 'CODE_GENDER', 'DAYS_BIRTH', 'AMT_INCOME_TOTAL', 'AMT_CREDIT', 
+                           'AMT_ANNUITY', 'PAYMENT_RATE', 'CREDIT_INCOME_PERCENT']
+
+# Run blocking endpoints off the event loop
+dispatcher = Dispatcher(DISPATCH_WORKERS, DISPATCH_LIMITS)
+
+# With several uvicorn workers, the first one to start builds and publishes the data, the others attach to it
+# Processed data folder and preprocessing artifact, set to serve another dataset (e.g. the synthetic one of the benchmarks)
+DATA_PATH = os.environ.get('DATA_PATH', '../data/processed')
+CLIENTS_TO_PREDICT_PATH = os.path.join(DATA_PATH, 'test_feature_engineering_encoded.csv.gz')
+CURRENT_CLIENTS_PATH = os.path.join(DATA_PATH, 'train_feature_engineering_encoded_extract.csv.gz')
+MODELS_PATH = '../models'
+CLASSIFIER_FILE = 'lightgbm_classifier.pkl'
+EXPLAINER_FILE = 'lightgbm_shap_explainer.pkl'
+PREPROCESSING_PATH = os.environ.get('PREPROCESSING_PATH', '../models/preprocessing')
+STARTUP_LOCK_PATH = os.path.join(os.path.dirname(CLIENTS_TO_PREDICT_PATH), '.startup.lock')
+# Held to attach and publish the shap values, apart from the startup lock so that a backfill never holds up a startup
+SHAP_LOCK_PATH = os.path.join(os.path.dirname(CLIENTS_TO_PREDICT_PATH), '.shap.lock')
+
+# Duration of every startup step, and of the computations run after startup (shap matrix after a model swap or
+# on the first global request)
+startup_timings = StageTimings(observe=lambda stage, duration: metrics.stages.observe(duration, stage))
+task_timings = StageTimings(observe=lambda task, duration: metrics.tasks.observe(duration, task))
 
 # Get dataframes
-clients_to_predict = read('../data/processed/test_feature_engineering_encoded.csv.gz')
-current_clients = read('../data/processed/train_feature_engineering_encoded_extract.csv.gz')
+with exclusive(STARTUP_LOCK_PATH), startup_timings.stage('read'):
+    clients_to_predict = read(CLIENTS_TO_PREDICT_PATH)
+    current_clients = read(CURRENT_CLIENTS_PATH)[CURRENT_CLIENTS_COLUMNS]
+
+# Precompute distributions of current clients
+with startup_timings.stage('statistics'):
+    statistics_store = StatisticsStore(current_clients)
+
+# Index clients by id
+with startup_timings.stage('clientIndex'):
+    client_index = ClientIndex(clients_to_predict['SK_ID_CURR'])
+    client_search = ClientSearch(client_index.ids)
+feature_names = clients_to_predict.columns[1:].to_list()
+
+# Imputation and scaling fitted offline with: python preprocessing.py <CLIENTS_TO_PREDICT_PATH>
+with exclusive(STARTUP_LOCK_PATH), startup_timings.stage('preprocessing'):
+    preprocessor = Preprocessor.load(PREPROCESSING_PATH)
+    if preprocessor is None:
+        preprocessor = Preprocessor.fit(clients_to_predict, source=os.path.basename(CLIENTS_TO_PREDICT_PATH))
+        try:
+            preprocessor.save(PREPROCESSING_PATH)
+        except OSError:
+            pass
+if preprocessor.feature_names != feature_names:
+    raise ValueError(f'Preprocessing {PREPROCESSING_PATH} was fitted on other features')
+
+# Derived arrays shared read-only by every worker
+data_signature = snapshot_signature(CLIENTS_TO_PREDICT_PATH)
+preprocessed_signature = {**data_signature, 'preprocessing': preprocessor.version} if data_signature is not None else None
+feature_store = FeatureStore(os.path.join(os.path.dirname(CLIENTS_TO_PREDICT_PATH), 'feature_store'), preprocessed_signature)
+
+# Features stored with the smallest type per column (uint8 one-hots, float32 numerics), the float64 snapshot is
+# released; imputed and scaled rows are computed from them when needed instead of being stored
+with exclusive(STARTUP_LOCK_PATH), startup_timings.stage('compact'):
+    compact_store = FeatureStore(feature_store.store_dir, 
+                                 {**data_signature, 'precision': FEATURE_PRECISION} if data_signature is not None else None)
+    clients_to_predict = CompactFrame.publish(
+        compact_store, 'clients_to_predict', client_index.ids, feature_names, 
+        functools.partial(CompactFrame.from_frame, clients_to_predict, float32=FEATURE_PRECISION == 'float32'))
+
+# Clients loaded at startup followed by the applicants added with POST /api/clients
+clients = ClientTable(clients_to_predict)
+
+# Personal and bank information of every client, decoded once
+with startup_timings.stage('profiles'):
+    profiles = ProfileStore(clients_to_predict, rows=clients.take)
+
+def load_model_version(classifier_file, explainer_file=None):
+    '''
+    Load a classifier (and its shap explainer with SHAP_ENGINE=explainer) from the models folder, with its
+    scorer and its shap explanations
+    '''
+    classifier_path = os.path.join(MODELS_PATH, classifier_file)
+    lgbm = joblib.load(classifier_path)
+    with open(classifier_path, 'rb') as file:
+        version = hashlib.md5(file.read()).hexdigest()[:12]
+    if list(lgbm.feature_name_) != feature_names:
+        raise ValueError(f'Model {classifier_file} was trained on other features')
+
+    # Model used to score
+    if PREDICTION_ENGINE == 'lightgbm':
+        model = lgbm
+    else:
+        model = CompiledPredictor.from_model(lgbm, engine=PREDICTION_ENGINE)
 
-# Prepare dataframes
-clients_to_predict_fill = impute(clients_to_predict)
+    # Load shap model
+    if SHAP_ENGINE == 'explainer':
+        lgbm_shap = joblib.load(os.path.join(MODELS_PATH, explainer_file or EXPLAINER_FILE))
+    else:
+        lgbm_shap = NativeExplainer(lgbm)
+
+    # Probabilities of the clients, computed once
+    get_probabilities = ClientProbabilities(lambda positions: model.predict_proba(clients.take(positions).iloc[:, 1:]), 
+                                            len(clients_to_predict))
+
+    @functools.lru_cache(maxsize=1)
+    def get_score_edges():
+        '''
+        Edges of the score deciles, fixed by the scores of the clients loaded at startup
+        '''
+        return score_edges(np.round(1000*get_probabilities()[:, 0]))
+
+    def get_segments(positions):
+        '''
+        Segments of some clients (gender, income type, education type, family status, score decile)
+        '''
+        data = clients.take(positions)
+        scores = np.round(1000*model.predict_proba(data.iloc[:, 1:])[:, 0])
+        return segment_labels(data, scores, get_score_edges())
+
+    # Shap values computed on demand, or attached when a previous boot published them
+    model_feature_store = FeatureStore(feature_store.store_dir, 
+                                       {**data_signature, 'model': version} if data_signature is not None else None)
+    explanations = ExplanationService(lgbm_shap, clients_to_predict.features(), version, SHAP_CACHE_SIZE, 
+                                      store=model_feature_store, lock_path=SHAP_LOCK_PATH, segments=get_segments, 
+                                      rows=lambda positions: clients.take(positions).iloc[:, 1:], added=client_index.added, 
+                                      timings=task_timings)
+
+    return ModelVersion(version, lgbm, model, explanations, source=classifier_file, probabilities=get_probabilities)
+
+def warm_up(model_version):
+    '''
+    Score and explain a sample of clients, so that a version swapped in does not pay compilation nor empty caches
+    '''
+    sample = np.linspace(0, len(clients_to_predict) - 1, min(WARM_UP_SIZE, len(clients_to_predict))).astype(int)
+    model_version.model.predict_proba(clients.take(sample).iloc[:, 1:])
+    for position in sample:
+        model_version.explanations.explain(position)
+    if SHAP_BACKFILL:
+        model_version.explanations.start_backfill()
+
+# Versions of the model, a new one is loaded with POST /api/models
+registry = ModelRegistry(load_model_version, warm_up)
+with startup_timings.stage('model'):
+    registry.load_version(CLASSIFIER_FILE)
+
+def get_neighbors_index(kind, compute_data, signature):
+    '''
+    Open the stored neighbor index built from the same data, fit and store a new one otherwise on the rows
+    returned by compute_data()
+    '''
+    index_dir = os.path.join(os.path.dirname(CLIENTS_TO_PREDICT_PATH), f'neighbors_{kind}.index')
+    index = load_index(index_dir, signature) if signature is not None and kind != 'sklearn' else None
+    if index is None:
+        index = build_index(kind, compute_data(), n_neighbors=N_NEIGHBORS+1)
+        if signature is not None and kind != 'sklearn':
+            try:
+                save_index(index, index_dir, signature)
+            except OSError:
+                pass
+    return index
+
+# Neighbors model
+with exclusive(STARTUP_LOCK_PATH), startup_timings.stage('neighborsIndex'):
+    knn = get_neighbors_index(NEIGHBORS_ENGINE, 
+                              lambda: preprocessor.transform(clients_to_predict.values(np.arange(len(clients_to_predict)))), 
+                              preprocessed_signature)
+
+# Precomputed neighbors of every client, built offline with: python neighbors.py <CLIENTS_TO_PREDICT_PATH>
+with startup_timings.stage('neighborsGraph'):
+    knn_graph = load_graph(os.path.join(os.path.dirname(CLIENTS_TO_PREDICT_PATH), 'neighbors_graph'), 
+                           preprocessed_signature)
+
+# Neighbors of the clients already requested, with their predictions
+cohort_cache = LRUCache(COHORT_CACHE_SIZE)
+
+def locate(id):
+    '''
+    Get the row position of a client in the dataframes, 404 if the client id is unknown
+    '''
+    with metrics.span('lookup'):
+        position = client_index.get(id)
+    if position is None:
+        raise HTTPException(status_code=404, detail='Client id not found')
+    return position
 
-# Scale 
-clients_to_predict_scaled = scale(clients_to_predict_fill)
+def predict(features, clients_id, model_version=None):
+    '''
+    Score several clients with a single vectorized call to the model, the active version by default
+    '''
+    model_version = model_version or registry.active
+    with metrics.span('inference'):
+        result_proba = model_version.model.predict_proba(features)
+    return prediction_records(clients_id, result_proba, model_version)
 
-# Load model
-lgbm = joblib.load('../models/lightgbm_classifier.pkl')
+def prediction_records(clients_id, result_proba, model_version):
+    '''
+    Predictions of several clients from the probabilities of the model
+    '''
+    y_prob = result_proba[:, 1]
 
-# Load shap model
-lgbm_shap = joblib.load('../models/lightgbm_shap_explainer.pkl')
-shap_values = lgbm_shap.shap_values(clients_to_predict.drop(columns=['SK_ID_CURR']))
+    result = (y_prob >= CUSTOM_THRESHOLD).astype(int)
 
-# Classification model
-knn = NearestNeighbors(n_neighbors=N_NEIGHBORS+1, algorithm='auto', n_jobs=-1, metric='cosine')
-knn.fit(clients_to_predict_scaled.drop(columns=['SK_ID_CURR']))
+    predictions = []
+    for id, result_idx, result_proba_idx in zip(clients_id, result, result_proba):
+        predictions.append({
+            'clientId': id, 
+            'repay' : 'Yes' if int(result_idx) == 0 else 'No',
+            'score' : round(1000*result_proba_idx[0]),
+            'probability0' : result_proba_idx[0],
+            'probability1' : result_proba_idx[1],
+            'threshold' : CUSTOM_THRESHOLD,
+            'modelVersion': model_version.version
+        })
+    return predictions
 
 @app.get('/')
 async def read_root():
     return 'Home Credit Default Risk API'
 
+@app.get('/metrics')
+async def get_metrics():
+    '''
+    Endpoint to get the duration histograms of the requests, of their spans, of the startup stages and of the tasks run
+    after startup, in Prometheus text format
+    '''
+    return PlainTextResponse(metrics.expose(), media_type='text/plain; version=0.0.4')
+
+@app.get('/api/dispatch/metrics')
+async def get_dispatch_metrics():
+    '''
+    Endpoint to get, per group of endpoints, the running and waiting (queue depth) calls and the time spent waiting and running
+    '''
+    return dispatcher.metrics
+
+@app.get('/api/shap/status')
+async def get_shap_status():
+    '''
+    Endpoint to get the progress of the background computation of the shap values and the number of cached clients
+    '''
+    return registry.active.explanations.status()
+
+class ModelVersionRequest(BaseModel):
+    '''
+    Files of a new model version in the models folder, the explainer is only used with SHAP_ENGINE=explainer
+    '''
+    classifier: str
+    explainer: Optional[str] = None
+
+@app.get('/api/models')
+async def get_models():
+    '''
+    Endpoint to get the active model version, the previous ones kept for rollback and the version being loaded
+    '''
+    return registry.status()
+
+@app.post('/api/models', status_code=202)
+async def load_model(request: ModelVersionRequest):
+    '''
+    Endpoint to load a new model version in the background: it is warmed up on a sample of clients then
+    swapped in, the active version serves requests meanwhile. With several uvicorn workers, only the worker
+    which received the request loads the version, the others keep serving theirs
+    '''
+    for file in [request.classifier, request.explainer]:
+        # Only files of the models folder can be loaded
+        if file is not None and (os.path.basename(file) != file or not os.path.isfile(os.path.join(MODELS_PATH, file))):
+            raise HTTPException(status_code=404, detail=f'Model file not found: {file}')
+    try:
+        registry.load_async(request.classifier, request.explainer)
+    except RuntimeError as error:
+        raise HTTPException(status_code=409, detail=str(error))
+    return registry.status()
+
+@app.post('/api/models/rollback')
+async def rollback_model():
+    '''
+    Endpoint to swap the previous model version back in. With several uvicorn workers, only the worker which
+    received the request rolls back
+    '''
+    try:
+        registry.rollback()
+    except LookupError as error:
+        raise HTTPException(status_code=409, detail=str(error))
+    return registry.status()
+
 @app.get('/api/clients')
-async def get_clients_id():
+@dispatcher.offload('lookup')
+def get_clients_id(prefix: Optional[str] = None, cursor: Optional[int] = None, 
+                   limit: int = Query(CLIENTS_PAGE_SIZE, ge=1, le=CLIENTS_PAGE_MAX_SIZE), 
+                   repay: Optional[Literal['Yes', 'No']] = None, minScore: Optional[int] = None, maxScore: Optional[int] = None):
     '''
-    Endpoint to get all clients id
+    Endpoint to get clients id in increasing order by pages of limit ids: the next page starts after the cursor
+    returned (null on the last page). Ids can be searched by their first digits (prefix) and filtered by
+    predicted repayment and score range
     '''
-    clients_id = clients_to_predict['SK_ID_CURR'].astype(int).tolist()
-    return {'clientsID': clients_id}
+    # Clients searched, the filters are computed for the same clients
+    snapshot = client_search.snapshot()
+    keep = None
+    if repay is not None or minScore is not None or maxScore is not None:
+        with metrics.span('inference'):
+            probabilities = registry.active.probabilities(len(snapshot))
+        scores = np.round(1000*probabilities[:, 0])
+        keep = np.ones(len(scores), dtype=bool)
+        if repay is not None:
+            keep &= (probabilities[:, 1] >= CUSTOM_THRESHOLD) == (repay == 'No')
+        if minScore is not None:
+            keep &= scores >= minScore
+        if maxScore is not None:
+            keep &= scores <= maxScore
+
+    try:
+        clients_id, next_cursor, total = client_search.search(prefix, cursor, limit, keep, snapshot)
+    except ValueError as error:
+        raise HTTPException(status_code=422, detail=str(error))
+    return {'clientsID': clients_id, 'nextCursor': next_cursor, 'total': total}
+
+class NewClientRequest(BaseModel):
+    '''
+    New applicant: its id and its raw encoded feature row (missing features are treated as NaN)
+    '''
+    clientId: int
+    features: dict[str, Optional[float]]
+
+# Adding a client changes the rows, the neighbor index, the id index and the search together
+ingestion_lock = threading.Lock()
+
+def ingest(id, features, scaled):
+    '''
+    Add a client at the same position in the rows, the neighbor index, the id index and the search, or in none
+    of them: the tables added to are truncated back when a step fails. 409 if the client id already exists
+    '''
+    with ingestion_lock:
+        if id in client_index:
+            raise HTTPException(status_code=409, detail='Client id already exists')
+        n_clients = len(clients)
+        try:
+            # Row first, then the neighbor index which may return the client to other requests, then the search, then
+            # the id which makes it visible and adds it to the explanations of every model version
+            position = clients.append(np.concatenate([[id], features]))
+            knn.add(scaled[np.newaxis, :])
+            client_search.add(id, position)
+            client_index.add(id)
+        except Exception:
+            client_search.truncate(n_clients)
+            client_index.truncate(n_clients)
+            knn.truncate(n_clients)
+            clients.truncate(n_clients)
+            raise
+    return position
+
+@app.post('/api/clients', status_code=201)
+@dispatcher.offload('ingest')
+def add_client(request: NewClientRequest):
+    '''
+    Endpoint to add a new applicant without restarting the API: it is imputed and scaled with the persisted
+    preprocessing, scored and explained, then its row is appended to the clients and inserted in the neighbor index.
+    With several uvicorn workers, the applicant is only known by the worker which received it
+    '''
+    if request.clientId in client_index:
+        raise HTTPException(status_code=409, detail='Client id already exists')
+    unknown = set(request.features) - set(feature_names)
+    if unknown:
+        raise HTTPException(status_code=422, detail=f'Unknown features: {sorted(unknown)}')
+
+    # Everything that can fail on the request is computed before the tables are changed
+    features = np.array([request.features.get(name) for name in feature_names], dtype=np.float64)
+    scaled = preprocessor.transform(features)
+    model_version = registry.active
+    df_client = pd.DataFrame(features[np.newaxis, :], columns=feature_names)
+    prediction = predict(df_client, [request.clientId], model_version)[0]
+    with metrics.span('shap'):
+        shap_values_idx = model_version.explanations.compute(df_client)[0]
+
+    position = ingest(request.clientId, features, scaled)
+    model_version.explanations.add(position, shap_values_idx)
+    model_version.probabilities.add(position, [prediction['probability0'], prediction['probability1']])
+
+    top_feature_indices = np.argsort(np.abs(shap_values_idx))[-10:]
+    client_shap = {feature_names[index]: float(shap_values_idx[index]) for index in top_feature_indices}
+
+    return {'clientId': request.clientId, 'prediction': prediction, 'shap': client_shap}
 
 # Endpoints to get information about the current client
 @app.get('/api/clients/{id}/personal_information')
-async def get_client_personal_information(id: int):
+@dispatcher.offload('lookup')
+def get_client_personal_information(id: int):
     '''
     Endpoint to get client's information
     '''
-    PERSONAL_INFORMATION = ['SK_ID_CURR', 'CODE_GENDER', 'CNT_CHILDREN',  'FLAG_OWN_CAR', 'FLAG_OWN_REALTY', 'DAYS_BIRTH']
-    FAMILY_STATUS = clients_to_predict.filter(regex='^NAME_FAMILY_STATUS_').columns.tolist()
-    family_status = [col.replace('NAME_FAMILY_STATUS_', '') for col in FAMILY_STATUS]
-
-    EDUCATION_TYPE = clients_to_predict.filter(regex='^NAME_EDUCATION_TYPE_').columns.tolist()
-    education_type = [col.replace('NAME_EDUCATION_TYPE_', '') for col in EDUCATION_TYPE]
-
-    df_client_info = clients_to_predict[PERSONAL_INFORMATION + FAMILY_STATUS + EDUCATION_TYPE][clients_to_predict['SK_ID_CURR'] == id]
-
-    for col in df_client_info.columns:
-        globals()[col] = df_client_info.iloc[0, df_client_info.columns.get_loc(col)]
-
-    civilStatus = ''
-    for col, status in zip(FAMILY_STATUS, family_status):
-        if globals()[col] == 1: 
-            civilStatus = status
-
-    educationType = ''
-    for col, education in zip(EDUCATION_TYPE, education_type):
-        if globals()[col] == 1:
-            educationType = education
-
-    client_info = {
-            'clientId' : int(SK_ID_CURR),
-            'gender' : 'Man' if int(CODE_GENDER) == 0 else 'Woman',
-            'countChildren' : 'No children' if int(CNT_CHILDREN) == 0 else int(CNT_CHILDREN),
-            'ownCar' : 'No car' if int(FLAG_OWN_CAR) == 0 else 'Yes',
-            'ownRealty' : 'No realty' if int(FLAG_OWN_REALTY) == 0 else 'Yes', 
-            'age': round(float(DAYS_BIRTH)/-365), 
-            'birthday': date.today() - timedelta(days=float(DAYS_BIRTH)/-1),
-            'civilStatus': civilStatus, 
-            'educationType': educationType
-    }
-
-    return client_info
+    return profiles.personal(locate(id))
 
 @app.get('/api/clients/{id}/bank_information')
-async def get_client_bank_information(id: int):
+@dispatcher.offload('lookup')
+def get_client_bank_information(id: int):
     '''
     Endpoint to get client's information
     '''
-    BANK_INFORMATION = ['SK_ID_CURR', 'EXT_SOURCE_3', 'EXT_SOURCE_2', 'EXT_SOURCE_1', 'AMT_INCOME_TOTAL', 'AMT_CREDIT', 
-                    'AMT_ANNUITY','DAYS_EMPLOYED', 'DAYS_REGISTRATION', 'PAYMENT_RATE', 'CREDIT_INCOME_PERCENT']
-    INCOME_TYPE = clients_to_predict.filter(regex='^NAME_INCOME_TYPE_').columns.tolist()
-    income_type = [col.replace('NAME_INCOME_TYPE_', '') for col in INCOME_TYPE]
-
-    df_client_info = clients_to_predict[BANK_INFORMATION + INCOME_TYPE][clients_to_predict['SK_ID_CURR'] == id].fillna(0)
-
-    for col in df_client_info.columns:
-        globals()[col] = df_client_info.iloc[0, df_client_info.columns.get_loc(col)]
-
-    incomeType = ''
-    for col, income in zip(INCOME_TYPE, income_type):
-        if globals()[col] == 1:
-            incomeType = income
-
-    client_info = {
-            'clientId' : int(SK_ID_CURR),
-            'totalIncome': round(float(AMT_INCOME_TOTAL)), 
-            'extSource1': float(EXT_SOURCE_1),
-            'extSource2': float(EXT_SOURCE_2),
-            'extSource3': float(EXT_SOURCE_3), 
-            'seniority': round(float(DAYS_EMPLOYED)/-365), 
-            'registrationSince': date.today() - timedelta(days=float(DAYS_REGISTRATION)/-1), 
-            'amtCredit': round(float(AMT_CREDIT)), 
-            'annualCredit': round(float(AMT_ANNUITY)), 
-            'lengthCredit': round(12*(float(AMT_CREDIT) / float(AMT_ANNUITY))),
-            'paymentRate': round(100*float(PAYMENT_RATE), 2), 
-            'creditIncomeRatio': round(float(CREDIT_INCOME_PERCENT), 2),             
-            'incomeType': incomeType
-    }
-    return client_info
+    return profiles.bank(locate(id))
+
+def predict_batch(requests):
+    '''
+    Score the clients of several prediction requests, given as (client id, position, model version), with one
+    call to the model per version: requests around a swap may have read different versions
+    '''
+    predictions = [None]*len(requests)
+    batches = {}
+    for index, (_, _, model_version) in enumerate(requests):
+        batches.setdefault(model_version, []).append(index)
+    for model_version, indices in batches.items():
+        clients_id = [requests[index][0] for index in indices]
+        df_clients_info = clients.take([requests[index][1] for index in indices]).iloc[:, 1:]
+        for index, prediction in zip(indices, predict(df_clients_info, clients_id, model_version)):
+            predictions[index] = prediction
+    return predictions
+
+prediction_batcher = MicroBatcher(predict_batch, PREDICTION_BATCH_SIZE, PREDICTION_BATCH_DELAY / 1000, 
+                                  run=lambda func, *args: dispatcher.run('lookup', func, *args))
 
 @app.get('/api/clients/{id}/prediction')
 async def get_prediction(id: int):
     '''
     EndPoint to get the probability honor/compliance of a client
     '''
-    df_client_info = clients_to_predict[clients_to_predict['SK_ID_CURR'] == id]
-    df_client_info = df_client_info.drop(df_client_info.columns[[0]], axis=1)
+    client_info = await prediction_batcher.submit((id, locate(id), registry.active))
+    return client_info
 
-    result_proba = lgbm.predict_proba(df_client_info)
-    y_prob = result_proba[:, 1]
+@app.get('/api/predictions/batching/metrics')
+async def get_prediction_batching_metrics():
+    '''
+    Endpoint to get the number of single client predictions scored per model call and the time they waited to be batched
+    '''
+    return prediction_batcher.metrics
 
-    result = (y_prob >= CUSTOM_THRESHOLD).astype(int)
+class BatchPredictionRequest(BaseModel):
+    '''
+    Clients to score, either by id or as raw encoded feature rows (missing features are treated as NaN)
+    '''
+    clientsID: Optional[list[int]] = None
+    features: Optional[list[dict[str, Optional[float]]]] = None
 
-    if (int(result[0]) == 0):
-        result = 'Yes'
+@app.post('/api/predictions/batch')
+@dispatcher.offload('batch')
+def get_batch_predictions(request: BatchPredictionRequest):
+    '''
+    Endpoint to get the probability honor/compliance of many clients in one call
+    '''
+    if (request.clientsID is None) == (request.features is None):
+        raise HTTPException(status_code=422, detail='Provide either clientsID or features')
+
+    rows = request.clientsID if request.clientsID is not None else request.features
+    if len(rows) > BATCH_MAX_SIZE:
+        raise HTTPException(status_code=422, detail=f'Batch size is limited to {BATCH_MAX_SIZE} clients')
+
+    if request.clientsID is not None:
+        positions = client_index.get_many(request.clientsID)
+        if (positions < 0).any():
+            unknown = [id for id, position in zip(request.clientsID, positions) if position < 0]
+            raise HTTPException(status_code=404, detail=f'Client id not found: {unknown}')
+        clients_id = request.clientsID
+        df_clients_info = clients.take(positions).iloc[:, 1:]
     else:
-        result = 'No'    
-
-    client_info = {
-        'clientId': id, 
-        'repay' : result,
-        'score' : round(1000*result_proba[0][0]),
-        'probability0' : result_proba[0][0],
-        'probability1' : result_proba[0][1],
-        'threshold' : CUSTOM_THRESHOLD
-    }
-    return client_info
+        unknown = {name for row in request.features for name in row} - set(feature_names) - {'SK_ID_CURR'}
+        if unknown:
+            raise HTTPException(status_code=422, detail=f'Unknown features: {sorted(unknown)}')
+        clients_id = [row.get('SK_ID_CURR') for row in request.features]
+        clients_id = [int(id) if id is not None else None for id in clients_id]
+        df_clients_info = pd.DataFrame.from_records(request.features, columns=feature_names).astype(float)
+
+    predictions = predict(df_clients_info, clients_id) if len(rows) > 0 else []
+    return {'predictions': predictions}
 
 @app.get('/api/clients/{id}/prediction/shap/local')
-async def get_local_shap(id: int):
+@dispatcher.offload('lookup')
+def get_local_shap(id: int):
     ''' Endpoint to get local shap values
     '''
-    clients_id = clients_to_predict['SK_ID_CURR'].astype(int).tolist()
-
-    if id not in clients_id:
-        raise HTTPException(status_code=404, detail='Client id not found')
-    else:
-        idx = int(list(clients_to_predict[clients_to_predict['SK_ID_CURR'] == id].index.values)[0])
-
-        shap_values_idx = shap_values[0][idx, :]
-        shap_values_abs_sum = np.abs(shap_values_idx)
-        top_feature_indices = np.argsort(shap_values_abs_sum)[-10:]
-        top_feature_names = clients_to_predict.drop(columns=['SK_ID_CURR']).columns[top_feature_indices]
-        top_feature_shap_values = shap_values_idx[top_feature_indices]
+    return top_local_shap(locate(id))
 
+def top_local_shap(idx, model_version=None):
+    '''
+    Get the 10 features with the largest absolute shap value for a client, with the active model version by default
+    '''
+    model_version = model_version or registry.active
+    with metrics.span('shap'):
+        shap_values_idx = model_version.explanations.explain(idx)
+    shap_values_abs_sum = np.abs(shap_values_idx)
+    top_feature_indices = np.argsort(shap_values_abs_sum)[-10:]
+    top_feature_names = pd.Index(feature_names)[top_feature_indices]
+    top_feature_shap_values = shap_values_idx[top_feature_indices]
 
     client_shap = {}
 
     for name, value in zip(top_feature_names, top_feature_shap_values):
-        client_shap[name] = value
+        client_shap[name] = float(value)
 
     return client_shap
 
 @app.get('/api/clients/{id}/prediction/shap/global')
-async def get_global_shap(id: int):
+@dispatcher.offload('shap')
+def get_global_shap(id: int):
     ''' Endpoint to get global shap values
     '''
-    clients_id = clients_to_predict['SK_ID_CURR'].astype(int).tolist()
-
-    if id not in clients_id:
-        raise HTTPException(status_code=404, detail='Client id not found')
-    else:
-        idx = int(list(clients_to_predict[clients_to_predict['SK_ID_CURR'] == id].index.values)[0])
+    locate(id)
+    return top_global_shap()
 
-        feature_names = clients_to_predict.drop(columns=['SK_ID_CURR']).columns
-        shap_values_summary = pd.DataFrame(shap_values[0], columns=feature_names)
-        top_global_features = shap_values_summary.abs().mean().nlargest(10)
+def top_global_shap(model_version=None):
+    '''
+    Get the 10 features with the largest mean absolute shap value over every client, with the active model
+    version by default
+    '''
+    model_version = model_version or registry.active
+    with metrics.span('shap'):
+        top_global_features = model_version.explanations.importance(k=10)
 
     client_shap = {}
 
-    client_shap.update(top_global_features.to_dict())
+    client_shap.update(top_global_features)
 
     return client_shap
 
+@app.get('/api/shap/segments')
+@dispatcher.offload('shap')
+def get_shap_segments():
+    '''
+    Endpoint to get the segments with a shap importance summary (gender, incomeType, educationType, familyStatus,
+    scoreDecile) and their number of clients
+    '''
+    explanations = registry.active.explanations
+    with metrics.span('shap'):
+        explanations.importance()
+    return explanations.summaries.segments()
+
+@app.get('/api/shap/segments/{segment}/{label}')
+@dispatcher.offload('shap')
+def get_segment_shap(segment: str, label: str, k: int = Query(10, ge=1, le=1000)):
+    '''
+    Endpoint to get the k features with the largest mean absolute shap value over the clients of a segment
+    '''
+    try:
+        with metrics.span('shap'):
+            return registry.active.explanations.importance(segment, label, k)
+    except KeyError:
+        raise HTTPException(status_code=404, detail='Segment not found')
+
 # Endpoints to get information about the neighbors / similar clients
+def get_cohort(idx):
+    '''
+    Get the neighbors of a client (in table order) with their prediction, computed once per client and model version
+    '''
+    return get_scored_cohort(idx)[0]
+
+def get_scored_cohort(idx, model_version=None):
+    '''
+    Get the neighbors of a client with their prediction, the probabilities of the client itself (scored in the
+    same model call) and the model version used, the active one by default
+    '''
+    model_version = model_version or registry.active
+    key = (idx, model_version.version)
+    cached = cohort_cache.get(key)
+    if cached is not None:
+        return (*cached, model_version)
+
+    with metrics.span('neighbors'):
+        if knn_graph is not None and idx < len(knn_graph):
+            indices, similarities = knn_graph.neighbors(idx)
+        else:
+            client_idx = preprocessor.transform(clients.take([idx]).iloc[:, 1:].to_numpy())
+            distances, indices = knn.kneighbors(client_idx)
+            indices, similarities = indices[0], 1 - distances[0]
+    indices = indices[1:N_NEIGHBORS+1]
+    similarities = similarities[1:N_NEIGHBORS+1]
+
+    order = np.argsort(indices, kind='stable')
+    positions = indices[order]
+
+    # The client is scored with its neighbors
+    df_neighbors = clients.take(np.concatenate([[idx], positions]))
+    with metrics.span('inference'):
+        result_proba = model_version.model.predict_proba(df_neighbors.iloc[:, 1:])
+    client_proba, result_proba = result_proba[:1], result_proba[1:]
+    df_neighbors = df_neighbors.iloc[1:]
+
+    cohort = pd.DataFrame({
+        'SK_ID_CURR': df_neighbors['SK_ID_CURR'].to_numpy(),
+        'rank': order,
+        'similarity': similarities[order],
+        'repay': np.where(result_proba[:, 1] >= CUSTOM_THRESHOLD, 'No', 'Yes'),
+        'score': np.round(1000*result_proba[:, 0]).astype(int),
+        'AMT_INCOME_TOTAL': df_neighbors['AMT_INCOME_TOTAL'].to_numpy(),
+        'AMT_CREDIT': df_neighbors['AMT_CREDIT'].to_numpy(),
+        'loanLength': 12*(df_neighbors['AMT_CREDIT'].astype(float) / df_neighbors['AMT_ANNUITY'].astype(float)).to_numpy()
+    })
+
+    cohort_cache.put(key, (cohort, client_proba))
+    return cohort, client_proba, model_version
+
+def split_cohort(cohort, column):
+    '''
+    Split a column of the neighbors between clients likely to repay and clients likely to default
+    '''
+    repay = cohort['repay'] == 'Yes'
+    return {'Yes': cohort.loc[repay, column].tolist(), 'No': cohort.loc[~repay, column].tolist()}
+
 @app.get('/api/clients/{id}/prediction/neighbors')
-async def get_neighbors(id: int):
+@dispatcher.offload('neighbors')
+def get_neighbors(id: int):
     ''' Endpoint to get all neighbors of the current client and their similarity score
     '''
-    clients_id = clients_to_predict['SK_ID_CURR'].astype(int).tolist()
-
-    if id not in clients_id:
-        raise HTTPException(status_code=404, detail='Client id not found')
-    else:
-        idx = int(list(clients_to_predict[clients_to_predict['SK_ID_CURR'] == id].index.values)[0])
+    return neighbors_similarities(get_cohort(locate(id)))
 
-        client_idx = clients_to_predict_scaled.drop(columns=['SK_ID_CURR']).iloc[idx].values.reshape(1, -1)
+def neighbors_similarities(cohort):
+    '''
+    Similarity of every neighbor, by decreasing similarity
+    '''
+    cohort = cohort.sort_values('rank')
 
-        distances, indices = knn.kneighbors(client_idx)
-        indices = [int(item) for item in indices[0]]
-        indices = indices[1:]
-        distances = [float(item) for item in distances[0]]
-        distances = distances[1:]
-        scores = [1-item for item in distances]
+    result = dict(zip(cohort['SK_ID_CURR'].tolist(), cohort['similarity'].tolist()))
 
-        neighbors = clients_to_predict_scaled.iloc[indices]['SK_ID_CURR'].tolist()
+    return result
 
-        result = dict(zip(neighbors, scores))
+@app.get('/api/clients/{id}/prediction/neighbors/statistics')
+@dispatcher.offload('neighbors')
+def get_neighbors_statistics(id: int):
+    ''' Endpoint to get the total income, credit amount, score and loan duration of the neighbors of the current client
+    '''
+    return neighbors_statistics(get_cohort(locate(id)))
 
+def neighbors_statistics(cohort):
+    '''
+    Total income, credit amount, score and loan duration of the neighbors, split by predicted repayment
+    '''
+    result = {
+        'totalIncome': split_cohort(cohort, 'AMT_INCOME_TOTAL'),
+        'amtCredit': split_cohort(cohort, 'AMT_CREDIT'),
+        'score': split_cohort(cohort, 'score'),
+        'loanLength': split_cohort(cohort, 'loanLength')
+    }
     return result
 
 @app.get('/api/clients/{id}/prediction/neighbors/totalIncome')
-async def get_neighbors_total_income(id: int):
+@dispatcher.offload('neighbors')
+def get_neighbors_total_income(id: int):
     ''' Endpoint to get the total income of the neighbors of the current client
     '''
-    clients_id = clients_to_predict['SK_ID_CURR'].astype(int).tolist()
-
-    if id not in clients_id:
-        raise HTTPException(status_code=404, detail='Client id not found')
-    else:
-        idx = int(list(clients_to_predict[clients_to_predict['SK_ID_CURR'] == id].index.values)[0])
-
-        client_idx = clients_to_predict_scaled.drop(columns=['SK_ID_CURR']).iloc[idx].values.reshape(1, -1)
-
-        distances, indices = knn.kneighbors(client_idx)
-        indices = [int(item) for item in indices[0]]
-        indices = indices[1:]
-        neighbors = clients_to_predict_scaled.iloc[indices]['SK_ID_CURR'].astype(int).tolist()
-        client_info = []
-
-        for neighbor in neighbors:
-            globals()['df_' + str(neighbor)] = clients_to_predict[clients_to_predict['SK_ID_CURR'] == neighbor]
-            globals()['df_' + str(neighbor)] = globals()['df_' + str(neighbor)].drop(globals()['df_' + str(neighbor)].columns[[0]], axis=1)
-
-            result_proba = lgbm.predict_proba(globals()['df_' + str(neighbor)])
-            y_prob = result_proba[:, 1]
-
-            result = (y_prob >= CUSTOM_THRESHOLD).astype(int)
-
-            if (int(result[0]) == 0):
-                result = 'Yes'
-            else:
-                result = 'No'    
-
-            client_info.append({'clientId': neighbor, 
-                                'repay' : result,
-                                'score' : round(1000*result_proba[0][0]),
-                                'probability0' : result_proba[0][0],
-                                'probability1' : result_proba[0][1],
-                                'threshold' : CUSTOM_THRESHOLD})
-
-        repayment_status = {client['clientId']: client['repay'] for client in client_info}
-        filtered_df = clients_to_predict[clients_to_predict['SK_ID_CURR'].isin(neighbors)]
-        filtered_df['repay'] = filtered_df['SK_ID_CURR'].map(repayment_status)
-
-        income_yes = filtered_df[filtered_df['repay'] == 'Yes']['AMT_INCOME_TOTAL'].tolist()
-        income_no = filtered_df[filtered_df['repay'] == 'No']['AMT_INCOME_TOTAL'].tolist()
+    result = split_cohort(get_cohort(locate(id)), 'AMT_INCOME_TOTAL')
+    return result
 
-        result = {'Yes': income_yes, 'No': income_no}
-        return result
-    
 @app.get('/api/clients/{id}/prediction/neighbors/score')
-async def get_neighbors_score(id: int):
+@dispatcher.offload('neighbors')
+def get_neighbors_score(id: int):
     ''' Endpoint to get the score of the neighbors of the current client
     '''
-    clients_id = clients_to_predict['SK_ID_CURR'].astype(int).tolist()
-
-    if id not in clients_id:
-        raise HTTPException(status_code=404, detail='Client id not found')
-    else:
-        idx = int(list(clients_to_predict[clients_to_predict['SK_ID_CURR'] == id].index.values)[0])
-
-        client_idx = clients_to_predict_scaled.drop(columns=['SK_ID_CURR']).iloc[idx].values.reshape(1, -1)
-
-        distances, indices = knn.kneighbors(client_idx)
-        indices = [int(item) for item in indices[0]]
-        indices = indices[1:]
-        neighbors = clients_to_predict_scaled.iloc[indices]['SK_ID_CURR'].astype(int).tolist()
-        client_info = []
-
-        for neighbor in neighbors:
-            globals()['df_' + str(neighbor)] = clients_to_predict[clients_to_predict['SK_ID_CURR'] == neighbor]
-            globals()['df_' + str(neighbor)] = globals()['df_' + str(neighbor)].drop(globals()['df_' + str(neighbor)].columns[[0]], axis=1)
-
-            result_proba = lgbm.predict_proba(globals()['df_' + str(neighbor)])
-            y_prob = result_proba[:, 1]
-
-            result = (y_prob >= CUSTOM_THRESHOLD).astype(int)
-
-            if (int(result[0]) == 0):
-                result = 'Yes'
-            else:
-                result = 'No'    
-
-            client_info.append({'clientId': neighbor, 
-                                'repay' : result,
-                                'score' : round(1000*result_proba[0][0]),
-                                'probability0' : result_proba[0][0],
-                                'probability1' : result_proba[0][1],
-                                'threshold' : CUSTOM_THRESHOLD})
-            
-        repayment_status = {client['clientId']: client['repay'] for client in client_info}
-        scores = {client['clientId']: client['score'] for client in client_info}
-
-        filtered_df = clients_to_predict[clients_to_predict['SK_ID_CURR'].isin(neighbors)]
-        filtered_df['repay'] = filtered_df['SK_ID_CURR'].map(repayment_status)
-        filtered_df['score'] = filtered_df['SK_ID_CURR'].map(scores)
-
-        score_yes = filtered_df[filtered_df['repay'] == 'Yes']['score'].tolist()
-        score_no = filtered_df[filtered_df['repay'] == 'No']['score'].tolist()
-
-        result = {'Yes': score_yes, 'No': score_no}
-        return result
+    result = split_cohort(get_cohort(locate(id)), 'score')
+    return result
 
 @app.get('/api/clients/{id}/prediction/neighbors/amtCredit')
-async def get_neighbors_credit_amount(id: int):
+@dispatcher.offload('neighbors')
+def get_neighbors_credit_amount(id: int):
     ''' Endpoint to get the credit amount of the neighbors of the current client
     '''
-    clients_id = clients_to_predict['SK_ID_CURR'].astype(int).tolist()
-
-    if id not in clients_id:
-        raise HTTPException(status_code=404, detail='Client id not found')
-    else:
-        idx = int(list(clients_to_predict[clients_to_predict['SK_ID_CURR'] == id].index.values)[0])
-
-        client_idx = clients_to_predict_scaled.drop(columns=['SK_ID_CURR']).iloc[idx].values.reshape(1, -1)
-
-        distances, indices = knn.kneighbors(client_idx)
-        indices = [int(item) for item in indices[0]]
-        indices = indices[1:]
-        neighbors = clients_to_predict_scaled.iloc[indices]['SK_ID_CURR'].astype(int).tolist()
-        client_info = []
-
-        for neighbor in neighbors:
-            globals()['df_' + str(neighbor)] = clients_to_predict[clients_to_predict['SK_ID_CURR'] == neighbor]
-            globals()['df_' + str(neighbor)] = globals()['df_' + str(neighbor)].drop(globals()['df_' + str(neighbor)].columns[[0]], axis=1)
-
-            result_proba = lgbm.predict_proba(globals()['df_' + str(neighbor)])
-            y_prob = result_proba[:, 1]
-
-            result = (y_prob >= CUSTOM_THRESHOLD).astype(int)
-
-            if (int(result[0]) == 0):
-                result = 'Yes'
-            else:
-                result = 'No'    
-
-            client_info.append({'clientId': neighbor, 
-                                'repay' : result,
-                                'score' : round(1000*result_proba[0][0]),
-                                'probability0' : result_proba[0][0],
-                                'probability1' : result_proba[0][1],
-                                'threshold' : CUSTOM_THRESHOLD})
-
-        repayment_status = {client['clientId']: client['repay'] for client in client_info}
-        filtered_df = clients_to_predict[clients_to_predict['SK_ID_CURR'].isin(neighbors)]
-        filtered_df['repay'] = filtered_df['SK_ID_CURR'].map(repayment_status)
-
-        income_yes = filtered_df[filtered_df['repay'] == 'Yes']['AMT_CREDIT'].tolist()
-        income_no = filtered_df[filtered_df['repay'] == 'No']['AMT_CREDIT'].tolist()
+    result = split_cohort(get_cohort(locate(id)), 'AMT_CREDIT')
+    return result
 
-        result = {'Yes': income_yes, 'No': income_no}
-        return result
-    
 @app.get('/api/clients/{id}/prediction/neighbors/loanLength')
-async def get_neighbors_credit_amount(id: int):
+@dispatcher.offload('neighbors')
+def get_neighbors_loan_length(id: int):
     ''' Endpoint to get the duration of the loan of the neighbors of the current client
     '''
-    clients_id = clients_to_predict['SK_ID_CURR'].astype(int).tolist()
-
-    if id not in clients_id:
-        raise HTTPException(status_code=404, detail='Client id not found')
-    else:
-        idx = int(list(clients_to_predict[clients_to_predict['SK_ID_CURR'] == id].index.values)[0])
-
-        client_idx = clients_to_predict_scaled.drop(columns=['SK_ID_CURR']).iloc[idx].values.reshape(1, -1)
-
-        distances, indices = knn.kneighbors(client_idx)
-        indices = [int(item) for item in indices[0]]
-        indices = indices[1:]
-        neighbors = clients_to_predict_scaled.iloc[indices]['SK_ID_CURR'].astype(int).tolist()
-        client_info = []
-
-        for neighbor in neighbors:
-            globals()['df_' + str(neighbor)] = clients_to_predict[clients_to_predict['SK_ID_CURR'] == neighbor]
-            globals()['df_' + str(neighbor)] = globals()['df_' + str(neighbor)].drop(globals()['df_' + str(neighbor)].columns[[0]], axis=1)
-
-            result_proba = lgbm.predict_proba(globals()['df_' + str(neighbor)])
-            y_prob = result_proba[:, 1]
-
-            result = (y_prob >= CUSTOM_THRESHOLD).astype(int)
-
-            if (int(result[0]) == 0):
-                result = 'Yes'
-            else:
-                result = 'No'    
+    result = split_cohort(get_cohort(locate(id)), 'loanLength')
+    return result
 
-            client_info.append({'clientId': neighbor, 
-                                'repay' : result,
-                                'score' : round(1000*result_proba[0][0]),
-                                'probability0' : result_proba[0][0],
-                                'probability1' : result_proba[0][1],
-                                'threshold' : CUSTOM_THRESHOLD})
+# Sections of the client profile, in response order
+PROFILE_SECTIONS = ['personalInformation', 'bankInformation', 'prediction', 'neighbors', 'neighborsStatistics', 
+                    'localShap', 'globalShap']
+# Sections returned by default: global shap values wait for the shap values of every client when they are not computed yet
+PROFILE_DEFAULT_SECTIONS = [section for section in PROFILE_SECTIONS if section != 'globalShap']
 
-        repayment_status = {client['clientId']: client['repay'] for client in client_info}
-        filtered_df = clients_to_predict[clients_to_predict['SK_ID_CURR'].isin(neighbors)]
-        filtered_df['repay'] = filtered_df['SK_ID_CURR'].map(repayment_status)
+def cohort_sections(id, idx, sections, model_version):
+    '''
+    Sections of the profile computed from the neighbor cohort, the prediction of the client coming from the
+    model call which scores its neighbors
+    '''
+    cohort, client_proba, model_version = get_scored_cohort(idx, model_version)
+    result = {}
+    if 'prediction' in sections:
+        result['prediction'] = prediction_records([id], client_proba, model_version)[0]
+    if 'neighbors' in sections:
+        result['neighbors'] = neighbors_similarities(cohort)
+    if 'neighborsStatistics' in sections:
+        result['neighborsStatistics'] = neighbors_statistics(cohort)
+    return result
 
-        filtered_df['loanLength'] = 12*(filtered_df['AMT_CREDIT'].astype(float) / filtered_df['AMT_ANNUITY'].astype(float))
+@app.get('/api/clients/{id}/profile')
+async def get_client_profile(id: int, sections: Optional[str] = None):
+    '''
+    Endpoint to get in one call the sections of a client profile (comma separated, all but globalShap by default):
+    personal and bank information, prediction, neighbors and their statistics, local and global shap values. The
+    client is located once, every section uses the same model version, its prediction and neighbors share one
+    cohort, and the sections are computed concurrently
+    '''
+    requested = PROFILE_DEFAULT_SECTIONS if sections is None else [section.strip() for section in sections.split(',')]
+    unknown = set(requested) - set(PROFILE_SECTIONS)
+    if unknown:
+        raise HTTPException(status_code=422, detail=f'Unknown sections: {sorted(unknown)}, expected some of {PROFILE_SECTIONS}')
+    idx = locate(id)
+    model_version = registry.active
+
+    calls = []
+    if 'personalInformation' in requested:
+        calls.append(('personalInformation', dispatcher.run('lookup', profiles.personal, idx)))
+    if 'bankInformation' in requested:
+        calls.append(('bankInformation', dispatcher.run('lookup', profiles.bank, idx)))
+    if 'neighbors' in requested or 'neighborsStatistics' in requested:
+        calls.append((None, dispatcher.run('neighbors', cohort_sections, id, idx, requested, model_version)))
+    elif 'prediction' in requested:
+        calls.append(('prediction', prediction_batcher.submit((id, idx, model_version))))
+    if 'localShap' in requested:
+        calls.append(('localShap', dispatcher.run('lookup', top_local_shap, idx, model_version)))
+    if 'globalShap' in requested:
+        calls.append(('globalShap', dispatcher.run('shap', top_global_shap, model_version)))
+
+    results = {}
+    for (section, _), result in zip(calls, await asyncio.gather(*[call for _, call in calls])):
+        results.update(result if section is None else {section: result})
+    return {'clientId': id, **{section: results[section] for section in PROFILE_SECTIONS if section in results}}
 
-        income_yes = filtered_df[filtered_df['repay'] == 'Yes']['loanLength'].tolist()
-        income_no = filtered_df[filtered_df['repay'] == 'No']['loanLength'].tolist()
+# Endpoints to get information about clients already present in the database
+def per_client(columns, transform=None, float_ids=True):
+    '''
+    Build the legacy payload {client id: [values..., repayment status]} without iterating over rows
+    '''
+    df = current_clients[['SK_ID_CURR'] + columns + ['TARGET']].fillna(0)
+    ids = df['SK_ID_CURR'].astype(float) if float_ids else df['SK_ID_CURR']
+    values = [transform(df[col]) if transform else df[col] for col in columns]
+    status = np.where(df['TARGET'] == 0, 'repaid', 'defaulted')
 
-        result = {'Yes': income_yes, 'No': income_no}
-        return result
+    return dict(zip(ids.tolist(), map(list, zip(*[value.tolist() for value in values], status.tolist()))))
 
-# Endpoints to get information about clients already present in the database
 @app.get('/api/statistics/loans')
 async def get_stats_loan():
 
-    count_0 = current_clients[current_clients['TARGET'] == 0]['SK_ID_CURR'].count()
-    count_1 = current_clients[current_clients['TARGET'] == 1]['SK_ID_CURR'].count()
-
-    loans = {
-        'repaid': int(count_0), 
-        'defaulted': int(count_1)
-    }
+    loans = statistics_store.loans
 
     return loans
 
-@app.get('/api/statistics/genders')
-async def get_stats_gender():
+@app.get('/api/statistics/genders/counts')
+async def get_stats_gender_counts():
+    ''' Endpoint to get the number of clients per gender and repayment status
+    '''
+    return statistics_store.genders
+
+@app.get('/api/statistics/distributions/{statistic}')
+@dispatcher.offload('lookup')
+def get_statistics_distribution(statistic: str, bins: int = Query(20, ge=1, le=200), log: bool = False):
+    ''' Endpoint to get count, mean, median, min, max and histogram of a statistic per repayment status, 
+    with bins evenly spaced in log10 if log is true
+    '''
+    if statistic not in STATISTICS:
+        raise HTTPException(status_code=404, detail='Statistic not found')
 
-    df_gender = current_clients[['SK_ID_CURR', 'CODE_GENDER', 'TARGET']].fillna(0)
-    df_gender['CODE_GENDER'] = df_gender['CODE_GENDER'].replace({0: 'M', 1: 'F'})
+    return statistics_store.distribution(statistic, bins, log)
 
-    result = {}
-    for index, row in df_gender.iterrows():
-        result[row['SK_ID_CURR']] = [row['CODE_GENDER'], 'repaid' if row['TARGET'] == 0 else 'defaulted']
+@app.get('/api/statistics/genders', deprecated=True)
+@dispatcher.offload('statistics')
+def get_stats_gender():
 
-    return result
+    result = per_client(['CODE_GENDER'], lambda col: col.replace({0: 'M', 1: 'F'}), float_ids=False)
 
-@app.get('/api/statistics/ages')
-async def get_stats_ages():
+    return result
 
-    df_ages = current_clients[['SK_ID_CURR', 'DAYS_BIRTH', 'TARGET']].fillna(0)
-    df_ages['age'] = round(df_ages['DAYS_BIRTH']/-365)
-    df_ages.drop(columns=['DAYS_BIRTH'])
+@app.get('/api/statistics/ages', deprecated=True)
+@dispatcher.offload('statistics')
+def get_stats_ages():
 
-    result = {}
-    for index, row in df_ages.iterrows():
-        result[row['SK_ID_CURR']] = [row['age'], 'repaid' if row['TARGET'] == 0 else 'defaulted']
+    result = per_client(['DAYS_BIRTH'], lambda col: round(col/-365))
 
     return result
 
-@app.get('/api/statistics/total_incomes')
-async def get_statistics_total_income():
-
-    df_income = current_clients[['SK_ID_CURR', 'AMT_INCOME_TOTAL', 'TARGET']].fillna(0)
+@app.get('/api/statistics/total_incomes', deprecated=True)
+@dispatcher.offload('statistics')
+def get_statistics_total_income():
 
-    result = {}
-    for index, row in df_income.iterrows():
-        result[row['SK_ID_CURR']] = [row['AMT_INCOME_TOTAL'], 'repaid' if row['TARGET'] == 0 else 'defaulted']
+    result = per_client(['AMT_INCOME_TOTAL'])
 
     return result
 
-@app.get('/api/statistics/credits')
-async def get_statistics_credit():
-
-    df_credit = current_clients[['SK_ID_CURR', 'AMT_CREDIT', 'TARGET']].fillna(0)
+@app.get('/api/statistics/credits', deprecated=True)
+@dispatcher.offload('statistics')
+def get_statistics_credit():
 
-    result = {}
-    for index, row in df_credit.iterrows():
-        result[row['SK_ID_CURR']] = [row['AMT_CREDIT'], 'repaid' if row['TARGET'] == 0 else 'defaulted']
+    result = per_client(['AMT_CREDIT'])
 
     return result
 
-@app.get('/api/statistics/annuity')
-async def get_statistics_annuity():
+@app.get('/api/statistics/annuity', deprecated=True)
+@dispatcher.offload('statistics')
+def get_statistics_annuity():
 
-    df_credit = current_clients[['SK_ID_CURR', 'AMT_ANNUITY', 'TARGET']].fillna(0)
-
-    result = {}
-    for index, row in df_credit.iterrows():
-        result[row['SK_ID_CURR']] = [row['AMT_ANNUITY'], 'repaid' if row['TARGET'] == 0 else 'defaulted']
+    result = per_client(['AMT_ANNUITY'])
 
     return result
 
-@app.get('/api/statistics/length_loan')
-async def get_statistics_length_loan():
-
-    df_credit = current_clients[['SK_ID_CURR', 'AMT_CREDIT', 'AMT_ANNUITY', 'TARGET']].fillna(0)
-    #df_credit['length'] = round(12*(df_credit['AMT_CREDIT'] / df_credit['AMT_ANNUITY']))
+@app.get('/api/statistics/length_loan', deprecated=True)
+@dispatcher.offload('statistics')
+def get_statistics_length_loan():
 
-    result = {}
-    for index, row in df_credit.iterrows():
-        result[row['SK_ID_CURR']] = [row['AMT_CREDIT'], row['AMT_ANNUITY'], 'repaid' if row['TARGET'] == 0 else 'defaulted']
+    result = per_client(['AMT_CREDIT', 'AMT_ANNUITY'])
 
     return result
 
-@app.get('/api/statistics/payment_rate')
-async def get_statistics_payment_rate():
-
-    df_credit = current_clients[['SK_ID_CURR', 'PAYMENT_RATE', 'TARGET']].fillna(0)
+@app.get('/api/statistics/payment_rate', deprecated=True)
+@dispatcher.offload('statistics')
+def get_statistics_payment_rate():
 
-    result = {}
-    for index, row in df_credit.iterrows():
-        result[row['SK_ID_CURR']] = [round(100*row['PAYMENT_RATE'], 2), 'repaid' if row['TARGET'] == 0 else 'defaulted']
+    result = per_client(['PAYMENT_RATE'], lambda col: round(100*col, 2))
 
     return result
 
-@app.get('/api/statistics/credit_income_percent')
-async def get_statistics_credit_income_percent():
+@app.get('/api/statistics/credit_income_percent', deprecated=True)
+@dispatcher.offload('statistics')
+def get_statistics_credit_income_percent():
 
-    df_credit = current_clients[['SK_ID_CURR', 'CREDIT_INCOME_PERCENT', 'TARGET']].fillna(0)
+    result = per_client(['CREDIT_INCOME_PERCENT'], lambda col: round(col, 2))
 
-    result = {}
-    for index, row in df_credit.iterrows():
-        result[row['SK_ID_CURR']] = [round(row['CREDIT_INCOME_PERCENT'], 2), 'repaid' if row['TARGET'] == 0 else 'defaulted']
-
-    return result
\ No newline at end of file
+    return result
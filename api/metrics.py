@@ -0,0 +1,135 @@
+import bisect
+import threading
+import time
+from fastapi.responses import JSONResponse
+
+# Upper bounds in seconds of the histogram buckets, from sub-millisecond lookups to slow startup stages
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Histogram:
+    '''
+    Prometheus histogram: number of observations per bucket, their sum and count, for every set of label values.
+    Observations come from the dispatcher threads, they are counted under a lock
+    '''
+    def __init__(self, name, documentation, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        position = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                # Counts per bucket (the last one is +Inf), sum, count
+                series = self.series[label_values] = [[0]*(len(self.buckets) + 1), 0.0, 0]
+            series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    def expose(self):
+        '''Lines of the Prometheus text format, with cumulative bucket counts'''
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            series = sorted((label_values, [list(counts), total, count])
+                            for label_values, (counts, total, count) in self.series.items())
+        for label_values, (counts, total, count) in series:
+            labels = ''.join(f'{name}="{value}",' for name, value in zip(self.labels, label_values))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+            labels = '{' + labels.rstrip(',') + '}' if labels else ''
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+class Span:
+    '''Time a named step of a request and observe it in the span histogram'''
+    __slots__ = ('histogram', 'name', 'start')
+
+    def __init__(self, histogram, name):
+        self.histogram = histogram
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, self.name)
+        return False
+
+class NoSpan:
+    '''Span doing nothing, shared by every call when the metrics are disabled'''
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NO_SPAN = NoSpan()
+
+class Metrics:
+    '''
+    Duration histograms of the API in Prometheus format: requests per route, named spans inside the requests
+    (lookup, inference, shap, neighbors, serialization), startup stages and computations run later in the
+    background or on a first request (tasks, e.g. the shap matrix), kept apart from the startup stages. When
+    disabled, spans and the request middleware cost nothing more than a function call; startup stages and tasks
+    are always recorded
+    '''
+    def __init__(self, enabled=True, prefix='credit_api'):
+        self.enabled = enabled
+        self.requests = Histogram(f'{prefix}_request_duration_seconds', 'Duration of the HTTP requests per route',
+                                  ['method', 'route', 'status'])
+        self.spans = Histogram(f'{prefix}_span_duration_seconds', 'Duration of the named steps of the requests', ['span'])
+        self.stages = Histogram(f'{prefix}_startup_stage_duration_seconds', 'Duration of the startup stages', ['stage'])
+        self.tasks = Histogram(f'{prefix}_task_duration_seconds', 'Duration of the computations run after startup', ['task'])
+
+    def span(self, name):
+        '''Context manager timing a step of a request'''
+        return Span(self.spans, name) if self.enabled else NO_SPAN
+
+    def expose(self):
+        '''Every histogram in the Prometheus text format'''
+        return '\n'.join(self.requests.expose() + self.spans.expose() + self.stages.expose() + self.tasks.expose()) + '\n'
+
+class MetricsMiddleware:
+    '''
+    ASGI middleware observing the duration of every request, labelled by route template (not by path, so that
+    client ids do not create a series each) and status code
+    '''
+    def __init__(self, app, metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        status = [500]
+        async def send_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            route = scope.get('route')
+            self.metrics.requests.observe(time.perf_counter() - start, scope['method'],
+                                          route.path if route is not None else 'unmatched', str(status[0]))
+
+def instrumented_json_response(metrics):
+    '''JSON response class timing the serialization of the content in the serialization span'''
+    class InstrumentedJSONResponse(JSONResponse):
+        def render(self, content):
+            with metrics.span('serialization'):
+                return super().render(content)
+    return InstrumentedJSONResponse
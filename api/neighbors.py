@@ -0,0 +1,339 @@
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from sklearn.cluster import KMeans
+from sklearn.neighbors import NearestNeighbors
+from row_buffer import RowBuffer
+
+INDEX_VERSION = 1
+
+def normalize(data):
+    '''
+    Scale rows to unit norm as float32, so that cosine similarity is a dot product (zero rows stay zero, like sklearn)
+    '''
+    data = np.asarray(data, dtype=np.float32)
+    norms = np.linalg.norm(data, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return data / norms
+
+def top_k(similarities, k):
+    '''
+    Get the positions of the k largest similarities of each row, sorted by decreasing similarity
+    '''
+    k = min(k, similarities.shape[1])
+    if k < similarities.shape[1]:
+        candidates = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(k), (similarities.shape[0], k))
+    candidates_similarities = np.take_along_axis(similarities, candidates, axis=1)
+    order = np.argsort(-candidates_similarities, axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidates_similarities, order, axis=1)
+
+class ExactIndex:
+    '''
+    Exact cosine neighbors over a pre-normalized float32 matrix, searched by blocks of rows
+    '''
+    kind = 'exact'
+
+    def __init__(self, n_neighbors=5, block_size=16384):
+        self.n_neighbors = n_neighbors
+        self.block_size = block_size
+        self.vectors = None
+        self.added = None
+
+    def fit(self, data):
+        self.vectors = normalize(data)
+        return self
+
+    def add(self, data):
+        '''Insert rows after the fitted ones, without copying the fitted vectors'''
+        if self.added is None:
+            self.added = RowBuffer(self.vectors.shape[1], dtype=np.float32)
+        return len(self.vectors) + self.added.append(normalize(data))
+
+    def truncate(self, n_rows):
+        '''Drop the rows inserted after the first n_rows ones'''
+        if self.added is not None:
+            self.added.truncate(n_rows - len(self.vectors))
+
+    def blocks(self):
+        '''Blocks of vectors with the position of their first row: fitted vectors, then the added ones'''
+        for start in range(0, len(self.vectors), self.block_size):
+            yield start, self.vectors[start:start + self.block_size]
+        if self.added is not None and len(self.added) > 0:
+            yield len(self.vectors), self.added.values()
+
+    def kneighbors(self, data, n_neighbors=None):
+        '''
+        Get cosine distances and positions of the nearest neighbors, same output as NearestNeighbors.kneighbors
+        '''
+        n_vectors = len(self.vectors) + (len(self.added) if self.added is not None else 0)
+        n_neighbors = min(n_neighbors or self.n_neighbors, n_vectors)
+        queries = normalize(data)
+
+        best_indices = np.empty((len(queries), 0), dtype=np.int64)
+        best_similarities = np.empty((len(queries), 0), dtype=np.float32)
+        for start, vectors in self.blocks():
+            similarities = queries @ vectors.T
+            indices, similarities = top_k(similarities, n_neighbors)
+            indices = np.concatenate([best_indices, indices + start], axis=1)
+            similarities = np.concatenate([best_similarities, similarities], axis=1)
+            selected, best_similarities = top_k(similarities, n_neighbors)
+            best_indices = np.take_along_axis(indices, selected, axis=1)
+
+        return 1 - best_similarities.astype(np.float64), best_indices
+
+    def arrays(self):
+        return {'vectors': self.vectors}
+
+    def params(self):
+        return {'n_neighbors': self.n_neighbors, 'block_size': self.block_size}
+
+    def load_arrays(self, arrays):
+        self.vectors = arrays['vectors']
+
+class IVFIndex:
+    '''
+    Approximate cosine neighbors: vectors are grouped in n_lists k-means cells (inverted file) and a query
+    only scans the n_probe cells closest to it. Increasing n_probe trades latency for recall
+    '''
+    kind = 'ivf'
+
+    def __init__(self, n_neighbors=5, n_lists=None, n_probe=16, train_size=50000, random_state=42):
+        self.n_neighbors = n_neighbors
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.train_size = train_size
+        self.random_state = random_state
+        self.centroids = None
+        self.vectors = None
+        self.ids = None
+        self.offsets = None
+        self.added = None
+
+    def fit(self, data):
+        vectors = normalize(data)
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(vectors))))
+        n_lists = min(n_lists, len(vectors))
+
+        rng = np.random.default_rng(self.random_state)
+        train = vectors[rng.choice(len(vectors), min(self.train_size, len(vectors)), replace=False)]
+        kmeans = KMeans(n_clusters=n_lists, n_init=1, random_state=self.random_state).fit(train)
+        self.centroids = normalize(kmeans.cluster_centers_)
+
+        assignments = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), 16384):
+            assignments[start:start + 16384] = np.argmax(vectors[start:start + 16384] @ self.centroids.T, axis=1)
+
+        # Store vectors grouped by cell, so that scanning a cell reads contiguous memory
+        self.ids = np.argsort(assignments, kind='stable')
+        self.vectors = vectors[self.ids]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=n_lists))])
+        self.n_lists = n_lists
+        return self
+
+    def add(self, data):
+        '''
+        Insert rows after the fitted ones: they are kept apart from the cells and scanned by every query,
+        until the index is fitted again
+        '''
+        if self.added is None:
+            self.added = RowBuffer(self.vectors.shape[1], dtype=np.float32)
+        return len(self.vectors) + self.added.append(normalize(data))
+
+    def truncate(self, n_rows):
+        '''Drop the rows inserted after the first n_rows ones'''
+        if self.added is not None:
+            self.added.truncate(n_rows - len(self.vectors))
+
+    def kneighbors(self, data, n_neighbors=None, n_probe=None):
+        '''
+        Get approximate cosine distances and positions of the nearest neighbors, same output as NearestNeighbors.kneighbors
+        '''
+        added = self.added.values() if self.added is not None else np.empty((0, self.vectors.shape[1]), dtype=np.float32)
+        n_neighbors = min(n_neighbors or self.n_neighbors, len(self.vectors) + len(added))
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        queries = normalize(data)
+
+        distances = np.empty((len(queries), n_neighbors))
+        indices = np.empty((len(queries), n_neighbors), dtype=np.int64)
+        for row, query in enumerate(queries):
+            cells = np.argsort(-(self.centroids @ query), kind='stable')
+            # Probe more cells than asked when the closest ones hold less than n_neighbors vectors
+            sizes = np.cumsum(self.offsets[cells + 1] - self.offsets[cells])
+            n_cells = max(n_probe, int(np.searchsorted(sizes, n_neighbors)) + 1)
+            candidates = np.concatenate([np.arange(self.offsets[cell], self.offsets[cell + 1]) for cell in cells[:n_cells]])
+
+            candidates_similarities = np.concatenate([self.vectors[candidates] @ query, added @ query])
+            candidates_ids = np.concatenate([self.ids[candidates], len(self.vectors) + np.arange(len(added))])
+
+            selected, similarities = top_k(candidates_similarities[np.newaxis, :], n_neighbors)
+            distances[row] = 1 - similarities[0]
+            indices[row] = candidates_ids[selected[0]]
+
+        return distances, indices
+
+    def arrays(self):
+        return {'centroids': self.centroids, 'vectors': self.vectors, 'ids': self.ids, 'offsets': self.offsets}
+
+    def params(self):
+        return {'n_neighbors': self.n_neighbors, 'n_lists': self.n_lists, 'n_probe': self.n_probe,
+                'train_size': self.train_size, 'random_state': self.random_state}
+
+    def load_arrays(self, arrays):
+        self.centroids = arrays['centroids']
+        self.vectors = arrays['vectors']
+        self.ids = arrays['ids']
+        self.offsets = arrays['offsets']
+
+class SklearnIndex:
+    '''
+    Brute force cosine neighbors with sklearn, kept as the reference engine
+    '''
+    kind = 'sklearn'
+
+    def __init__(self, n_neighbors=5):
+        self.n_neighbors = n_neighbors
+        self.data = None
+        self.knn = None
+
+    def fit(self, data):
+        data = np.asarray(data)
+        knn = NearestNeighbors(n_neighbors=self.n_neighbors, algorithm='auto', n_jobs=-1, metric='cosine').fit(data)
+        # Fitted apart then swapped in, queries running meanwhile keep the previous index
+        self.data, self.knn = data, knn
+        return self
+
+    def add(self, data):
+        '''Insert rows after the fitted ones, by fitting again on all the rows'''
+        position = len(self.data)
+        self.fit(np.vstack([self.data, np.atleast_2d(data)]))
+        return position
+
+    def truncate(self, n_rows):
+        '''Drop the rows inserted after the first n_rows ones'''
+        if len(self.data) > n_rows:
+            self.fit(self.data[:n_rows])
+
+    def kneighbors(self, data, n_neighbors=None):
+        return self.knn.kneighbors(np.asarray(data), n_neighbors)
+
+ENGINES = {engine.kind: engine for engine in [ExactIndex, IVFIndex, SklearnIndex]}
+
+def build_index(kind, data, **params):
+    '''Fit a neighbor index of the given kind (exact, ivf or sklearn)'''
+    if kind not in ENGINES:
+        raise ValueError(f'Unknown neighbor index {kind}, expected one of {list(ENGINES)}')
+    return ENGINES[kind](**params).fit(data)
+
+def write_manifest(directory, manifest):
+    '''Write a manifest last and atomically, so that a directory interrupted while being written is never considered valid'''
+    manifest_tmp = os.path.join(directory, 'manifest.json.tmp')
+    with open(manifest_tmp, 'w') as file:
+        json.dump(manifest, file)
+    os.replace(manifest_tmp, os.path.join(directory, 'manifest.json'))
+
+def read_manifest(directory, signature):
+    '''Get the manifest of a stored index or graph, None if it does not exist or was built from other data'''
+    try:
+        with open(os.path.join(directory, 'manifest.json')) as file:
+            manifest = json.load(file)
+    except FileNotFoundError:
+        return None
+    if manifest['version'] != INDEX_VERSION or manifest['signature'] != signature:
+        return None
+    return manifest
+
+def save_index(index, index_dir, signature=None):
+    '''
+    Store the arrays of an index as .npy files plus a manifest
+    '''
+    if not hasattr(index, 'arrays'):
+        raise ValueError(f'Neighbor index {index.kind} cannot be stored')
+
+    os.makedirs(index_dir, exist_ok=True)
+    for name, array in index.arrays().items():
+        np.save(os.path.join(index_dir, name + '.npy'), array)
+
+    write_manifest(index_dir, {'version': INDEX_VERSION, 'kind': index.kind, 'params': index.params(), 'signature': signature})
+
+def load_index(index_dir, signature=None):
+    '''
+    Open a stored index with memory mapping, None if it does not exist or was built from other data
+    '''
+    manifest = read_manifest(index_dir, signature)
+    if manifest is None:
+        return None
+
+    index = ENGINES[manifest['kind']](**manifest['params'])
+    index.load_arrays({name: np.load(os.path.join(index_dir, name + '.npy'), mmap_mode='r')
+                       for name in index.arrays()})
+    return index
+
+class NeighborsGraph:
+    '''
+    Precomputed neighbors of every client: positions as int32 and cosine similarities as float16, one row per client
+    '''
+    def __init__(self, indices, similarities):
+        self.indices = indices
+        self.similarities = similarities
+
+    def __len__(self):
+        return len(self.indices)
+
+    def neighbors(self, position):
+        '''Get the positions and similarities of the neighbors of a client, by decreasing similarity'''
+        return self.indices[position].astype(np.int64), self.similarities[position].astype(np.float64)
+
+def build_graph(data, graph_dir, n_neighbors, signature=None, block_size=1024, n_jobs=None):
+    '''
+    Compute the exact neighbors of every row by blocks of queries on n_jobs threads, written straight to
+    memory mapped files: memory stays bounded by n_jobs blocks of similarities whatever the number of clients
+    '''
+    index = ExactIndex(n_neighbors).fit(data)
+    n_neighbors = min(n_neighbors, len(index.vectors))
+
+    os.makedirs(graph_dir, exist_ok=True)
+    shape = (len(index.vectors), n_neighbors)
+    indices = np.lib.format.open_memmap(os.path.join(graph_dir, 'indices.npy'), mode='w+', dtype=np.int32, shape=shape)
+    similarities = np.lib.format.open_memmap(os.path.join(graph_dir, 'similarities.npy'), mode='w+', dtype=np.float16, shape=shape)
+
+    def search(start):
+        distances, neighbors = index.kneighbors(index.vectors[start:start + block_size], n_neighbors)
+        indices[start:start + block_size] = neighbors
+        similarities[start:start + block_size] = 1 - distances
+
+    with ThreadPoolExecutor(max_workers=n_jobs or min(8, os.cpu_count() or 1)) as executor:
+        list(executor.map(search, range(0, len(index.vectors), block_size)))
+
+    indices.flush()
+    similarities.flush()
+    write_manifest(graph_dir, {'version': INDEX_VERSION, 'kind': 'graph', 'n_neighbors': n_neighbors, 'signature': signature})
+
+def load_graph(graph_dir, signature=None):
+    '''
+    Open a precomputed graph with memory mapping, None if it does not exist or was built from other data
+    '''
+    if read_manifest(graph_dir, signature) is None:
+        return None
+    return NeighborsGraph(np.load(os.path.join(graph_dir, 'indices.npy'), mmap_mode='r'),
+                          np.load(os.path.join(graph_dir, 'similarities.npy'), mmap_mode='r'))
+
+if __name__ == '__main__':
+    # Build the neighbors graph offline: python neighbors.py ../data/processed/test_feature_engineering_encoded.csv.gz [n_neighbors] [../models/preprocessing]
+    from preprocessing import read, Preprocessor
+    from snapshot import snapshot_signature
+
+    file_path = sys.argv[1]
+    n_neighbors = int(sys.argv[2]) if len(sys.argv) > 2 else 1001
+    preprocessing_path = sys.argv[3] if len(sys.argv) > 3 else '../models/preprocessing'
+    data = read(file_path)
+    preprocessor = Preprocessor.load(preprocessing_path) or Preprocessor.fit(data)
+    signature = snapshot_signature(file_path)
+    if signature is not None:
+        signature = {**signature, 'preprocessing': preprocessor.version}
+    graph_dir = os.path.join(os.path.dirname(file_path), 'neighbors_graph')
+    build_graph(preprocessor.transform(data.iloc[:, 1:]), graph_dir, n_neighbors, signature=signature)
+    print(f'Neighbors graph of {file_path} written to {graph_dir}')
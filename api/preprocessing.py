@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import sys
+import warnings
+import pandas as pd
+import numpy as np
+from snapshot import snapshot_path, is_fresh, build_snapshot, load_snapshot
+
+PREPROCESSING_VERSION = 1
+
+def read(file_path):
+    snapshot_dir = snapshot_path(file_path)
+    if not is_fresh(file_path, snapshot_dir):
+        try:
+            build_snapshot(file_path, snapshot_dir)
+        except OSError:
+            # Data folder is read-only: parse the csv.gz file directly
+            data = pd.read_csv(file_path)
+            data = data.replace([np.inf, -np.inf], np.nan)
+            return data
+    return load_snapshot(snapshot_dir)
+
+class Preprocessor:
+    '''
+    Median imputation and standard scaling fitted once on reference data and stored as arrays, same results
+    as SimpleImputer(strategy='median') then StandardScaler: transforming a client is a few vector operations,
+    whatever the number of clients
+    '''
+    def __init__(self, feature_names, medians, means, scales, source=None):
+        self.feature_names = list(feature_names)
+        self.medians = np.asarray(medians, dtype=np.float64)
+        self.means = np.asarray(means, dtype=np.float64)
+        self.scales = np.asarray(scales, dtype=np.float64)
+        self.source = source
+        digest = hashlib.md5(json.dumps(self.feature_names).encode())
+        for array in [self.medians, self.means, self.scales]:
+            digest.update(array.tobytes())
+        self.version = digest.hexdigest()[:12]
+
+    @classmethod
+    def fit(cls, data, source=None):
+        '''Fit on a dataframe of clients (the SK_ID_CURR column is ignored)'''
+        features = data.drop(columns=['SK_ID_CURR'], errors='ignore')
+        values = features.to_numpy(dtype=np.float64)
+
+        with warnings.catch_warnings():
+            # Columns without any value are filled with 0
+            warnings.simplefilter('ignore', RuntimeWarning)
+            medians = np.nan_to_num(np.nanmedian(values, axis=0))
+        values = np.where(np.isnan(values), medians, values)
+
+        means = values.mean(axis=0)
+        variances = values.var(axis=0)
+        # Constant columns are left unscaled, with the same tolerance as StandardScaler
+        eps = np.finfo(np.float64).eps
+        constant = variances <= len(values) * eps * variances + (len(values) * means * eps) ** 2
+        scales = np.where(constant, 1.0, np.sqrt(variances))
+
+        return cls(features.columns, medians, means, scales, source)
+
+    def impute(self, values):
+        '''Fill the missing values of feature rows (array in feature order) with the medians'''
+        values = np.asarray(values, dtype=np.float64)
+        return np.where(np.isnan(values), self.medians, values)
+
+    def scale(self, values):
+        '''Standardize imputed feature rows'''
+        return (np.asarray(values, dtype=np.float64) - self.means) / self.scales
+
+    def transform(self, values):
+        return self.scale(self.impute(values))
+
+    def save(self, artifact_dir):
+        '''Store the arrays as .npy files plus a manifest, written last'''
+        os.makedirs(artifact_dir, exist_ok=True)
+        for name in ['medians', 'means', 'scales']:
+            np.save(os.path.join(artifact_dir, name + '.npy'), getattr(self, name))
+
+        manifest = {'version': PREPROCESSING_VERSION, 'preprocessor': self.version,
+                    'columns': self.feature_names, 'source': self.source}
+        manifest_tmp = os.path.join(artifact_dir, 'manifest.json.tmp')
+        with open(manifest_tmp, 'w') as file:
+            json.dump(manifest, file)
+        os.replace(manifest_tmp, os.path.join(artifact_dir, 'manifest.json'))
+        return artifact_dir
+
+    @classmethod
+    def load(cls, artifact_dir):
+        '''Open a stored preprocessor, None if it does not exist or has another format'''
+        try:
+            with open(os.path.join(artifact_dir, 'manifest.json')) as file:
+                manifest = json.load(file)
+        except FileNotFoundError:
+            return None
+        if manifest['version'] != PREPROCESSING_VERSION:
+            return None
+        arrays = {name: np.load(os.path.join(artifact_dir, name + '.npy')) for name in ['medians', 'means', 'scales']}
+        return cls(manifest['columns'], source=manifest['source'], **arrays)
+
+if __name__ == '__main__':
+    # Fit the preprocessing offline on the reference data: python preprocessing.py ../data/processed/test_feature_engineering_encoded.csv.gz [../models/preprocessing]
+    file_path = sys.argv[1]
+    artifact_dir = sys.argv[2] if len(sys.argv) > 2 else '../models/preprocessing'
+    preprocessor = Preprocessor.fit(read(file_path), source=os.path.basename(file_path))
+    print(f'Preprocessing {preprocessor.version} fitted on {file_path} written to {preprocessor.save(artifact_dir)}')
@@ -0,0 +1,123 @@
+import math
+from datetime import date, timedelta
+import numpy as np
+
+# One-hot encoded groups decoded into a label, by prefix of their columns
+GROUPS = {'civilStatus': 'NAME_FAMILY_STATUS_', 'educationType': 'NAME_EDUCATION_TYPE_', 'incomeType': 'NAME_INCOME_TYPE_'}
+
+def values(name, fill=None):
+    return lambda data: data[name].to_numpy(dtype=np.float64) if fill is None else data[name].fillna(fill).to_numpy(dtype=np.float64)
+
+def ratio(numerator, denominator, factor=1):
+    def compute(data):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return factor*(data[numerator].fillna(0).to_numpy(dtype=np.float64) / data[denominator].fillna(0).to_numpy(dtype=np.float64))
+    return compute
+
+# Fields of the profiles computed from the client columns; the bank information treats missing values as 0
+FIELDS = {
+    'gender': values('CODE_GENDER'),
+    'countChildren': values('CNT_CHILDREN'),
+    'ownCar': values('FLAG_OWN_CAR'),
+    'ownRealty': values('FLAG_OWN_REALTY'),
+    'daysBirth': values('DAYS_BIRTH'),
+    'age': lambda data: np.round(data['DAYS_BIRTH'].to_numpy(dtype=np.float64)/-365),
+    'totalIncome': lambda data: np.round(data['AMT_INCOME_TOTAL'].fillna(0).to_numpy(dtype=np.float64)),
+    'extSource1': values('EXT_SOURCE_1', 0),
+    'extSource2': values('EXT_SOURCE_2', 0),
+    'extSource3': values('EXT_SOURCE_3', 0),
+    'seniority': lambda data: np.round(data['DAYS_EMPLOYED'].fillna(0).to_numpy(dtype=np.float64)/-365),
+    'daysRegistration': values('DAYS_REGISTRATION', 0),
+    'amtCredit': lambda data: np.round(data['AMT_CREDIT'].fillna(0).to_numpy(dtype=np.float64)),
+    'annualCredit': lambda data: np.round(data['AMT_ANNUITY'].fillna(0).to_numpy(dtype=np.float64)),
+    'lengthCredit': lambda data: np.round(ratio('AMT_CREDIT', 'AMT_ANNUITY', 12)(data)),
+    'paymentRate': lambda data: 100*data['PAYMENT_RATE'].fillna(0).to_numpy(dtype=np.float64),
+    'creditIncomeRatio': values('CREDIT_INCOME_PERCENT', 0)
+}
+
+def decode_one_hot(block):
+    '''
+    Position of the set column (equal to 1) of every row of a one-hot block, -1 when none is set. When several
+    are set, the last one wins
+    '''
+    is_set = block == 1
+    positions = block.shape[1] - 1 - np.argmax(is_set[:, ::-1], axis=1)
+    return np.where(is_set.any(axis=1), positions, -1).astype(np.int16)
+
+def integer(value):
+    return int(value) if math.isfinite(value) else None
+
+def days_ago(days):
+    return None if math.isnan(days) else date.today() - timedelta(days=-days)
+
+class ProfileStore:
+    '''
+    Personal and bank information of the clients decoded once at load time: one array per field (one-hot groups
+    decoded to the position of their label, ages, seniority, loan length, ratios) read by client position. Clients
+    added after startup are decoded on request from their row
+    '''
+    def __init__(self, data, rows=None, block_size=65536):
+        self.labels = {name: [column[len(prefix):] for column in data.columns if column.startswith(prefix)]
+                       for name, prefix in GROUPS.items()}
+        blocks = [self.decode(data.take(np.arange(start, min(start + block_size, len(data)))))
+                  for start in range(0, len(data), block_size)]
+        self.arrays = {name: np.concatenate([block[name] for block in blocks]) if blocks else np.empty(0)
+                       for name in ['clientId', *FIELDS, *GROUPS]}
+        # Gets the rows of clients by position, for the clients added after startup
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.arrays['clientId'])
+
+    def decode(self, data):
+        '''Arrays of the fields of some client rows'''
+        arrays = {'clientId': data['SK_ID_CURR'].to_numpy(dtype=np.int64)}
+        arrays.update({name: compute(data) for name, compute in FIELDS.items()})
+        for name, prefix in GROUPS.items():
+            columns = [prefix + label for label in self.labels[name]]
+            arrays[name] = decode_one_hot(data[columns].to_numpy(dtype=np.float64))
+        return arrays
+
+    def record(self, position):
+        '''Fields of a client as python values'''
+        if position < len(self):
+            record = {name: array[position].item() for name, array in self.arrays.items()}
+        else:
+            record = {name: array[0].item() for name, array in self.decode(self.rows([position])).items()}
+        for name in GROUPS:
+            record[name] = self.labels[name][record[name]] if record[name] >= 0 else ''
+        return record
+
+    def personal(self, position):
+        '''Personal information of a client, None for the values that are missing'''
+        record = self.record(position)
+        return {
+            'clientId': record['clientId'],
+            'gender': None if math.isnan(record['gender']) else 'Man' if int(record['gender']) == 0 else 'Woman',
+            'countChildren': 'No children' if record['countChildren'] == 0 else integer(record['countChildren']),
+            'ownCar': None if math.isnan(record['ownCar']) else 'No car' if int(record['ownCar']) == 0 else 'Yes',
+            'ownRealty': None if math.isnan(record['ownRealty']) else 'No realty' if int(record['ownRealty']) == 0 else 'Yes',
+            'age': integer(record['age']),
+            'birthday': days_ago(record['daysBirth']),
+            'civilStatus': record['civilStatus'],
+            'educationType': record['educationType']
+        }
+
+    def bank(self, position):
+        '''Bank information of a client, missing values count as 0'''
+        record = self.record(position)
+        return {
+            'clientId': record['clientId'],
+            'totalIncome': int(record['totalIncome']),
+            'extSource1': record['extSource1'],
+            'extSource2': record['extSource2'],
+            'extSource3': record['extSource3'],
+            'seniority': int(record['seniority']),
+            'registrationSince': days_ago(record['daysRegistration']),
+            'amtCredit': int(record['amtCredit']),
+            'annualCredit': int(record['annualCredit']),
+            'lengthCredit': integer(record['lengthCredit']),
+            'paymentRate': round(record['paymentRate'], 2),
+            'creditIncomeRatio': round(record['creditIncomeRatio'], 2),
+            'incomeType': record['incomeType']
+        }
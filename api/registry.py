@@ -0,0 +1,141 @@
+import threading
+import time
+import numpy as np
+from row_buffer import RowBuffer
+
+class ClientProbabilities:
+    '''
+    Probabilities of the clients scored by one model version: the clients loaded at startup are scored in one
+    pass on the first call, the clients added later are kept when they are ingested, or scored once by the first
+    call which needs them. score(positions) gets the probabilities of the clients at some positions
+    '''
+    def __init__(self, score, n_loaded, block_size=65536):
+        self.score = score
+        self.n_loaded = n_loaded
+        self.block_size = block_size
+        self.loaded = None
+        self.added = RowBuffer(2)
+        # Scoring the loaded clients does not hold the lock of the added ones, ingestions do not wait for it
+        self.loaded_lock = threading.Lock()
+        self.lock = threading.Lock()
+
+    def __call__(self, n_clients=None):
+        '''Probabilities of the first n_clients clients, the ones loaded at startup by default'''
+        n_clients = self.n_loaded if n_clients is None else n_clients
+        with self.loaded_lock:
+            if self.loaded is None:
+                self.loaded = np.concatenate([self.score(np.arange(start, min(start + self.block_size, self.n_loaded)))
+                                              for start in range(0, self.n_loaded, self.block_size)])
+        with self.lock:
+            n_scored = self.n_loaded + len(self.added)
+            if n_clients > n_scored:
+                self.added.append(self.score(np.arange(n_scored, n_clients)))
+        if n_clients <= self.n_loaded:
+            return self.loaded[:n_clients]
+        return np.concatenate([self.loaded, self.added.values()[:n_clients - self.n_loaded]])
+
+    def add(self, position, probabilities):
+        '''Keep the probabilities of a client added after startup, scored when it was ingested'''
+        with self.lock:
+            if position == self.n_loaded + len(self.added):
+                self.added.append(probabilities)
+
+class ModelVersion:
+    '''
+    A loaded classifier with everything needed to serve it: the scorer, the shap explanations and the
+    probabilities of the clients (ClientProbabilities, the ones loaded at startup computed on the first call)
+    '''
+    def __init__(self, version, classifier, model, explanations, source=None, probabilities=None):
+        self.version = version
+        self.classifier = classifier
+        self.model = model
+        self.explanations = explanations
+        self.source = source
+        self.probabilities = probabilities
+        self.loaded_at = time.time()
+
+    def describe(self):
+        return {'version': self.version, 'source': self.source, 'loadedAt': self.loaded_at}
+
+class ModelRegistry:
+    '''
+    Versions of the model served by the API. A new version is loaded and warmed up in a background thread, then
+    swapped in with a single assignment: a request reads registry.active once and uses the same version until it
+    ends. Previous versions stay loaded, so a rollback is immediate
+    '''
+    def __init__(self, load, warm_up=None, history_size=2):
+        self.load = load
+        self.warm_up = warm_up or (lambda version: None)
+        self.history_size = history_size
+        self.active = None
+        self.history = []
+        self.pending = None
+        self.lock = threading.Lock()
+
+    def activate(self, version):
+        '''Swap a loaded version in, keeping the active one for rollback'''
+        with self.lock:
+            self.swap(version)
+        return version
+
+    def swap(self, version):
+        '''Swap a version in, the registry lock held'''
+        if self.active is not None:
+            self.history = [self.active] + self.history[:self.history_size - 1]
+        self.active = version
+
+    def update_pending(self, **state):
+        '''Replace the status of the version being loaded, under the lock checked by load_async'''
+        with self.lock:
+            self.pending = {**(self.pending or {}), **state}
+
+    def load_version(self, *args, **kwargs):
+        '''Load, warm up and activate a version, calling load(*args, **kwargs)'''
+        with self.lock:
+            self.pending = {'state': 'loading', 'source': kwargs.get('source', args[0] if args else None)}
+        try:
+            version = self.load(*args, **kwargs)
+            self.update_pending(version=version.version, state='warming up')
+            self.warm_up(version)
+        except Exception as error:
+            self.update_pending(state='failed', error=repr(error))
+            raise
+        # Cleared with the swap: a load accepted once the pending status is cleared is activated after this one
+        with self.lock:
+            self.pending = None
+            self.swap(version)
+        return version
+
+    def load_async(self, *args, **kwargs):
+        '''
+        Load a version in a background thread, the active one keeps serving meanwhile.
+        RuntimeError if another version is already being loaded
+        '''
+        with self.lock:
+            if self.pending is not None and self.pending['state'] != 'failed':
+                raise RuntimeError('A model version is already being loaded')
+            self.pending = {'state': 'queued'}
+
+        def run():
+            try:
+                self.load_version(*args, **kwargs)
+            except Exception:
+                # Kept in the pending status
+                pass
+
+        thread = threading.Thread(target=run, name='model-load', daemon=True)
+        thread.start()
+        return thread
+
+    def rollback(self):
+        '''Swap the previous version back in, dropping the active one. LookupError if there is no previous version'''
+        with self.lock:
+            if not self.history:
+                raise LookupError('No previous model version')
+            self.active = self.history.pop(0)
+        return self.active
+
+    def status(self):
+        return {'active': self.active.describe() if self.active is not None else None,
+                'history': [version.describe() for version in self.history],
+                'pending': self.pending}
@@ -0,0 +1,39 @@
+import threading
+import numpy as np
+
+class RowBuffer:
+    '''
+    Rows appended to a preallocated array whose capacity doubles when it is full: appending is amortized
+    O(1) and readers get a view of the filled rows, safe to share between threads
+    '''
+    def __init__(self, n_columns, dtype=np.float64, capacity=64):
+        self.array = np.empty((capacity, n_columns), dtype=dtype)
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.size
+
+    def append(self, rows):
+        '''Append a 2D array of rows, returning the position of the first one'''
+        rows = np.atleast_2d(rows)
+        with self.lock:
+            start = self.size
+            if start + len(rows) > len(self.array):
+                # New array is filled before being swapped, readers always see their rows
+                array = np.empty((max(2*len(self.array), start + len(rows)), self.array.shape[1]), dtype=self.array.dtype)
+                array[:start] = self.array[:start]
+                self.array = array
+            self.array[start:start + len(rows)] = rows
+            self.size = start + len(rows)
+        return start
+
+    def truncate(self, size):
+        '''Drop the rows after the first size ones'''
+        with self.lock:
+            self.size = min(self.size, size)
+
+    def values(self):
+        '''View of the filled rows'''
+        size = self.size
+        return self.array[:size]
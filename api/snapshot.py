@@ -0,0 +1,101 @@
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_SUFFIX = '.snapshot'
+
+def snapshot_path(file_path):
+    '''Get the snapshot directory associated to a processed csv.gz file'''
+    name = os.path.basename(file_path)
+    for extension in ['.gz', '.csv']:
+        if name.endswith(extension):
+            name = name[:-len(extension)]
+    return os.path.join(os.path.dirname(file_path), name + SNAPSHOT_SUFFIX)
+
+def source_signature(file_path):
+    '''Get size and modification time of the source file, used to detect stale snapshots'''
+    stat = os.stat(file_path)
+    return {'source': os.path.basename(file_path), 'size': stat.st_size, 'mtime': int(stat.st_mtime)}
+
+def build_snapshot(file_path, snapshot_dir=None):
+    '''
+    Parse a processed csv.gz file once and store it as a column-major float64 block (values.npy),
+    the client ids (ids.npy) and a manifest with the column names
+    '''
+    snapshot_dir = snapshot_dir or snapshot_path(file_path)
+
+    data = pd.read_csv(file_path)
+    data = data.replace([np.inf, -np.inf], np.nan)
+
+    ids = data['SK_ID_CURR'].to_numpy(dtype=np.int64)
+    features = data.drop(columns=['SK_ID_CURR'])
+    values = np.asfortranarray(features.to_numpy(dtype=np.float64))
+
+    os.makedirs(snapshot_dir, exist_ok=True)
+    np.save(os.path.join(snapshot_dir, 'ids.npy'), ids)
+    np.save(os.path.join(snapshot_dir, 'values.npy'), values)
+
+    manifest = {
+        'version': SNAPSHOT_VERSION,
+        'rows': int(values.shape[0]),
+        'columns': features.columns.to_list(),
+        **source_signature(file_path)
+    }
+
+    # Manifest is written last, so a snapshot interrupted while being written is never considered valid
+    manifest_tmp = os.path.join(snapshot_dir, 'manifest.json.tmp')
+    with open(manifest_tmp, 'w') as file:
+        json.dump(manifest, file)
+    os.replace(manifest_tmp, os.path.join(snapshot_dir, 'manifest.json'))
+
+    return snapshot_dir
+
+def read_manifest(snapshot_dir):
+    '''Get the manifest of a snapshot, None if it does not exist'''
+    try:
+        with open(os.path.join(snapshot_dir, 'manifest.json')) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+def is_fresh(file_path, snapshot_dir=None):
+    '''Check that a snapshot exists and was built from the current version of the source file'''
+    manifest = read_manifest(snapshot_dir or snapshot_path(file_path))
+    if manifest is None or manifest['version'] != SNAPSHOT_VERSION:
+        return False
+    if not os.path.exists(file_path):
+        # Snapshot shipped without its source file
+        return True
+    signature = source_signature(file_path)
+    return manifest['size'] == signature['size'] and manifest['mtime'] == signature['mtime']
+
+def snapshot_signature(file_path):
+    '''Get the signature of the source file a snapshot was built from, None if there is no snapshot'''
+    manifest = read_manifest(snapshot_path(file_path))
+    if manifest is None:
+        return None
+    return {key: manifest[key] for key in ['source', 'size', 'mtime']}
+
+def load_snapshot(snapshot_dir):
+    '''
+    Open a snapshot with memory mapping: no decompression nor parsing, pages are only read from disk when accessed
+    '''
+    manifest = read_manifest(snapshot_dir)
+    if manifest is None:
+        raise FileNotFoundError(f'No snapshot found in {snapshot_dir}')
+
+    ids = np.load(os.path.join(snapshot_dir, 'ids.npy'))
+    values = np.load(os.path.join(snapshot_dir, 'values.npy'), mmap_mode='r')
+
+    data = pd.DataFrame(values, columns=manifest['columns'], copy=False)
+    data.insert(0, 'SK_ID_CURR', ids)
+
+    return data
+
+if __name__ == '__main__':
+    # Build snapshots offline: python snapshot.py ../data/processed/test_feature_engineering_encoded.csv.gz ...
+    for file_path in sys.argv[1:]:
+        print(f'Snapshot of {file_path} written to {build_snapshot(file_path)}')
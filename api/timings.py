@@ -0,0 +1,22 @@
+import contextlib
+import time
+
+class StageTimings:
+    '''
+    Duration in seconds of named stages (e.g. the startup steps), in the order they first ran. A stage run
+    several times accumulates its durations, each run is also passed to observe(name, duration) if given
+    '''
+    def __init__(self, observe=None):
+        self.durations = {}
+        self.observe = observe
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self.durations[name] = self.durations.get(name, 0.0) + duration
+            if self.observe is not None:
+                self.observe(name, duration)
@@ -0,0 +1,155 @@
+import math
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Missing value handling of a split, as in the LightGBM model dump
+MISSING_TYPES = {'None': 0, 'Zero': 1, 'NaN': 2}
+# Values LightGBM considers as zero for missing_type Zero
+ZERO_THRESHOLD = 1e-35
+
+class CompiledPredictor:
+    '''
+    Binary LightGBM model exported to flat contiguous arrays (one entry per node of every tree) and evaluated
+    without the sklearn wrapper: no dataframe validation nor conversion, which dominates single row latency.
+    Trees are walked with numba when it is installed, otherwise all rows and trees at once with numpy
+    '''
+    def __init__(self, feature, threshold, left, right, default_left, missing_type, value, roots, depth,
+                 feature_names, sigmoid=1.0, engine=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.default_left = default_left
+        self.missing_type = missing_type
+        self.value = value
+        self.roots = roots
+        self.depth = depth
+        self.feature_names = feature_names
+        self.sigmoid = sigmoid
+        self.engine = engine or ('numba' if numba is not None else 'numpy')
+        if self.engine not in ['numba', 'numpy']:
+            raise ValueError(f'Unknown prediction engine {self.engine}, expected numba or numpy')
+        if self.engine == 'numba' and numba is None:
+            raise ValueError('numba is not installed')
+
+    @classmethod
+    def from_model(cls, model, engine=None):
+        '''
+        Export the trees of a fitted LGBMClassifier (or Booster) with binary objective
+        '''
+        booster = getattr(model, 'booster_', model)
+        dump = booster.dump_model()
+        if dump['num_tree_per_iteration'] != 1 or not dump['objective'].startswith('binary'):
+            raise ValueError(f'Only binary models can be compiled, got objective {dump["objective"]}')
+        sigmoid = 1.0
+        for parameter in dump['objective'].split()[1:]:
+            if parameter.startswith('sigmoid:'):
+                sigmoid = float(parameter.split(':')[1])
+
+        nodes = {name: [] for name in ['feature', 'threshold', 'left', 'right', 'default_left', 'missing_type', 'value']}
+        roots = []
+        depth = 0
+
+        def add(node, level):
+            '''Append a node and its subtree, returning its position'''
+            nonlocal depth
+            position = len(nodes['feature'])
+            for values in nodes.values():
+                values.append(0)
+            if 'split_index' not in node:
+                depth = max(depth, level)
+                nodes['feature'][position] = -1
+                nodes['value'][position] = node['leaf_value']
+                return position
+            if node['decision_type'] != '<=':
+                raise ValueError(f'Only numerical splits can be compiled, got {node["decision_type"]}')
+            nodes['feature'][position] = node['split_feature']
+            nodes['threshold'][position] = node['threshold']
+            nodes['default_left'][position] = node['default_left']
+            nodes['missing_type'][position] = MISSING_TYPES[node['missing_type']]
+            nodes['left'][position] = add(node['left_child'], level + 1)
+            nodes['right'][position] = add(node['right_child'], level + 1)
+            return position
+
+        for tree in dump['tree_info']:
+            roots.append(add(tree['tree_structure'], 0))
+
+        return cls(np.array(nodes['feature'], dtype=np.int32),
+                   np.array(nodes['threshold'], dtype=np.float64),
+                   np.array(nodes['left'], dtype=np.int32),
+                   np.array(nodes['right'], dtype=np.int32),
+                   np.array(nodes['default_left'], dtype=np.bool_),
+                   np.array(nodes['missing_type'], dtype=np.int8),
+                   np.array(nodes['value'], dtype=np.float64),
+                   np.array(roots, dtype=np.int32),
+                   depth, dump['feature_names'], sigmoid, engine)
+
+    def raw_score(self, features):
+        '''
+        Sum of the leaf values of every tree, for a 2D array or dataframe of features in model order
+        '''
+        features = np.ascontiguousarray(features, dtype=np.float64)
+        if features.ndim != 2 or features.shape[1] != len(self.feature_names):
+            raise ValueError(f'Expected {len(self.feature_names)} features, got shape {features.shape}')
+        if self.engine == 'numba':
+            return _raw_score_numba(features, self.feature, self.threshold, self.left, self.right,
+                                    self.default_left, self.missing_type, self.value, self.roots)
+        return _raw_score_numpy(features, self.feature, self.threshold, self.left, self.right,
+                                self.default_left, self.missing_type, self.value, self.roots, self.depth)
+
+    def predict_proba(self, features):
+        '''Same output as LGBMClassifier.predict_proba: probabilities of class 0 and 1'''
+        probability = 1 / (1 + np.exp(-self.sigmoid * self.raw_score(features)))
+        return np.column_stack([1 - probability, probability])
+
+def _go_left(value, threshold, default_left, missing_type):
+    '''LightGBM decision of a numerical split (vectorized), NaN being zero unless missing values have their own branch'''
+    is_nan = np.isnan(value)
+    value = np.where(is_nan & (missing_type != 2), 0.0, value)
+    is_missing = ((missing_type == 1) & (np.abs(value) <= ZERO_THRESHOLD)) | ((missing_type == 2) & is_nan)
+    return np.where(is_missing, default_left, value <= threshold)
+
+def _raw_score_numpy(features, feature, threshold, left, right, default_left, missing_type, value, roots, depth):
+    '''Walk every tree for every row at once, one level per step'''
+    rows = np.arange(len(features))[:, np.newaxis]
+    nodes = np.broadcast_to(roots, (len(features), len(roots))).copy()
+    for _ in range(depth):
+        split_feature = feature[nodes]
+        is_leaf = split_feature < 0
+        if is_leaf.all():
+            break
+        go_left = _go_left(features[rows, np.maximum(split_feature, 0)], threshold[nodes],
+                           default_left[nodes], missing_type[nodes])
+        nodes = np.where(is_leaf, nodes, np.where(go_left, left[nodes], right[nodes]))
+    # Summed tree by tree like LightGBM
+    raw_score = np.zeros(len(features))
+    for tree in range(len(roots)):
+        raw_score += value[nodes[:, tree]]
+    return raw_score
+
+def _raw_score_loop(features, feature, threshold, left, right, default_left, missing_type, value, roots):
+    '''Walk the trees row by row, compiled by numba'''
+    raw_score = np.zeros(features.shape[0])
+    for row in range(features.shape[0]):
+        total = 0.0
+        for root in roots:
+            node = root
+            while feature[node] >= 0:
+                x = features[row, feature[node]]
+                is_nan = math.isnan(x)
+                if is_nan and missing_type[node] != 2:
+                    x = 0.0
+                if (missing_type[node] == 1 and abs(x) <= ZERO_THRESHOLD) or (missing_type[node] == 2 and is_nan):
+                    go_left = default_left[node]
+                else:
+                    go_left = x <= threshold[node]
+                node = left[node] if go_left else right[node]
+            total += value[node]
+        raw_score[row] = total
+    return raw_score
+
+_raw_score_numba = numba.njit(nogil=True, cache=False)(_raw_score_loop) if numba is not None else None
@@ -0,0 +1,218 @@
+'''
+Latency (p50, p95, p99) and throughput of every endpoint, with the API served in-process on synthetic clients,
+compared to the stored baselines: exits with status 1 when an endpoint regressed beyond the tolerance
+
+Baselines are stored with the host they were measured on and the duration of a fixed CPU workload (calibration):
+the baseline latencies are scaled by the ratio of the calibration measured now to the stored one, so that a faster
+or slower machine does not show as a change of the API. The scaling is approximate, the check is not run by the CI:
+to check a change, store a baseline on your machine before it, then compare after it, e.g.
+
+    git stash && python benchmarks/api_benchmark.py --update-baseline --baseline /tmp/baselines.json
+    git stash pop && python benchmarks/api_benchmark.py --baseline /tmp/baselines.json
+
+Usage: python benchmarks/api_benchmark.py [--clients 5000] [--requests 200] [--concurrency 8] [--rounds 3]
+       [--baseline benchmarks/baselines.json] [--update-baseline]
+'''
+import argparse
+import asyncio
+import atexit
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+import httpx
+import numpy as np
+import pandas as pd
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(BENCHMARKS_DIR, '..', 'api')
+sys.path.insert(0, API_DIR)
+from synthetic import model_columns, write_dataset
+
+# Endpoints measured, {id} is replaced by a random client id; POST endpoints get BATCH_SIZE random client ids
+ENDPOINTS = [
+    '/api/clients',
+    '/api/clients?prefix=1000&repay=Yes&minScore=500',
+    '/api/clients/{id}/personal_information',
+    '/api/clients/{id}/bank_information',
+    '/api/clients/{id}/profile',
+    '/api/clients/{id}/prediction',
+    'POST /api/predictions/batch',
+    '/api/clients/{id}/prediction/shap/local',
+    '/api/clients/{id}/prediction/shap/global',
+    '/api/shap/segments',
+    '/api/shap/segments/gender/Woman',
+    '/api/clients/{id}/prediction/neighbors',
+    '/api/clients/{id}/prediction/neighbors/statistics',
+    '/api/clients/{id}/prediction/neighbors/score',
+    '/api/statistics/loans',
+    '/api/statistics/genders/counts',
+    '/api/statistics/distributions/ages',
+    '/api/statistics/distributions/credits?log=true',
+    '/api/statistics/genders',
+    '/api/statistics/total_incomes',
+]
+# Clients scored per call of the batch endpoint
+BATCH_SIZE = 100
+# Latencies are compared on the median and the 95th percentile, the 99th is too noisy on a few hundred requests
+COMPARED = ['p50', 'p95']
+
+async def measure(client, path, ids, n_requests, concurrency, rng):
+    '''Send n_requests to an endpoint with at most concurrency in flight, get the latencies in ms and the req/s'''
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    method, _, url = path.rpartition(' ')
+
+    async def send(id):
+        async with semaphore:
+            start = time.perf_counter()
+            if method == 'POST':
+                response = await client.post(url, json={'clientsID': id})
+            else:
+                response = await client.get(url.format(id=id))
+            latencies.append(1000*(time.perf_counter() - start))
+            if response.status_code != 200:
+                raise RuntimeError(f'{path} returned {response.status_code}: {response.text[:200]}')
+
+    start = time.perf_counter()
+    if method == 'POST':
+        requests = [rng.choice(ids, BATCH_SIZE).tolist() for _ in range(n_requests)]
+    else:
+        requests = rng.choice(ids, n_requests)
+    await asyncio.gather(*[send(id) for id in requests])
+    elapsed = time.perf_counter() - start
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {'p50': p50, 'p95': p95, 'p99': p99, 'rps': n_requests / elapsed}
+
+async def run(app, ids, endpoints, n_requests, concurrency, warm_up, rounds, seed):
+    '''Measure every endpoint several rounds, keeping the median of each metric to damp the noise of a single round'''
+    rng = np.random.default_rng(seed)
+    results = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://benchmark') as client:
+        for path in endpoints:
+            # First calls pay one-off costs (global shap summaries, numba compilation...), not measured
+            await measure(client, path, ids, warm_up, 1, rng)
+            measures = [await measure(client, path, ids, n_requests, concurrency, rng) for _ in range(rounds)]
+            results[path] = {metric: float(np.median([result[metric] for result in measures])) for metric in measures[0]}
+    return results
+
+def calibrate(repeats=7):
+    '''
+    Duration in ms of a fixed CPU workload mixing numpy and python code like the endpoints do, median of a few runs
+    '''
+    matrix = np.random.default_rng(0).random((200, 200))
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(20):
+            matrix = matrix @ matrix
+            matrix /= np.abs(matrix).max()
+        sum(value*value for value in range(200000))
+        durations.append(1000*(time.perf_counter() - start))
+    return float(np.median(durations))
+
+def host():
+    '''Machine the benchmark runs on'''
+    return {'machine': platform.machine(), 'processor': platform.processor(),
+            'cpus': os.cpu_count(), 'python': platform.python_version()}
+
+def compare(results, baseline, tolerance, min_delta, scale=1.0):
+    '''
+    Regressions against the baseline, whose latencies are multiplied (and throughputs divided) by scale: latencies
+    more than tolerance (relative) and min_delta ms above it, throughput more than tolerance below it
+    '''
+    regressions = []
+    for path, result in results.items():
+        reference = baseline.get(path)
+        if reference is None:
+            continue
+        for metric in COMPARED:
+            expected = reference[metric]*scale
+            if result[metric] > expected*(1 + tolerance) and result[metric] - expected > min_delta:
+                regressions.append(f'{path} {metric}: {result[metric]:.2f} ms, baseline {expected:.2f} ms')
+        expected = reference['rps'] / scale
+        if result['rps'] < expected*(1 - tolerance):
+            regressions.append(f'{path} req/s: {result["rps"]:.0f}, baseline {expected:.0f}')
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default=os.path.join(BENCHMARKS_DIR, '..', 'models', 'lightgbm_classifier.pkl'))
+    parser.add_argument('--data-dir', help='Synthetic dataset, generated in a temporary folder by default')
+    parser.add_argument('--clients', type=int, default=5000)
+    parser.add_argument('--current-clients', type=int, default=3000)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--warm-up', type=int, default=5)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--endpoints', nargs='+', default=ENDPOINTS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=os.path.join(BENCHMARKS_DIR, 'baselines.json'))
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--min-delta', type=float, default=0.5, help='Latency differences below it (ms) are noise')
+    args = parser.parse_args()
+    warnings.filterwarnings('ignore', category=UserWarning)
+
+    config = {'clients': args.clients, 'currentClients': args.current_clients, 'requests': args.requests,
+              'concurrency': args.concurrency, 'rounds': args.rounds}
+    data_dir = args.data_dir
+    if data_dir is None:
+        data_dir = tempfile.mkdtemp(prefix='api_benchmark_')
+        atexit.register(shutil.rmtree, data_dir, True)
+    if not os.path.exists(os.path.join(data_dir, 'test_feature_engineering_encoded.csv.gz')):
+        write_dataset(data_dir, args.clients, args.current_clients, args.seed, columns=model_columns(args.model))
+
+    # The API reads its files relative to the api folder, the synthetic data gets its own preprocessing
+    os.environ['DATA_PATH'] = os.path.abspath(data_dir)
+    os.environ['PREPROCESSING_PATH'] = os.path.join(os.path.abspath(data_dir), 'preprocessing')
+    os.environ.setdefault('SHAP_BACKFILL', 'false')
+    os.chdir(API_DIR)
+    start = time.perf_counter()
+    import main as api
+    startup = time.perf_counter() - start
+    print(f'Startup: {startup:.1f} s on {len(api.client_index)} clients')
+
+    results = asyncio.run(run(api.app, api.client_index.ids, args.endpoints, args.requests, args.concurrency,
+                              args.warm_up, args.rounds, args.seed))
+    rows = [{'endpoint': path, **{metric: round(value, 2) for metric, value in result.items()}}
+            for path, result in results.items()]
+    print(pd.DataFrame(rows).to_string(index=False))
+
+    calibration = calibrate()
+    print(f'Calibration: {calibration:.1f} ms')
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump({'config': config, 'host': host(), 'calibration': calibration, 'endpoints': results}, file, indent=2)
+        print(f'Baseline saved to {args.baseline}')
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f'No baseline {args.baseline}, run with --update-baseline to store one')
+        return
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    if baseline['config'] != config:
+        print(f'Baseline was measured with {baseline["config"]}, not comparable with {config}')
+        sys.exit(1)
+    if 'calibration' not in baseline:
+        print(f'Baseline {args.baseline} has no calibration, run with --update-baseline to store it again')
+        sys.exit(1)
+    # Baseline latencies scaled to the speed of this machine
+    scale = calibration / baseline['calibration']
+    if baseline['host'] != host():
+        print(f'Baseline was measured on {baseline["host"]}, latencies are scaled by {scale:.2f} to this machine')
+    regressions = compare(results, baseline['endpoints'], args.tolerance, args.min_delta, scale)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    if regressions:
+        sys.exit(1)
+    print(f'No regression beyond {100*args.tolerance:.0f}% of the baseline')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+'''
+Resident memory of the features of the clients to predict: the float64 dataframes the API used to keep (raw,
+imputed and scaled) against the compact frame (uint8 one-hots, float32 numerics) it keeps now, exact or with
+every numeric in float32. Each representation is loaded and fully read in a fresh process
+
+Usage: python benchmarks/memory_report.py [--clients 50000] [--reference data/processed] [--data-dir folder]
+'''
+import argparse
+import functools
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import warnings
+import numpy as np
+import pandas as pd
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(BENCHMARKS_DIR, '..', 'api')
+sys.path.insert(0, API_DIR)
+from synthetic import FILES, infer_schemas, model_columns, write_dataset
+from scaling_report import resident_memory
+from preprocessing import read, Preprocessor
+from snapshot import snapshot_signature
+from feature_store import FeatureStore
+from compact import CompactFrame
+
+REPRESENTATIONS = ['dataframes', 'exact', 'float32']
+
+def load(data_dir, representation, block_size=65536):
+    '''
+    Load the features of the clients to predict as the API does with a representation and read every row,
+    so that all their pages are resident
+    '''
+    path = os.path.join(data_dir, FILES['clients'])
+    clients = read(path)
+    feature_names = clients.columns[1:].to_list()
+    if representation == 'dataframes':
+        # Snapshot plus its imputed and scaled copies, all float64
+        preprocessor = Preprocessor.fit(clients)
+        arrays = [clients.iloc[:, 1:].to_numpy(), preprocessor.impute(clients.iloc[:, 1:])]
+        arrays.append(preprocessor.scale(arrays[1]))
+        return arrays, sum(np.nansum(array) for array in arrays)
+
+    store = FeatureStore(os.path.join(data_dir, 'feature_store'),
+                         {**snapshot_signature(path), 'precision': representation})
+    frame = CompactFrame.publish(store, 'clients_to_predict', clients['SK_ID_CURR'], feature_names,
+                                 functools.partial(CompactFrame.from_frame, clients, float32=representation == 'float32'))
+    del clients
+    total = sum(np.nansum(frame.values(np.arange(start, min(start + block_size, len(frame)))))
+                for start in range(0, len(frame), block_size))
+    return [frame], total
+
+def measure(data_dir, representation):
+    '''Resident memory added by loading a representation, in this process'''
+    warnings.filterwarnings('ignore', category=UserWarning)
+    before = resident_memory()
+    frames, _ = load(data_dir, representation)
+    report = {'representation': representation, 'rssMB': resident_memory() - before}
+    compact = [frame for frame in frames if isinstance(frame, CompactFrame)]
+    report['bytesMB'] = (compact[0].nbytes if compact else sum(array.nbytes for array in frames)) / 2**20
+    if compact:
+        report.update({f'{name}MB': value / 2**20 for name, value in compact[0].memory_usage().items()})
+    return report
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=50000)
+    parser.add_argument('--reference', help='Folder of the processed csv files to learn the schema from, '
+                                            'the columns of the model are filled with rules otherwise')
+    parser.add_argument('--model', default=os.path.join(BENCHMARKS_DIR, '..', 'models', 'lightgbm_classifier.pkl'))
+    parser.add_argument('--data-dir', help='Folder of the processed csv files measured, a synthetic dataset by default')
+    # Internal: load one representation in this process
+    parser.add_argument('--measure', choices=REPRESENTATIONS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.data_dir, args.measure)))
+        return
+
+    data_dir = args.data_dir
+    if data_dir is None:
+        data_dir = tempfile.mkdtemp(prefix='memory_report_')
+        schemas = infer_schemas(args.reference) if args.reference else None
+        write_dataset(data_dir, args.clients, 100, columns=model_columns(args.model) if schemas is None else None,
+                      schemas=schemas)
+    try:
+        # Snapshot and compact frames are built once, then measured when attached
+        for representation in REPRESENTATIONS:
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--data-dir', data_dir, '--measure', representation],
+                           check=True, capture_output=True)
+        rows = []
+        for representation in REPRESENTATIONS:
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--data-dir', data_dir,
+                                     '--measure', representation], check=True, capture_output=True, text=True)
+            rows.append(json.loads(output.stdout.splitlines()[-1]))
+    finally:
+        if args.data_dir is None:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = pd.DataFrame(rows).round(1).fillna('')
+    print(f'Memory of the features of {args.clients if args.data_dir is None else "the"} clients (MB)')
+    print(report.to_string(index=False))
+    baseline = rows[0]['rssMB']
+    for row in rows[1:]:
+        print(f'{row["representation"]}: resident memory divided by {baseline / row["rssMB"]:.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+'''
+Recall and latency of the neighbor index engines against the sklearn brute force results
+
+Usage: python benchmarks/neighbors_report.py [--data data/processed/test_feature_engineering_encoded.csv.gz] [--queries 200]
+'''
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+from neighbors import build_index
+from preprocessing import read, Preprocessor
+
+def measure(index, queries, n_neighbors, **params):
+    '''Query clients one at a time, as the API does, and get the latencies in ms'''
+    latencies, indices = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, neighbors = index.kneighbors(query.reshape(1, -1), n_neighbors, **params)
+        latencies.append(1000*(time.perf_counter() - start))
+        indices.append(neighbors[0])
+    return np.array(latencies), indices
+
+def recall(indices, reference):
+    '''Share of the reference neighbors found by the engine'''
+    return np.mean([len(np.intersect1d(found, expected)) / len(expected) for found, expected in zip(indices, reference)])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', default='data/processed/test_feature_engineering_encoded.csv.gz')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--neighbors', type=int, default=1001)
+    parser.add_argument('--probes', type=int, nargs='+', default=[4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    data = read(args.data)
+    data = Preprocessor.fit(data).transform(data.iloc[:, 1:])
+    rng = np.random.default_rng(42)
+    queries = data[rng.choice(len(data), min(args.queries, len(data)), replace=False)]
+
+    rows = []
+    engines = [('sklearn', {}, {}), ('exact', {}, {})] + [('ivf', {}, {'n_probe': probe}) for probe in args.probes]
+    built = {}
+    reference = None
+    for kind, params, query_params in engines:
+        if kind not in built:
+            start = time.perf_counter()
+            built[kind] = (build_index(kind, data, n_neighbors=args.neighbors, **params), time.perf_counter() - start)
+        index, build_time = built[kind]
+        latencies, indices = measure(index, queries, args.neighbors, **query_params)
+        if reference is None:
+            reference = indices
+        name = kind + ''.join(f' {key}={value}' for key, value in query_params.items())
+        rows.append({
+            'engine': name,
+            'build (s)': round(build_time, 2),
+            'p50 (ms)': round(np.percentile(latencies, 50), 2),
+            'p95 (ms)': round(np.percentile(latencies, 95), 2),
+            f'recall@{args.neighbors}': round(recall(indices, reference), 4)
+        })
+
+    print(f'{len(data)} clients, {data.shape[1]} features, {len(queries)} queries\n')
+    print(pd.DataFrame(rows).to_string(index=False))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+'''
+Latency of the compiled tree predictor against the LightGBM sklearn wrapper, per batch size
+
+Usage: python benchmarks/predictor_report.py [--data data/processed/test_feature_engineering_encoded.csv.gz] [--repeats 200]
+'''
+import argparse
+import os
+import sys
+import time
+import warnings
+import joblib
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+from preprocessing import read
+from tree_predictor import CompiledPredictor, numba
+
+def measure(predict, batches):
+    '''Score every batch and get the latencies in ms'''
+    latencies = []
+    for batch in batches:
+        start = time.perf_counter()
+        predict(batch)
+        latencies.append(1000*(time.perf_counter() - start))
+    return np.array(latencies)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', default='data/processed/test_feature_engineering_encoded.csv.gz')
+    parser.add_argument('--model', default='models/lightgbm_classifier.pkl')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 10, 1000])
+    parser.add_argument('--repeats', type=int, default=200)
+    args = parser.parse_args()
+    # LightGBM warns on every call with a slice of the memory mapped data
+    warnings.filterwarnings('ignore', category=UserWarning)
+
+    data = read(args.data).iloc[:, 1:]
+    lgbm = joblib.load(args.model)
+    engines = [('lightgbm', lgbm)]
+    for engine in (['numba'] if numba is not None else []) + ['numpy']:
+        predictor = CompiledPredictor.from_model(lgbm, engine=engine)
+        # Compilation is paid at startup by the API, not measured here
+        predictor.predict_proba(data.iloc[:1])
+        engines.append((engine, predictor))
+
+    rng = np.random.default_rng(42)
+    rows = []
+    for batch_size in args.batch_sizes:
+        batch_size = min(batch_size, len(data))
+        # Large batches are slow with the wrapper, fewer repeats keep the report short
+        repeats = args.repeats if batch_size <= 10 else max(10, args.repeats // 10)
+        starts = rng.integers(0, len(data) - batch_size + 1, repeats)
+        batches = [data.iloc[start:start + batch_size] for start in starts]
+        for name, model in engines:
+            latencies = measure(model.predict_proba, batches)
+            rows.append({
+                'engine': name,
+                'batch size': batch_size,
+                'p50 (ms)': round(np.percentile(latencies, 50), 3),
+                'p99 (ms)': round(np.percentile(latencies, 99), 3),
+                'rows/s': int(batch_size / np.median(latencies) * 1000)
+            })
+
+    print(f'{len(data)} clients, {data.shape[1]} features, {lgbm.booster_.num_trees()} trees\n')
+    print(pd.DataFrame(rows).to_string(index=False))
+
+if __name__ == '__main__':
+    main()
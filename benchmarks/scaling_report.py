@@ -0,0 +1,154 @@
+'''
+How startup (per stage), memory and endpoint latency grow with the number of clients: a synthetic dataset is
+generated for every size, then the API is started twice in a fresh process, a cold boot which builds and
+publishes the derived data (snapshots, preprocessing, feature store, neighbor index) and a warm boot which
+attaches to it, where the endpoints are measured
+
+Usage: python benchmarks/scaling_report.py [--sizes 5000 50000 500000] [--reference data/processed]
+                                           [--output scaling.json]
+'''
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+import pandas as pd
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(BENCHMARKS_DIR, '..', 'api')
+sys.path.insert(0, API_DIR)
+from synthetic import infer_schemas, model_columns, write_dataset
+
+ENDPOINTS = [
+    '/api/clients',
+    '/api/clients/{id}/personal_information',
+    '/api/clients/{id}/prediction',
+    '/api/clients/{id}/prediction/shap/local',
+    '/api/clients/{id}/prediction/neighbors',
+    '/api/clients/{id}/prediction/neighbors/statistics',
+    '/api/statistics/distributions/ages',
+    '/api/statistics/total_incomes',
+]
+
+def resident_memory():
+    '''Current resident memory of the process in MB'''
+    with open('/proc/self/statm') as file:
+        return int(file.read().split()[1])*os.sysconf('SC_PAGE_SIZE') / 2**20
+
+def boot(data_dir, n_requests, concurrency, measure_endpoints):
+    '''
+    Start the API in this process on a dataset and get its startup stages, memory and endpoint latencies
+    '''
+    os.environ['DATA_PATH'] = data_dir
+    os.environ['PREPROCESSING_PATH'] = os.path.join(data_dir, 'preprocessing')
+    os.environ.setdefault('SHAP_BACKFILL', 'false')
+    os.chdir(API_DIR)
+    warnings.filterwarnings('ignore', category=UserWarning)
+
+    start = time.perf_counter()
+    import main as api
+    report = {'startup': time.perf_counter() - start, 'stages': api.startup_timings.durations,
+              'rssMB': resident_memory(), 'peakRssMB': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+    if measure_endpoints:
+        from api_benchmark import run
+        import httpx
+
+        async def first_global_shap():
+            # The shap values of every client are computed by the first request of global importances
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url='http://scaling') as client:
+                start = time.perf_counter()
+                await client.get(f'/api/clients/{api.client_index.ids[0]}/prediction/shap/global')
+                return time.perf_counter() - start
+
+        report['stages']['shapMatrix'] = asyncio.run(first_global_shap())
+        report['endpoints'] = asyncio.run(run(api.app, api.client_index.ids, ENDPOINTS, n_requests, concurrency,
+                                              warm_up=5, rounds=1, seed=0))
+        report['rssAfterRequestsMB'] = resident_memory()
+    return report
+
+def measure_size(data_dir, args):
+    '''Cold and warm boots of the API on a dataset, each in a fresh process'''
+    reports = {}
+    for name in ['cold', 'warm']:
+        output = os.path.join(data_dir, f'report_{name}.json')
+        command = [sys.executable, os.path.abspath(__file__), '--boot', data_dir, '--boot-output', output,
+                   '--requests', str(args.requests), '--concurrency', str(args.concurrency)]
+        if name == 'cold':
+            command.append('--no-endpoints')
+        subprocess.run(command, check=True)
+        with open(output) as file:
+            reports[name] = json.load(file)
+    return reports
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5000, 50000])
+    parser.add_argument('--current-ratio', type=float, default=0.6,
+                        help='Current clients (train extract) generated per client to predict')
+    parser.add_argument('--reference', help='Folder of the processed csv files to learn the schema from, '
+                                            'the columns of the model are filled with rules otherwise')
+    parser.add_argument('--model', default=os.path.join(BENCHMARKS_DIR, '..', 'models', 'lightgbm_classifier.pkl'))
+    parser.add_argument('--data-dir', help='Folder of the generated datasets, temporary by default')
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--output', help='Write the full report as json')
+    # Internal: boot the API on one dataset in this process
+    parser.add_argument('--boot', help=argparse.SUPPRESS)
+    parser.add_argument('--boot-output', help=argparse.SUPPRESS)
+    parser.add_argument('--no-endpoints', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.boot:
+        report = boot(args.boot, args.requests, args.concurrency, not args.no_endpoints)
+        with open(args.boot_output, 'w') as file:
+            json.dump(report, file)
+        return
+
+    root = args.data_dir or tempfile.mkdtemp(prefix='scaling_report_')
+    schemas = infer_schemas(args.reference) if args.reference else None
+    columns = model_columns(args.model) if schemas is None else None
+
+    reports = {}
+    try:
+        for size in args.sizes:
+            data_dir = os.path.abspath(os.path.join(root, str(size)))
+            start = time.perf_counter()
+            write_dataset(data_dir, size, round(size*args.current_ratio), columns=columns, schemas=schemas)
+            print(f'{size} clients generated in {time.perf_counter() - start:.1f} s', flush=True)
+            reports[size] = measure_size(data_dir, args)
+    finally:
+        if args.data_dir is None:
+            shutil.rmtree(root, ignore_errors=True)
+
+    rows = []
+    for size, boots in reports.items():
+        for name, report in boots.items():
+            rows.append({'clients': size, 'boot': name, 'startup': report['startup'],
+                         **report['stages'], 'rssMB': report['rssMB'], 'peakRssMB': report['peakRssMB']})
+    print('\nStartup stages (s) and memory (MB)')
+    print(pd.DataFrame(rows).round(2).to_string(index=False))
+
+    rows = []
+    for path in ENDPOINTS:
+        row = {'endpoint': path}
+        for size, boots in reports.items():
+            latencies = boots['warm']['endpoints'][path]
+            row[f'p50 {size}'] = latencies['p50']
+            row[f'p95 {size}'] = latencies['p95']
+        rows.append(row)
+    print('\nEndpoint latency (ms), warm boot')
+    print(pd.DataFrame(rows).round(2).to_string(index=False))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'sizes': args.sizes, 'reports': reports}, file, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+'''
+Latency of the shap values from LightGBM contributions against the pickled shap TreeExplainer, per batch size
+
+Usage: python benchmarks/shap_report.py [--data data/processed/test_feature_engineering_encoded.csv.gz] [--repeats 100]
+'''
+import argparse
+import os
+import sys
+import time
+import warnings
+import joblib
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+from explanations import NativeExplainer
+from preprocessing import read
+
+def measure(explain, batches):
+    '''Explain every batch and get the latencies in ms'''
+    latencies = []
+    for batch in batches:
+        start = time.perf_counter()
+        explain(batch)
+        latencies.append(1000*(time.perf_counter() - start))
+    return np.array(latencies)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', default='data/processed/test_feature_engineering_encoded.csv.gz')
+    parser.add_argument('--model', default='models/lightgbm_classifier.pkl')
+    parser.add_argument('--explainer', default='models/lightgbm_shap_explainer.pkl')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 10, 1000])
+    parser.add_argument('--repeats', type=int, default=100)
+    args = parser.parse_args()
+    # shap and LightGBM warn on every call
+    warnings.filterwarnings('ignore')
+
+    data = read(args.data).iloc[:, 1:]
+    engines = [('explainer', joblib.load(args.explainer)), ('native', NativeExplainer(joblib.load(args.model)))]
+
+    rng = np.random.default_rng(42)
+    rows = []
+    for batch_size in args.batch_sizes:
+        batch_size = min(batch_size, len(data))
+        repeats = args.repeats if batch_size <= 10 else max(10, args.repeats // 10)
+        starts = rng.integers(0, len(data) - batch_size + 1, repeats)
+        batches = [data.iloc[start:start + batch_size] for start in starts]
+        for name, explainer in engines:
+            latencies = measure(explainer.shap_values, batches)
+            rows.append({
+                'engine': name,
+                'batch size': batch_size,
+                'p50 (ms)': round(np.percentile(latencies, 50), 3),
+                'p99 (ms)': round(np.percentile(latencies, 99), 3),
+                'rows/s': int(batch_size / np.median(latencies) * 1000)
+            })
+
+    print(f'{len(data)} clients, {data.shape[1]} features\n')
+    print(pd.DataFrame(rows).to_string(index=False))
+
+if __name__ == '__main__':
+    main()
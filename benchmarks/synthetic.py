@@ -0,0 +1,273 @@
+'''
+Synthetic clients with the columns of the encoded csv files, so that the API can be benchmarked without the
+real data and at any number of clients. With --reference, the distributions, one-hot groups and correlations
+are learnt from the processed csv files, otherwise the columns of the model are filled with simple rules
+
+Usage: python benchmarks/synthetic.py <output folder> [--clients 5000] [--current-clients 3000]
+                                      [--reference data/processed]
+'''
+import argparse
+import gzip
+import os
+import re
+import joblib
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+# Prefixes of the one-hot encoded categorical columns, exactly one column of a group is set per client
+CATEGORICAL_PREFIXES = ['NAME_TYPE_SUITE', 'NAME_INCOME_TYPE', 'NAME_EDUCATION_TYPE',
+                        'NAME_FAMILY_STATUS', 'NAME_HOUSING_TYPE', 'OCCUPATION_TYPE', 'WEEKDAY_APPR_PROCESS_START',
+                        'ORGANIZATION_TYPE', 'FONDKAPREMONT_MODE', 'HOUSETYPE_MODE', 'WALLSMATERIAL_MODE']
+# Prefixes of the 0/1 columns
+BINARY_PREFIXES = ('FLAG_', 'REG_', 'LIVE_', 'CODE_GENDER', 'NAME_CONTRACT_TYPE', 'EMERGENCYSTATE_MODE')
+# Columns read by the endpoints, never missing
+REQUIRED = ['CODE_GENDER', 'CNT_CHILDREN', 'FLAG_OWN_CAR', 'FLAG_OWN_REALTY', 'DAYS_BIRTH', 'AMT_INCOME_TOTAL', 'AMT_CREDIT',
+            'AMT_ANNUITY']
+MISSING_RATE = 0.05
+# Ratios computed by the feature engineering, kept exact: column, numerator, denominator
+RATIOS = [('PAYMENT_RATE', 'AMT_ANNUITY', 'AMT_CREDIT'),
+          ('CREDIT_INCOME_PERCENT', 'AMT_CREDIT', 'AMT_INCOME_TOTAL'),
+          ('ANNUITY_INCOME_PERCENT', 'AMT_ANNUITY', 'AMT_INCOME_TOTAL'),
+          ('INCOME_PER_PERSON', 'AMT_INCOME_TOTAL', 'CNT_FAM_MEMBERS')]
+FILES = {'clients': 'test_feature_engineering_encoded.csv.gz',
+         'currentClients': 'train_feature_engineering_encoded_extract.csv.gz'}
+
+def one_hot_groups(columns):
+    '''Group the one-hot encoded columns by categorical prefix'''
+    pattern = re.compile('^(' + '|'.join(CATEGORICAL_PREFIXES) + ')_')
+    groups = {}
+    for column in columns:
+        match = pattern.match(column)
+        if match:
+            groups.setdefault(match.group(1), []).append(column)
+    return groups
+
+def generate(columns, n_clients, first_id=100001, target=False, seed=0):
+    '''
+    Generate clients with the given feature columns, the id first (and the TARGET with target=True)
+    '''
+    rng = np.random.default_rng(seed)
+    groups = one_hot_groups(columns)
+    one_hot = {column for group in groups.values() for column in group}
+
+    values = {}
+    for column in columns:
+        if column in one_hot:
+            continue
+        if column.startswith(BINARY_PREFIXES):
+            values[column] = rng.integers(0, 2, n_clients).astype(float)
+        elif column.startswith('DAYS_'):
+            values[column] = -rng.uniform(100, 25000, n_clients)
+        elif column.startswith('AMT_'):
+            values[column] = rng.lognormal(11, 0.6, n_clients)
+        elif column.startswith('EXT_SOURCE'):
+            values[column] = rng.uniform(0, 1, n_clients)
+        elif column.startswith('CNT_'):
+            values[column] = rng.poisson(0.5, n_clients).astype(float)
+        else:
+            values[column] = rng.normal(0, 1, n_clients)
+
+    if {'AMT_CREDIT', 'AMT_ANNUITY'} <= values.keys():
+        values['AMT_ANNUITY'] = values['AMT_CREDIT'] / rng.uniform(10, 40, n_clients)
+    for column, numerator, denominator in RATIOS[:3]:
+        if column in values and {numerator, denominator} <= values.keys():
+            values[column] = values[numerator] / values[denominator]
+
+    for group in groups.values():
+        category = rng.integers(0, len(group), n_clients)
+        for position, column in enumerate(group):
+            values[column] = (category == position).astype(float)
+
+    data = pd.DataFrame({column: values[column] for column in columns})
+    missing = rng.random(data.shape) < MISSING_RATE
+    missing[:, [position for position, column in enumerate(columns) if column in REQUIRED or column in one_hot]] = False
+    data = data.mask(missing)
+
+    data.insert(0, 'SK_ID_CURR', np.arange(first_id, first_id + n_clients))
+    if target:
+        data.insert(1, 'TARGET', (rng.random(n_clients) < 0.08).astype(int))
+    return data
+
+def detect_one_hot_groups(data, min_size=2):
+    '''
+    Find the one-hot groups of encoded data: columns only holding 0 and 1, sharing a prefix (cut at an
+    underscore), of which at most one is set per row. The shortest valid prefix wins: NAME_FAMILY_STATUS_Married
+    is not grouped under NAME_ as other NAME_ columns are set on the same rows
+    '''
+    values = data.to_numpy(dtype=np.float64)
+    finite = np.where(np.isnan(values), 0, values)
+    is_binary = np.isin(finite, [0, 1]).all(axis=0)
+    binary = {column: position for position, column in enumerate(data.columns) if is_binary[position]}
+
+    groups = {}
+    grouped = set()
+    for column in binary:
+        if column in grouped:
+            continue
+        parts = column.split('_')
+        for length in range(1, len(parts)):
+            prefix = '_'.join(parts[:length]) + '_'
+            members = [other for other in binary if other.startswith(prefix) and other not in grouped]
+            if len(members) >= min_size and finite[:, [binary[other] for other in members]].sum(axis=1).max() <= 1:
+                # Named by the longest prefix shared by the members, NAME_FAMILY_STATUS rather than NAME_FAMILY
+                common = os.path.commonprefix(members)
+                groups[common[:common.rindex('_')]] = members
+                grouped.update(members)
+                break
+    return groups
+
+class ClientSchema:
+    '''
+    Columns of encoded clients learnt from a sample of them: the distribution of every column (quantiles and
+    share of missing values), the one-hot groups (frequency of every category, at most one column set) and the
+    rank correlations between all of them. New clients are drawn with a gaussian copula, which keeps the
+    marginals, the correlations and the patterns of missing values (e.g. the bureau columns missing together)
+    '''
+    def __init__(self, columns, variables, correlation):
+        self.columns = list(columns)
+        self.variables = variables
+        self.correlation = correlation
+        # Correlation is clipped to a positive definite matrix before being factorized
+        eigenvalues, eigenvectors = np.linalg.eigh(correlation)
+        covariance = (eigenvectors * np.maximum(eigenvalues, 1e-6)) @ eigenvectors.T
+        scale = np.sqrt(np.diag(covariance))
+        self.factor = np.linalg.cholesky(covariance / np.outer(scale, scale))
+
+    @classmethod
+    def infer(cls, data, n_points=1001, max_categories=50):
+        '''
+        Learn the schema of encoded clients, the id column is left out. A column with at most max_categories
+        values is drawn among them, the others are interpolated between n_points quantiles
+        '''
+        data = data.drop(columns=['SK_ID_CURR'], errors='ignore')
+        groups = detect_one_hot_groups(data)
+        grouped = {column for members in groups.values() for column in members}
+
+        variables = []
+        codes = []
+        for column in data.columns:
+            if column in grouped:
+                continue
+            values = data[column].to_numpy(dtype=np.float64)
+            finite = values[np.isfinite(values)]
+            variable = {'kind': 'column', 'column': column, 'missing': 1 - len(finite) / len(values)}
+            if len(finite) == 0:
+                variable.update(discrete=True, points=np.array([np.nan]))
+            elif len(np.unique(finite)) <= max_categories:
+                variable.update(discrete=True, points=np.quantile(finite, (np.arange(n_points) + 0.5) / n_points,
+                                                                  method='inverted_cdf'))
+            else:
+                variable.update(discrete=False, points=np.quantile(finite, np.linspace(0, 1, n_points)),
+                                integral=bool((finite == np.round(finite)).all()))
+            variables.append(variable)
+            # Missing values rank last, as they are drawn from the top of the distribution
+            codes.append(np.where(np.isfinite(values), values, np.inf))
+
+        for prefix, members in groups.items():
+            is_set = data[members].fillna(0).to_numpy() == 1
+            category = np.where(is_set.any(axis=1), is_set.argmax(axis=1), len(members))
+            frequencies = np.bincount(category, minlength=len(members) + 1) / len(category)
+            # Categories ordered by frequency, rows of no category (missing category) last
+            order = np.concatenate([np.argsort(-frequencies[:-1], kind='stable'), [len(members)]])
+            variables.append({'kind': 'group', 'prefix': prefix, 'columns': members, 'order': order,
+                              'cumulative': np.cumsum(frequencies[order])})
+            codes.append(np.argsort(order)[category].astype(np.float64))
+
+        # Rank correlation, computed as the correlation of the normal scores
+        ranks = stats.rankdata(np.column_stack(codes), axis=0)
+        scores = stats.norm.ppf((ranks - 0.5) / len(data))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            correlation = np.corrcoef(scores, rowvar=False)
+        correlation = np.nan_to_num(np.atleast_2d(correlation))
+        np.fill_diagonal(correlation, 1)
+        return cls(data.columns, variables, correlation)
+
+    def sample(self, n_clients, rng):
+        '''Draw clients, with the columns in the order of the reference data'''
+        uniforms = stats.norm.cdf(rng.standard_normal((n_clients, len(self.variables))) @ self.factor.T)
+        values = {}
+        for variable, u in zip(self.variables, uniforms.T):
+            if variable['kind'] == 'group':
+                category = variable['order'][np.minimum(np.searchsorted(variable['cumulative'], u, side='right'),
+                                                        len(variable['order']) - 1)]
+                for position, column in enumerate(variable['columns']):
+                    values[column] = (category == position).astype(np.float64)
+                continue
+            points = variable['points']
+            is_missing = u >= 1 - variable['missing']
+            position = np.clip(u / max(1 - variable['missing'], 1e-12), 0, 1)*(len(points) - 1)
+            if variable['discrete']:
+                column = points[np.round(position).astype(int)]
+            else:
+                column = np.interp(position, np.arange(len(points)), points)
+                if variable['integral']:
+                    column = np.round(column)
+            values[variable['column']] = np.where(is_missing, np.nan, column)
+
+        for column, numerator, denominator in RATIOS:
+            if column in values and numerator in values and denominator in values:
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    values[column] = values[numerator] / values[denominator]
+        return pd.DataFrame({column: values[column] for column in self.columns})
+
+    def generate(self, n_clients, first_id=100001, seed=0):
+        '''Draw clients with the id as first column'''
+        data = self.sample(n_clients, np.random.default_rng(seed))
+        data.insert(0, 'SK_ID_CURR', np.arange(first_id, first_id + n_clients))
+        return data
+
+def infer_schemas(reference_dir, n_rows=5000):
+    '''Learn the schema of the clients to predict and of the current clients from the processed csv files'''
+    return {name: ClientSchema.infer(pd.read_csv(os.path.join(reference_dir, file), nrows=n_rows))
+            for name, file in FILES.items()}
+
+def write_clients(path, generate, n_clients, first_id, seed=0, chunk_size=20000):
+    '''
+    Write generate(n, first_id, seed) clients to a csv.gz file by chunks, so that memory stays bounded at any size
+    '''
+    with gzip.open(path, 'wt', compresslevel=1) as file:
+        for chunk, start in enumerate(range(0, n_clients, chunk_size)):
+            data = generate(min(chunk_size, n_clients - start), first_id + start, seed + chunk)
+            data.to_csv(file, header=chunk == 0, index=False)
+
+def write_dataset(output_dir, n_clients, n_current_clients, seed=0, columns=None, schemas=None):
+    '''
+    Write the clients to predict and the extract of current clients, named as the processed csv files: drawn
+    from the schemas learnt by infer_schemas, or filled with rules for the given feature columns
+    '''
+    os.makedirs(output_dir, exist_ok=True)
+    if schemas is not None:
+        generators = {name: schema.generate for name, schema in schemas.items()}
+    else:
+        generators = {'clients': lambda n, first_id, seed: generate(columns, n, first_id, seed=seed),
+                      'currentClients': lambda n, first_id, seed: generate(columns, n, first_id, target=True, seed=seed)}
+    write_clients(os.path.join(output_dir, FILES['clients']), generators['clients'], n_clients, 100001, seed)
+    # Current clients get other ids, seeds are offset so that chunks of both files differ
+    write_clients(os.path.join(output_dir, FILES['currentClients']), generators['currentClients'], n_current_clients,
+                  100001 + n_clients, seed + 100003)
+
+def model_columns(model_path):
+    '''Feature columns of the encoded csv files, in the order the model was trained on'''
+    return list(joblib.load(model_path).feature_name_)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('output_dir')
+    parser.add_argument('--model', default='models/lightgbm_classifier.pkl')
+    parser.add_argument('--reference', help='Folder of the processed csv files to learn the schema from')
+    parser.add_argument('--reference-rows', type=int, default=5000)
+    parser.add_argument('--clients', type=int, default=5000)
+    parser.add_argument('--current-clients', type=int, default=3000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.reference:
+        write_dataset(args.output_dir, args.clients, args.current_clients, args.seed,
+                      schemas=infer_schemas(args.reference, args.reference_rows))
+    else:
+        write_dataset(args.output_dir, args.clients, args.current_clients, args.seed,
+                      columns=model_columns(args.model))
+
+if __name__ == '__main__':
+    main()
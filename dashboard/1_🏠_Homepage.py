@@ -1,94 +1,30 @@
 import streamlit as st
-import requests
 import matplotlib.pyplot as plt
 import pandas as pd
 import numpy as np
-import os
-
-API_ADDRESS = 'http://' + str(os.environ['AWS_PUBLIC_IP_ADDRESS_API'])
+from api_client import get_api_client, show_errors, show_latencies
 
 # API
 @st.cache_data  
-def get_genders():
-    response = requests.get(API_ADDRESS + '/api/statistics/genders')
-    if response.status_code == 200: 
-        data = response.json()
-        return data 
-    else:
-        st.error('Failed to get clients')
-        return None
-@st.cache_data      
-def get_ages():
-    response = requests.get(API_ADDRESS + '/api/statistics/ages')
-    if response.status_code == 200: 
-        data = response.json()
-        return data 
-    else:
-        st.error('Failed to get clients')
-        return None
-@st.cache_data      
-def get_loan():
-    response = requests.get(API_ADDRESS + '/api/statistics/loans')
-    if response.status_code == 200: 
-        data = response.json()
-        return data 
-    else:
-        st.error('Failed to get clients')
-        return None
-@st.cache_data      
-def get_incomes():
-    response = requests.get(API_ADDRESS + '/api/statistics/total_incomes')
-    if response.status_code == 200:
-        data = response.json()
-        return data
-    else:
-        st.error('Failed to get clients')
-        return None
-@st.cache_data      
-def get_credits():
-    response = requests.get(API_ADDRESS + '/api/statistics/credits')
-    if response.status_code == 200:
-        data = response.json()
-        return data
-    else:
-        st.error('Failed to get clients')
-        return None
-@st.cache_data  
-def get_length_loan():
-    response = requests.get(API_ADDRESS + '/api/statistics/length_loan')
-    if response.status_code == 200:
-        data = response.json()
-        return data
-    else:
-        st.error('Failed to get clients')
-        return None
-@st.cache_data      
-def get_payment_rate():
-    response = requests.get(API_ADDRESS + '/api/statistics/payment_rate')
-    if response.status_code == 200:
-        data = response.json()
-        return data
-    else:
-        st.error('Failed to get clients')
-        return None
+def get_statistics():
+    '''
+    Statistics of the homepage, downloaded concurrently
+    '''
+    return get_api_client().get_many({
+        'genders': ('/api/statistics/genders/counts', None),
+        'loans': ('/api/statistics/loans', None),
+        'incomes': ('/api/statistics/distributions/total_incomes', {'bins': 20, 'log': True}),
+        'credits': ('/api/statistics/distributions/credits', {'bins': 20, 'log': True}),
+        'lengthLoan': ('/api/statistics/distributions/length_loan', {'bins': 20}),
+        'paymentRate': ('/api/statistics/distributions/payment_rate', {'bins': 20})
+    })
 
 # Plotting functions
 @st.cache_data  
 def plot_gender(data: dict):
 
-    categories = {
-        ('M', 'repaid'): 0, 
-        ('M', 'defaulted'): 0, 
-        ('F', 'repaid'): 0, 
-        ('F', 'defaulted'): 0
-    }
-
-    for key, value in data.items():
-        gender, status = value
-        categories[(gender, status)] += 1
-
     gender_status = [('M', 'repaid'), ('M', 'defaulted'), ('F', 'repaid'), ('F', 'defaulted')]
-    counts = [categories[cat] for cat in gender_status]
+    counts = [data[gender][status] for gender, status in gender_status]
     colors = ['skyblue', 'lightcoral', 'skyblue', 'lightcoral']
 
     bar_width = 0.35
@@ -113,21 +49,6 @@ def plot_gender(data: dict):
 
     st.pyplot(fig, use_container_width=True)
 
-@st.cache_data  
-def plot_ages(data: dict):
-
-    fig, ax = plt.subplots()
-    ax.hist(data.values(), bins=10)
-    ax.set_xlabel('Ages')
-    ax.set_ylabel('Number of clients')
-
-    ax.spines['top'].set_visible(False)
-    ax.spines['right'].set_visible(False)
-    ax.spines['left'].set_visible(False)
-    ax.spines['bottom'].set_visible(False)
-
-    st.pyplot(fig, use_container_width=True)
-
 @st.cache_data  
 def plot_loan(data: dict):
 
@@ -146,144 +67,40 @@ def plot_loan(data: dict):
     st.pyplot(fig, use_container_width=True)
 
 @st.cache_data  
-def plot_total_incomes(data: dict):
-
-    incomes_defaulted = [int(value[0]) for value in data.values() if value[1] == 'defaulted']
-    incomes_repaid = [int(value[0]) for value in data.values() if value[1] == 'repaid']
-
-    log_incomes_defaulted = np.log10(incomes_defaulted)
-    log_incomes_repaid = np.log10(incomes_repaid)
-
-    mean_val_defaulted, mean_val_repaid = np.mean(incomes_defaulted), np.mean(incomes_repaid)
-    median_val_defaulted, median_val_repaid = np.median(incomes_defaulted), np.median(incomes_repaid)
-    max_val_defaulted, max_val_repaid = np.max(incomes_defaulted), np.max(incomes_repaid)
-    min_val_defaulted, min_val_repaid = np.min(incomes_defaulted), np.min(incomes_repaid)
-
-    fig, axs = plt.subplots(2, 1, figsize=(8, 6))
-
-    axs[0].hist(log_incomes_defaulted, bins=20, color='lightcoral', alpha=0.7)
-    axs[1].hist(log_incomes_repaid, bins=20, color='skyblue', alpha=0.7)
-
-    axs[0].set_xticks(np.arange(min(log_incomes_defaulted), max(log_incomes_defaulted)), [f"{10**val:.0f}" for val in np.arange(min(log_incomes_defaulted), max(log_incomes_defaulted))])
-    axs[1].set_xticks(np.arange(min(log_incomes_repaid), max(log_incomes_repaid)), [f"{10**val:.0f}" for val in np.arange(min(log_incomes_repaid), max(log_incomes_repaid))])
-
-    axs[0].text(0.05, 0.9, 'Defaulted', transform=axs[0].transAxes, fontsize=10, color='red')
-    axs[1].text(0.05, 0.9, 'Repaid', transform=axs[1].transAxes, fontsize=10, color='blue')
-
-    axs[0].axvline(np.log10(mean_val_defaulted), color='red', linestyle='dashed', linewidth=1, label=f'Mean: {round(mean_val_defaulted)}')
-    axs[0].axvline(np.log10(median_val_defaulted), color='green', linestyle='dashed', linewidth=1, label=f'Median: {round(median_val_defaulted)}')
-    axs[0].axvline(np.log10(max_val_defaulted), color='orange', linestyle='dashed', linewidth=1, label=f'Max: {round(max_val_defaulted)}')
-    axs[0].axvline(np.log10(min_val_defaulted), color='purple', linestyle='dashed', linewidth=1, label=f'Min: {round(min_val_defaulted)}')
-    
-    axs[1].axvline(np.log10(mean_val_repaid), color='red', linestyle='dashed', linewidth=1, label=f'Mean: {round(mean_val_repaid)}')
-    axs[1].axvline(np.log10(median_val_repaid), color='green', linestyle='dashed', linewidth=1, label=f'Median: {round(median_val_repaid)}')
-    axs[1].axvline(np.log10(max_val_repaid), color='orange', linestyle='dashed', linewidth=1, label=f'Max: {round(max_val_repaid)}')
-    axs[1].axvline(np.log10(min_val_repaid), color='purple', linestyle='dashed', linewidth=1, label=f'Min: {round(min_val_repaid)}')
-    
-    for i in [0, 1]: 
-        axs[i].spines['top'].set_visible(False)
-        axs[i].spines['right'].set_visible(False)
-        axs[i].spines['left'].set_visible(False)
-        axs[i].spines['bottom'].set_visible(False)
-
-    axs[0].legend()
-    axs[1].legend()
-
-    plt.tight_layout()
-
-    st.pyplot(fig, use_container_width=True)
-
-@st.cache_data  
-def plot_total_length_loan(data: dict):
-
-    length_defaulted = []
-    length_repaid = []
-
-    for value_list in data.values():
-        credit = value_list[0]
-        annuity = value_list[1]
-        target = value_list[2]
-
-        if target == 'defaulted': 
-            if annuity != 0:
-                length_defaulted.append(int(12*credit / annuity))
-        elif annuity != 'repaid':
-            if annuity != 0:
-                length_repaid.append(int(12*credit / annuity))
-
-    mean_val_defaulted, mean_val_repaid = np.mean(length_defaulted), np.mean(length_repaid)
-    median_val_defaulted, median_val_repaid = np.median(length_defaulted), np.median(length_repaid)
-    max_val_defaulted, max_val_repaid = np.max(length_defaulted), np.max(length_repaid)
-    min_val_defaulted, min_val_repaid = np.min(length_defaulted), np.min(length_repaid)
+def plot_distribution(data: dict, log: bool = False, decimals: int = 0, suffix: str = ''):
+    '''
+    Plot the histogram, mean, median, max and min computed by the API for defaulted and repaid clients
+    '''
+    scale = np.log10 if log else (lambda value: value)
+    label = lambda value: f'{round(value, decimals) if decimals else round(value)}{suffix}'
 
     fig, axs = plt.subplots(2, 1, figsize=(8, 6))
 
-    axs[0].hist(length_defaulted, bins=20, color='lightcoral', alpha=0.7)
-    axs[1].hist(length_repaid, bins=20, color='skyblue', alpha=0.7)
-
-    axs[0].text(0.05, 0.9, 'Defaulted', transform=axs[0].transAxes, fontsize=10, color='red')
-    axs[1].text(0.05, 0.9, 'Repaid', transform=axs[1].transAxes, fontsize=10, color='blue')
-
-    axs[0].axvline(mean_val_defaulted, color='red', linestyle='dashed', linewidth=1, label=f'Mean: {round(mean_val_defaulted)}')
-    axs[0].axvline(median_val_defaulted, color='green', linestyle='dashed', linewidth=1, label=f'Median: {round(median_val_defaulted)}')
-    axs[0].axvline(max_val_defaulted, color='orange', linestyle='dashed', linewidth=1, label=f'Max: {round(max_val_defaulted)}')
-    axs[0].axvline(min_val_defaulted, color='purple', linestyle='dashed', linewidth=1, label=f'Min: {round(min_val_defaulted)}')
-    
-    axs[1].axvline(mean_val_repaid, color='red', linestyle='dashed', linewidth=1, label=f'Mean: {round(mean_val_repaid)}')
-    axs[1].axvline(median_val_repaid, color='green', linestyle='dashed', linewidth=1, label=f'Median: {round(median_val_repaid)}')
-    axs[1].axvline(max_val_repaid, color='orange', linestyle='dashed', linewidth=1, label=f'Max: {round(max_val_repaid)}')
-    axs[1].axvline(min_val_repaid, color='purple', linestyle='dashed', linewidth=1, label=f'Min: {round(min_val_repaid)}')
-    
-    for i in [0, 1]: 
-        axs[i].spines['top'].set_visible(False)
-        axs[i].spines['right'].set_visible(False)
-        axs[i].spines['left'].set_visible(False)
-        axs[i].spines['bottom'].set_visible(False)
-
-    axs[0].legend()
-    axs[1].legend()
+    for ax, status, color, text_color in [(axs[0], 'defaulted', 'lightcoral', 'red'), (axs[1], 'repaid', 'skyblue', 'blue')]:
+        info = data[status]
+        if info['count'] == 0:
+            continue
 
-    plt.tight_layout()
+        edges = scale(np.array(info['edges']))
+        ax.stairs(info['counts'], edges, fill=True, color=color, alpha=0.7)
 
-    st.pyplot(fig, use_container_width=True)
+        if log:
+            ticks = np.arange(edges[0], edges[-1])
+            ax.set_xticks(ticks, [f"{10**val:.0f}" for val in ticks])
 
-@st.cache_data  
-def plot_total_payment_rates(data: dict):
-
-    rate_defaulted = [value[0] for value in data.values() if value[1] == 'defaulted']
-    rate_repaid = [value[0] for value in data.values() if value[1] == 'repaid']
+        ax.text(0.05, 0.9, status.capitalize(), transform=ax.transAxes, fontsize=10, color=text_color)
 
-    mean_val_defaulted, mean_val_repaid = np.mean(rate_defaulted), np.mean(rate_repaid)
-    median_val_defaulted, median_val_repaid = np.median(rate_defaulted), np.median(rate_repaid)
-    max_val_defaulted, max_val_repaid = np.max(rate_defaulted), np.max(rate_repaid)
-    min_val_defaulted, min_val_repaid = np.min(rate_defaulted), np.min(rate_repaid)
+        ax.axvline(scale(info['mean']), color='red', linestyle='dashed', linewidth=1, label=f"Mean: {label(info['mean'])}")
+        ax.axvline(scale(info['median']), color='green', linestyle='dashed', linewidth=1, label=f"Median: {label(info['median'])}")
+        ax.axvline(scale(info['max']), color='orange', linestyle='dashed', linewidth=1, label=f"Max: {label(info['max'])}")
+        ax.axvline(scale(info['min']), color='purple', linestyle='dashed', linewidth=1, label=f"Min: {label(info['min'])}")
 
-    fig, axs = plt.subplots(2, 1, figsize=(8, 6))
+        ax.spines['top'].set_visible(False)
+        ax.spines['right'].set_visible(False)
+        ax.spines['left'].set_visible(False)
+        ax.spines['bottom'].set_visible(False)
 
-    axs[0].hist(rate_defaulted, bins=20, color='lightcoral', alpha=0.7)
-    axs[1].hist(rate_repaid, bins=20, color='skyblue', alpha=0.7)
-
-    axs[0].text(0.05, 0.9, 'Defaulted', transform=axs[0].transAxes, fontsize=10, color='red')
-    axs[1].text(0.05, 0.9, 'Repaid', transform=axs[1].transAxes, fontsize=10, color='blue')
-
-    axs[0].axvline(mean_val_defaulted, color='red', linestyle='dashed', linewidth=1, label=f'Mean: {round(mean_val_defaulted, 2)}%')
-    axs[0].axvline(median_val_defaulted, color='green', linestyle='dashed', linewidth=1, label=f'Median: {round(median_val_defaulted, 2)}%')
-    axs[0].axvline(max_val_defaulted, color='orange', linestyle='dashed', linewidth=1, label=f'Max: {round(max_val_defaulted, 2)}%')
-    axs[0].axvline(min_val_defaulted, color='purple', linestyle='dashed', linewidth=1, label=f'Min: {round(min_val_defaulted, 2)}%')
-    
-    axs[1].axvline(mean_val_repaid, color='red', linestyle='dashed', linewidth=1, label=f'Mean: {round(mean_val_repaid, 2)}%')
-    axs[1].axvline(median_val_repaid, color='green', linestyle='dashed', linewidth=1, label=f'Median: {round(median_val_repaid, 2)}%')
-    axs[1].axvline(max_val_repaid, color='orange', linestyle='dashed', linewidth=1, label=f'Max: {round(max_val_repaid, 2)}%')
-    axs[1].axvline(min_val_repaid, color='purple', linestyle='dashed', linewidth=1, label=f'Min: {round(min_val_repaid, 2)}%')
-    
-    for i in [0, 1]: 
-        axs[i].spines['top'].set_visible(False)
-        axs[i].spines['right'].set_visible(False)
-        axs[i].spines['left'].set_visible(False)
-        axs[i].spines['bottom'].set_visible(False)
-
-    axs[0].legend()
-    axs[1].legend()
+        ax.legend()
 
     plt.tight_layout()
 
@@ -298,37 +115,41 @@ st.markdown("<h2 style='text-align: center;'>General statistics about our curren
 st.markdown('')
 st.markdown('')
 
+statistics, calls = get_statistics()
+show_errors(calls)
+show_latencies(calls)
+
 col1, col2 = st.columns(2)
 
 with col1:
     st.markdown('**Distribution of loan repayment**')
-    info = get_loan()
+    info = statistics['loans']
     plot_loan(info)
     st.markdown('\n')
 
     st.markdown('**Distribution of annual incomes:**')
-    info = get_incomes()
-    plot_total_incomes(info)
+    info = statistics['incomes']
+    plot_distribution(info, log=True)
     st.markdown('\n')
 
     st.markdown('**Distribution of length loan in months:**')
-    info = get_length_loan()
-    plot_total_length_loan(info)
+    info = statistics['lengthLoan']
+    plot_distribution(info)
     st.markdown('\n')
 
 with col2:
     st.markdown('**Distribution of gender**')
-    info = get_genders()
+    info = statistics['genders']
     plot_gender(info)
     st.markdown('\n')
 
     st.markdown('**Distribution of credit values:**')
-    info = get_credits()
-    plot_total_incomes(info)
+    info = statistics['credits']
+    plot_distribution(info, log=True)
     st.markdown('\n')
 
     st.markdown('**Distribution of payment rates:**')
-    info = get_payment_rate()
-    plot_total_payment_rates(info)
+    info = statistics['paymentRate']
+    plot_distribution(info, decimals=2, suffix='%')
     st.markdown('\n')
 
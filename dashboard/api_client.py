@@ -0,0 +1,93 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+API_IP_ADDRESS = os.environ.get('AWS_PUBLIC_IP_ADDRESS_API')
+API_ADDRESS = 'http://' + API_IP_ADDRESS if API_IP_ADDRESS else None
+# Seconds to connect and to wait for a response, the first global shap request computes every client
+CONNECT_TIMEOUT = float(os.environ.get('API_CONNECT_TIMEOUT', 3.05))
+READ_TIMEOUT = float(os.environ.get('API_READ_TIMEOUT', 60))
+# Failed connections and gateway errors are retried, waiting 0.3 s, 0.6 s, 1.2 s... between attempts. Read timeouts
+# are not: the API is still working on the request, sending it again would only add duplicate work
+RETRIES = 3
+BACKOFF = 0.3
+# Concurrent calls of a page, also the number of kept-alive connections
+MAX_WORKERS = 8
+
+class Call:
+    '''Outcome of a call to the API: path, status code (None when no response came), latency in ms and error'''
+    __slots__ = ('name', 'path', 'status', 'latency', 'error')
+
+    def __init__(self, name, path, status, latency, error=None):
+        self.name = name
+        self.path = path
+        self.status = status
+        self.latency = latency
+        self.error = error
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+class ApiClient:
+    '''
+    Client of the API shared by the pages of the dashboard: a session keeping its connections alive, with
+    timeouts and retries with exponential backoff, and independent calls sent concurrently from a thread pool
+    '''
+    def __init__(self, address, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), retries=RETRIES, backoff=BACKOFF,
+                 max_workers=MAX_WORKERS):
+        self.address = address.rstrip('/')
+        self.timeout = timeout
+        retry = Retry(total=retries, read=0, backoff_factor=backoff, status_forcelist=[502, 503, 504],
+                      allowed_methods=['GET'], raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='api-client')
+
+    def get(self, path, params=None, name=None):
+        '''Get the json of an endpoint, None if the call failed, with the outcome of the call'''
+        start = time.perf_counter()
+        try:
+            response = self.session.get(self.address + path, params=params, timeout=self.timeout)
+        except requests.RequestException as error:
+            return None, Call(name or path, path, None, 1000*(time.perf_counter() - start), str(error))
+        latency = 1000*(time.perf_counter() - start)
+        if response.status_code != 200:
+            return None, Call(name or path, path, response.status_code, latency, response.text[:200])
+        return response.json(), Call(name or path, path, response.status_code, latency)
+
+    def get_many(self, calls):
+        '''
+        Send independent calls concurrently, given as {name: (path, params)}: get the json of each one (None when
+        it failed) and the outcomes of the calls, in the same order
+        '''
+        futures = {name: self.executor.submit(self.get, path, params, name) for name, (path, params) in calls.items()}
+        results = {name: future.result() for name, future in futures.items()}
+        return {name: data for name, (data, _) in results.items()}, [call for _, call in results.values()]
+
+@st.cache_resource
+def get_api_client(address=API_ADDRESS):
+    '''Client shared by every session and page of the dashboard'''
+    if address is None:
+        raise RuntimeError('Address of the API unknown, set the AWS_PUBLIC_IP_ADDRESS_API environment variable')
+    return ApiClient(address)
+
+def show_errors(calls):
+    for call in calls:
+        if call.status != 200:
+            st.error(f'Failed to get {call.name}')
+
+def show_latencies(calls):
+    '''Debug panel in the sidebar with the latency of the calls made to render the page'''
+    with st.sidebar.expander('API calls'):
+        if calls:
+            st.dataframe(pd.DataFrame([call.as_dict() for call in calls]).round({'latency': 1}), hide_index=True)
+            st.caption(f'{len(calls)} calls, {sum(call.latency for call in calls):.0f} ms in total')
+        else:
+            st.caption('No call made')
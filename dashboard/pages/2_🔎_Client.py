@@ -1,128 +1,42 @@
 import streamlit as st
-import requests
 import matplotlib.pyplot as plt
 import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
 import seaborn as sns 
 import matplotlib.ticker as mtick
-import os
 import plotly.figure_factory as ff
 import plotly.express as px
-
-API_ADDRESS = 'http://' + str(os.environ['AWS_PUBLIC_IP_ADDRESS_API'])
+from api_client import get_api_client, show_errors, show_latencies
 
 # API
-@st.cache_data  
-def get_clients():
-    response = requests.get(API_ADDRESS + '/api/clients')
-    if response.status_code == 200: 
-        data = response.json()
-        clients = data['clientsID']
-        return clients 
-    else:
-        st.error('Failed to get clients')
-        return None
+# Client ids listed per search, typing more digits narrows it
+SEARCH_SIZE = 30
+
+@st.cache_data(ttl=60)
+def search_clients(prefix, repay, scores):
+    '''
+    First clients id starting with the prefix, filtered by predicted repayment and score range when set
+    '''
+    params = {'limit': SEARCH_SIZE}
+    if prefix:
+        params['prefix'] = prefix
+    if repay != 'All':
+        params['repay'] = repay
+    if scores != (0, 1000):
+        params['minScore'], params['maxScore'] = scores
+    return get_api_client().get('/api/clients', params=params, name='clients')
 
 @st.cache_data 
-def get_client_personal_information(id):
-    response = requests.get(API_ADDRESS + f'/api/clients/{id}/personal_information')
-    if response.status_code == 200: 
-        data = response.json()
-        return data
-    else:
-        st.error('Failed to get clients')
-        return None
+def get_client_profile(id):
+    return get_api_client().get(f'/api/clients/{id}/profile', name='profile')
 
-@st.cache_data 
-def get_client_bank_information(id):
-    response = requests.get(API_ADDRESS + f'/api/clients/{id}/bank_information')
-    if response.status_code == 200: 
-        data = response.json()
-        return data
-    else:
-        st.error('Failed to get clients')
-        return None
-
-@st.cache_data 
-def get_client_prediction(id):
-    response = requests.get(API_ADDRESS + f'/api/clients/{id}/prediction')
-    if response.status_code == 200: 
-        data = response.json()
-        return data
-    else:
-        st.error('Failed to get clients')
-        return None
-
-@st.cache_data 
-def get_client_shap_values(id):
-    response = requests.get(API_ADDRESS + f'/api/clients/{id}/prediction/shap/local')
-    if response.status_code == 200: 
-        data = response.json()
-        return data
-    else:
-        st.error('Failed to get clients')
-        return None
-
-@st.cache_data  
-def get_model_shap_values(id):
-    response = requests.get(API_ADDRESS + f'/api/clients/{id}/prediction/shap/global')
-    if response.status_code == 200: 
-        data = response.json()
-        return data
-    else:
-        st.error('Failed to get clients')
-        return None
-
-@st.cache_data 
-def get_neighbors(id):
-    response = requests.get(API_ADDRESS + f'/api/clients/{id}/prediction/neighbors')
-    if response.status_code == 200: 
-        data = response.json()
-        return data
-    else:
-        st.error('Failed to get clients')
-        return None
-
-@st.cache_data 
-def get_neighbors_total_income(id): 
-    response = requests.get(API_ADDRESS + f'/api/clients/{id}/prediction/neighbors/totalIncome')
-    if response.status_code == 200: 
-        data = response.json()
-        return data
-    else:
-        st.error('Failed to get clients')
-        return None
-
-@st.cache_data  
-def get_neighbors_score(id): 
-    response = requests.get(API_ADDRESS + f'/api/clients/{id}/prediction/neighbors/score')
-    if response.status_code == 200: 
-        data = response.json()
-        return data
-    else:
-        st.error('Failed to get clients')
-        return None
-    
-@st.cache_data 
-def get_neighbors_credit_amount(id): 
-    response = requests.get(API_ADDRESS + f'/api/clients/{id}/prediction/neighbors/amtCredit')
-    if response.status_code == 200: 
-        data = response.json()
-        return data
-    else:
-        st.error('Failed to get clients')
-        return None
-    
-@st.cache_data 
-def get_neighbors_loan_duration(id): 
-    response = requests.get(API_ADDRESS + f'/api/clients/{id}/prediction/neighbors/loanLength')
-    if response.status_code == 200: 
-        data = response.json()
-        return data
-    else:
-        st.error('Failed to get clients')
-        return None
+@st.cache_data(ttl=600)
+def get_global_shap(id):
+    '''
+    Global shap values, asked apart from the profile: the first call waits for the shap values of every client
+    '''
+    return get_api_client().get(f'/api/clients/{id}/prediction/shap/global', name='globalShap')
 
 # Plot functions
 def plot_score(value): 
@@ -221,11 +135,37 @@ st.set_page_config(
 st.markdown("<h2 style='text-align: center;'>Client information</h2>", unsafe_allow_html=True)
 st.markdown('')
 
-clients = get_clients()
-if clients: 
-    selected_info = st.selectbox('Select client', clients)
+col1, col2, col3 = st.columns([2, 1, 2])
+with col1:
+    prefix = st.text_input('Search client', placeholder='First digits of the client id').strip()
+with col2:
+    repay = st.selectbox('Loan accepted', ['All', 'Yes', 'No'])
+with col3:
+    scores = st.slider('Credit score', 0, 1000, (0, 1000), step=10)
+
+calls = []
+selected_info = None
+if prefix and not prefix.isdigit():
+    st.warning('Client ids only contain digits')
+else:
+    clients, call = search_clients(prefix, repay, scores)
+    calls.append(call)
+    if clients is not None:
+        selected_info = st.selectbox('Select client', clients['clientsID'])
+        if clients['total'] > len(clients['clientsID']):
+            st.caption(f"First {len(clients['clientsID'])} of {clients['total']} matching clients, type more digits to narrow the search")
+        elif clients['total'] == 0:
+            st.caption('No matching client')
     st.markdown('')
 
+# Every tab is filled from a single call to the API
+profile = None
+if selected_info:
+    profile, call = get_client_profile(selected_info)
+    calls.append(call)
+show_errors(calls)
+show_latencies(calls)
+
 tab1, tab2,tab3, tab4, tab5, tab6 = st.tabs(['🆔 Personal information', 
                                             '🏦 Financial information', 
                                             '🎯 Prediction', 
@@ -235,8 +175,8 @@ tab1, tab2,tab3, tab4, tab5, tab6 = st.tabs(['🆔 Personal information',
                                             ])
 
 with tab1:
-    if selected_info:
-        info = get_client_personal_information(selected_info)
+    if profile:
+        info = profile['personalInformation']
 
         col1, col2, col3, col4 = st.columns(4)
 
@@ -281,8 +221,8 @@ with tab1:
             st.markdown(info['educationType'])
 
 with tab2:
-    if selected_info:
-        info = get_client_bank_information(selected_info)
+    if profile:
+        info = profile['bankInformation']
 
         col1, col2 = st.columns(2)
 
@@ -335,8 +275,8 @@ with tab2:
             plot_extsources(info['extSource1'], info['extSource2'], info['extSource3'])
 
 with tab3:
-    if selected_info:
-        info = get_client_prediction(selected_info)
+    if profile:
+        info = profile['prediction']
 
         col1, col2 = st.columns(2)
 
@@ -359,34 +299,35 @@ with tab3:
             st.markdown(info['repay'])
 
 with tab4:
-    if selected_info:
+    if profile:
+        data = profile['neighborsStatistics']
+
         col1, col2 = st.columns(2)
         with col1: 
             st.markdown('**Distribution of annual income:**')
-            data = get_neighbors_total_income(selected_info)
-            plot_neighbors_annual_income(data)
+            plot_neighbors_annual_income(data['totalIncome'])
             st.markdown('\n')
 
             st.markdown('**Distribution of credit amount:**')
-            data = get_neighbors_credit_amount(selected_info)
-            plot_neighbors_credit_amount(data)
+            plot_neighbors_credit_amount(data['amtCredit'])
 
         with col2:
             st.markdown('**Distribution of credit score:**')
-            data = get_neighbors_score(selected_info)
-            plot_neighbors_scores(data)
+            plot_neighbors_scores(data['score'])
             st.markdown('\n')
 
             st.markdown('**Distribution of loan duration in months:**')
-            data = get_neighbors_loan_duration(selected_info)
-            plot_neighbors_loan_duration(data)
+            plot_neighbors_loan_duration(data['loanLength'])
 
 with tab5:
-    if selected_info:
-        data = get_client_shap_values(selected_info)
+    if profile:
+        data = profile['localShap']
         plot_shap(data)
 
 with tab6:
-    if selected_info:
-        info = get_model_shap_values(selected_info)
-        plot_shap(info)
\ No newline at end of file
+    if profile:
+        with st.spinner('Computing the global analysis...'):
+            info, call = get_global_shap(selected_info)
+        show_errors([call])
+        if info is not None:
+            plot_shap(info)
\ No newline at end of file
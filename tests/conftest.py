@@ -0,0 +1,31 @@
+import os
+import sys
+import pytest
+
+# API modules are imported as top-level modules, the same way uvicorn does from the api folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+# Dashboard modules as well, the same way streamlit does from the dashboard folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dashboard'))
+
+@pytest.fixture(scope='session')
+def api(tmp_path_factory):
+    '''
+    The API module served on a small synthetic dataset, imported once per session like the benchmarks do: it reads
+    its files relative to the api folder
+    '''
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+    from synthetic import model_columns, write_dataset
+
+    root_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    data_dir = str(tmp_path_factory.mktemp('api_data'))
+    write_dataset(data_dir, 600, 300, columns=model_columns(os.path.join(root_dir, 'models', 'lightgbm_classifier.pkl')))
+    os.environ['DATA_PATH'] = data_dir
+    os.environ['PREPROCESSING_PATH'] = os.path.join(data_dir, 'preprocessing')
+    os.environ['SHAP_BACKFILL'] = 'false'
+    cwd = os.getcwd()
+    os.chdir(os.path.join(root_dir, 'api'))
+    try:
+        import main
+    finally:
+        os.chdir(cwd)
+    return main
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+from aggregates import StatisticsStore
+
+@pytest.fixture(scope='module')
+def get_current_clients():
+    '''Current clients with a missing income and a zero annuity'''
+    return pd.DataFrame({
+        'SK_ID_CURR': [1, 2, 3, 4, 5],
+        'TARGET': [0, 0, 0, 1, 1],
+        'CODE_GENDER': [0, 1, 1, 0, np.nan],
+        'DAYS_BIRTH': [-3650, -7300, -10950, -14600, -18250],
+        'AMT_INCOME_TOTAL': [10.0, 100.0, np.nan, 1000.0, 10000.0],
+        'AMT_CREDIT': [1200.0, 2400.0, 3600.0, 4800.0, 6000.0],
+        'AMT_ANNUITY': [100.0, 100.0, 0.0, 100.0, 100.0],
+        'PAYMENT_RATE': [0.01, 0.02, 0.03, 0.04, 0.05],
+        'CREDIT_INCOME_PERCENT': [1.0, 2.0, 3.0, 4.0, 5.0]
+    })
+
+def test_counts(get_current_clients):
+    '''Check counts of clients per repayment status and gender'''
+    store = StatisticsStore(get_current_clients)
+    assert store.loans == {'repaid': 3, 'defaulted': 2}
+    assert store.genders == {'M': {'repaid': 1, 'defaulted': 2}, 'F': {'repaid': 2, 'defaulted': 0}}
+
+def test_summary_ignores_missing_values(get_current_clients):
+    '''Check that missing incomes and zero annuities are not counted'''
+    store = StatisticsStore(get_current_clients)
+    incomes = store.distribution('total_incomes')['repaid']
+    assert incomes['count'] == 2
+    assert incomes['mean'] == 55.0
+    assert incomes['min'] == 10.0 and incomes['max'] == 100.0
+    assert store.distribution('length_loan')['repaid']['count'] == 2
+
+def test_histogram(get_current_clients):
+    '''Check that histograms count every client, with log spaced edges in the original unit'''
+    store = StatisticsStore(get_current_clients)
+    ages = store.distribution('ages', bins=3)['repaid']
+    assert sum(ages['counts']) == 3
+    assert len(ages['edges']) == 4
+    incomes = store.distribution('total_incomes', bins=2, log=True)['defaulted']
+    np.testing.assert_allclose(incomes['edges'], [1000.0, 10**3.5, 10000.0])
+    assert incomes['counts'] == [1, 1]
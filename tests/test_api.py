@@ -0,0 +1,166 @@
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+@pytest.fixture(scope='module')
+def client(api):
+    return TestClient(api.app)
+
+def features_of(api, position):
+    '''Raw encoded features of a client, as sent to POST /api/clients (missing values as null)'''
+    row = api.clients.take([position]).iloc[0, 1:]
+    return {name: None if np.isnan(value) else float(value) for name, value in row.items()}
+
+def table_sizes(api):
+    '''Number of clients in the rows, the id index and the search'''
+    return len(api.clients), len(api.client_index), len(api.client_search)
+
+def test_add_client_aligns_tables(api, client):
+    '''Check that an added client gets the same position in the rows, the neighbor index, the id index and the search'''
+    n_clients = len(api.clients)
+    response = client.post('/api/clients', json={'clientId': 900001, 'features': features_of(api, 3)})
+    assert response.status_code == 201
+
+    position = api.client_index.get(900001)
+    assert position == n_clients
+    assert table_sizes(api) == (n_clients + 1,)*3
+    assert api.clients.take([position])['SK_ID_CURR'].tolist() == [900001]
+    assert client.get('/api/clients', params={'prefix': '900001'}).json()['clientsID'] == [900001]
+    scaled = api.preprocessor.transform(api.clients.take([position]).iloc[:, 1:].to_numpy())
+    _, indices = api.knn.kneighbors(scaled, 2)
+    assert set(indices[0]) == {3, position}
+
+def test_added_client_is_served(api, client):
+    '''Check that an added client is scored like the client it copies and served by the other endpoints'''
+    added = client.post('/api/clients', json={'clientId': 900002, 'features': features_of(api, 5)}).json()
+    original_id = int(api.client_index.ids[5])
+    original = client.get(f'/api/clients/{original_id}/prediction').json()
+    assert added['prediction']['score'] == original['score']
+
+    prediction = client.get('/api/clients/900002/prediction').json()
+    assert prediction['clientId'] == 900002 and prediction['score'] == original['score']
+    assert client.get('/api/clients/900002/prediction/shap/local').json() == pytest.approx(added['shap'])
+    assert client.get('/api/clients/900002/personal_information').status_code == 200
+    assert client.get('/api/clients/900002/bank_information').status_code == 200
+    neighbors = client.get('/api/clients/900002/prediction/neighbors').json()
+    # The copied client is the nearest neighbor (or the added client itself, on a tie)
+    assert str(original_id) in neighbors or '900002' in neighbors
+    assert max(neighbors.values()) == pytest.approx(1, abs=1e-3)
+
+def test_add_client_rejects_known_ids_and_features(api, client):
+    '''Check that an existing client id gets a 409, an unknown feature a 422, and that no table changes'''
+    sizes = table_sizes(api)
+    existing_id = int(api.client_index.ids[0])
+    response = client.post('/api/clients', json={'clientId': existing_id, 'features': features_of(api, 0)})
+    assert response.status_code == 409
+    response = client.post('/api/clients', json={'clientId': 900003, 'features': {'NOT_A_FEATURE': 1.0}})
+    assert response.status_code == 422
+    assert table_sizes(api) == sizes
+    assert 900003 not in api.client_index
+
+def test_failed_ingestion_rolls_back(api, monkeypatch):
+    '''Check that the tables are truncated back when a step of the ingestion fails, and the next client is aligned'''
+    sizes = table_sizes(api)
+
+    def fail(id, position):
+        raise RuntimeError('search failed')
+    monkeypatch.setattr(api.client_search, 'add', fail)
+    response = TestClient(api.app, raise_server_exceptions=False).post(
+        '/api/clients', json={'clientId': 900004, 'features': features_of(api, 0)})
+    assert response.status_code == 500
+    assert table_sizes(api) == sizes
+    assert 900004 not in api.client_index
+
+    monkeypatch.undo()
+    response = TestClient(api.app).post('/api/clients', json={'clientId': 900004, 'features': features_of(api, 0)})
+    assert response.status_code == 201
+    assert api.client_index.get(900004) == sizes[0]
+    scaled = api.preprocessor.transform(api.clients.take([sizes[0]]).iloc[:, 1:].to_numpy())
+    _, indices = api.knn.kneighbors(scaled, 2)
+    assert sizes[0] in indices[0]
+
+def test_shap_matrix_timed_as_task(api, client):
+    '''Check that the shap matrix computed on the first global request is timed as a task, not as a startup stage'''
+    id = int(api.client_index.ids[0])
+    assert client.get(f'/api/clients/{id}/prediction/shap/global').status_code == 200
+    assert api.metrics.tasks.series[('shap',)][2] == 1
+    assert ('shap',) not in api.metrics.stages.series
+    # The backfill never takes the lock the startups of the workers wait for
+    assert api.registry.active.explanations.lock_path != api.STARTUP_LOCK_PATH
+    assert 'credit_api_task_duration_seconds_count{task="shap"} 1' in client.get('/metrics').text
+
+class CountingRegistry:
+    '''Registry counting the reads of the active version'''
+    def __init__(self, registry):
+        self.registry = registry
+        self.reads = 0
+
+    @property
+    def active(self):
+        self.reads += 1
+        return self.registry.active
+
+def test_profile_sections(api, client):
+    '''Check the default sections of the profile, that sections can be separated by spaces, and the errors'''
+    id = int(api.client_index.ids[10])
+    profile = client.get(f'/api/clients/{id}/profile').json()
+    assert list(profile) == ['clientId'] + api.PROFILE_DEFAULT_SECTIONS
+    assert 'globalShap' not in profile
+    assert profile['prediction'] == client.get(f'/api/clients/{id}/prediction').json()
+    assert profile['localShap'] == pytest.approx(client.get(f'/api/clients/{id}/prediction/shap/local').json())
+
+    profile = client.get(f'/api/clients/{id}/profile', params={'sections': 'prediction, neighbors'}).json()
+    assert list(profile) == ['clientId', 'prediction', 'neighbors']
+    response = client.get(f'/api/clients/{id}/profile', params={'sections': 'prediction,unknown'})
+    assert response.status_code == 422
+    assert client.get('/api/clients/1/profile').status_code == 404
+
+@pytest.mark.parametrize('sections', [None, 'prediction,localShap,globalShap'])
+def test_profile_reads_active_version_once(api, client, monkeypatch, sections):
+    '''Check that every section of a profile is computed with the model version read once by the request'''
+    registry = CountingRegistry(api.registry)
+    monkeypatch.setattr(api, 'registry', registry)
+    id = int(api.client_index.ids[11])
+    profile = client.get(f'/api/clients/{id}/profile', params={'sections': sections} if sections else None).json()
+    assert profile['prediction']['modelVersion'] == api.registry.registry.active.version
+    assert registry.reads == 1
+
+def test_listing_filters_added_clients(api, client):
+    '''Check that an added client is filtered by its score, with the probabilities kept when it was ingested'''
+    added = client.post('/api/clients', json={'clientId': 900005, 'features': features_of(api, 7)}).json()
+    score = added['prediction']['score']
+    model_version = api.registry.active
+    n_scored = len(model_version.probabilities.added)
+    assert n_scored == len(api.clients) - len(api.clients_to_predict)
+
+    listing = client.get('/api/clients', params={'prefix': '90000', 'minScore': score, 'maxScore': score}).json()
+    assert 900005 in listing['clientsID']
+    listing = client.get('/api/clients', params={'prefix': '90000', 'minScore': score + 1}).json()
+    assert 900005 not in listing['clientsID']
+    assert len(model_version.probabilities.added) == n_scored
+
+def test_batch_predictions_match_single_predictions(api, client):
+    '''Check that a batch scores its clients like /prediction, by id or by features, and reports unknown ids'''
+    ids = [int(id) for id in api.client_index.ids[[20, 3, 20, 41]]]
+    expected = [client.get(f'/api/clients/{id}/prediction').json() for id in ids]
+    response = client.post('/api/predictions/batch', json={'clientsID': ids})
+    assert response.status_code == 200
+    assert response.json()['predictions'] == pytest.approx(expected)
+
+    rows = [features_of(api, 20), {**features_of(api, 3), 'SK_ID_CURR': ids[1]}]
+    predictions = client.post('/api/predictions/batch', json={'features': rows}).json()['predictions']
+    assert [prediction['clientId'] for prediction in predictions] == [None, ids[1]]
+    assert [prediction['score'] for prediction in predictions] == [expected[0]['score'], expected[1]['score']]
+
+    response = client.post('/api/predictions/batch', json={'clientsID': [ids[0], 1, 2]})
+    assert response.status_code == 404 and response.json()['detail'] == 'Client id not found: [1, 2]'
+    assert client.post('/api/predictions/batch', json={'features': [{'NOT_A_FEATURE': 1.0}]}).status_code == 422
+    assert client.post('/api/predictions/batch', json={}).status_code == 422
+    assert client.post('/api/predictions/batch', json={'clientsID': []}).json() == {'predictions': []}
+
+def test_listing_empty_prefix(client):
+    '''Check that an empty prefix lists every client, like no prefix'''
+    response = client.get('/api/clients', params={'prefix': '', 'limit': 5})
+    assert response.status_code == 200
+    assert response.json() == client.get('/api/clients', params={'limit': 5}).json()
+    assert client.get('/api/clients', params={'prefix': '1a'}).status_code == 422
@@ -0,0 +1,81 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from api_client import ApiClient, get_api_client
+
+class Handler(BaseHTTPRequestHandler):
+    '''Endpoints of a fake API: /ok, /slow (0.2 s), /missing (404), /flaky (503 on the first call)'''
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            flaky_calls = sum(path == '/flaky' for path in server.requests)
+        if self.path == '/slow':
+            time.sleep(0.2)
+        status = 404 if self.path == '/missing' else 503 if self.path == '/flaky' and flaky_calls == 1 else 200
+        body = json.dumps({'path': self.path}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.lock = threading.Lock()
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+
+def get_client(server, **params):
+    return ApiClient(f'http://127.0.0.1:{server.server_address[1]}', **params)
+
+def test_get(server):
+    '''Check that a call gets its json, and that a failed call gets None with its status'''
+    client = get_client(server)
+    data, call = client.get('/ok')
+    assert data == {'path': '/ok'} and call.status == 200 and call.latency > 0
+    data, call = client.get('/missing', name='missing')
+    assert data is None and call.status == 404 and call.name == 'missing'
+
+def test_gateway_errors_are_retried(server):
+    '''Check that a 503 is retried with backoff'''
+    data, call = get_client(server, backoff=0.01).get('/flaky')
+    assert data == {'path': '/flaky'}
+    assert server.requests == ['/flaky', '/flaky']
+
+def test_read_timeouts_are_not_retried(server):
+    '''Check that a call which timed out waiting for the response is not sent again'''
+    data, call = get_client(server, timeout=(1, 0.05), backoff=0.01).get('/slow')
+    assert data is None and call.status is None and call.error
+    time.sleep(0.3)
+    assert server.requests == ['/slow']
+
+def test_unreachable_api():
+    '''Check that a call to an API which does not answer fails without raising'''
+    data, call = ApiClient('http://127.0.0.1:1', retries=0).get('/ok')
+    assert data is None and call.status is None and call.error
+
+def test_get_many_is_concurrent(server):
+    '''Check that independent calls are sent at the same time and come back in order'''
+    client = get_client(server)
+    start = time.perf_counter()
+    results, calls = client.get_many({f'slow{index}': ('/slow', {'index': index}) for index in range(4)})
+    assert time.perf_counter() - start < 0.6
+    assert list(results) == [call.name for call in calls] == ['slow0', 'slow1', 'slow2', 'slow3']
+    assert all(call.status == 200 for call in calls)
+
+def test_unknown_api_address():
+    '''Check that the dashboard fails with a clear error when the address of the API is not set'''
+    with pytest.raises(RuntimeError, match='AWS_PUBLIC_IP_ADDRESS_API'):
+        get_api_client(None)
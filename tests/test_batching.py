@@ -0,0 +1,33 @@
+import asyncio
+from batching import MicroBatcher
+
+def test_batcher_coalesces_concurrent_items():
+    '''Check that items submitted together are processed in batches of at most max_batch_size, in order'''
+    calls = []
+    def process(items):
+        calls.append(list(items))
+        return [2*item for item in items]
+
+    batcher = MicroBatcher(process, max_batch_size=4, max_delay=0.01)
+
+    async def main():
+        return await asyncio.gather(*[batcher.submit(item) for item in range(10)])
+
+    assert asyncio.run(main()) == [2*item for item in range(10)]
+    assert calls == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+    assert batcher.metrics['batches'] == 3
+    assert batcher.metrics['batchSizes'] == {4: 2, 2: 1}
+    assert batcher.metrics['maxQueueTime'] >= 0
+
+def test_batcher_propagates_errors():
+    '''Check that every caller of a failed batch gets the error'''
+    def process(items):
+        raise ValueError('model failed')
+
+    batcher = MicroBatcher(process, max_delay=0.001)
+
+    async def main():
+        return await asyncio.gather(*[batcher.submit(item) for item in range(3)], return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
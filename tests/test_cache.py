@@ -0,0 +1,20 @@
+from cache import LRUCache
+
+def test_cache_get_put():
+    '''Check that stored values are returned'''
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('b', 0) == 0
+
+def test_cache_evicts_least_recently_used():
+    '''Check that the least recently used entry is evicted when the cache is full'''
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert len(cache) == 2
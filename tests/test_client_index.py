@@ -0,0 +1,41 @@
+from client_index import ClientIndex
+
+def test_client_index_positions():
+    '''Check that each client id is mapped to its row position'''
+    index = ClientIndex([100001, 100005, 100013])
+    assert len(index) == 3
+    assert index.get(100001) == 0
+    assert index.get(100013) == 2
+    assert 100005 in index
+
+def test_client_index_unknown_id():
+    '''Check that unknown client ids are not found'''
+    index = ClientIndex([100001, 100005, 100013])
+    assert index.get(1) is None
+    assert 1 not in index
+    assert index.get_many([100013, 1]).tolist() == [2, -1]
+
+def test_client_index_add():
+    '''Check that added clients get the next positions'''
+    index = ClientIndex([100001, 100005])
+    assert index.add(100020) == 2
+    assert index.get(100020) == 2
+    assert index.ids.tolist() == [100001, 100005, 100020]
+    assert index.added().tolist() == [2]
+
+def test_client_index_truncate():
+    '''Check that truncating drops the added clients'''
+    index = ClientIndex([100001, 100005])
+    index.add(100020)
+    index.truncate(2)
+    assert 100020 not in index
+    assert index.add(100030) == 2
+
+def test_client_index_grows():
+    '''Check that the ids stay in order when the buffer grows past its capacity'''
+    index = ClientIndex([100001, 100005])
+    for id in range(200000, 200100):
+        index.add(id)
+    assert len(index) == 102
+    assert index.ids.tolist() == [100001, 100005] + list(range(200000, 200100))
+    assert index.get(200099) == 101
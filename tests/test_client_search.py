@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from client_search import ClientSearch
+
+IDS = [100002, 100001, 1000, 100100, 10, 200001, 1]
+
+def test_search_by_prefix():
+    '''Check that every id starting with the prefix is found, whatever its number of digits, in increasing order'''
+    search = ClientSearch(IDS)
+    assert search.search('10', limit=10) == ([10, 1000, 100001, 100002, 100100], None, 5)
+    assert search.search('1001', limit=10)[0] == [100100]
+    assert search.search('3', limit=10) == ([], None, 0)
+    assert search.search('01', limit=10) == ([], None, 0)
+    assert search.search('', limit=10) == search.search(limit=10)
+    with pytest.raises(ValueError):
+        search.search('1a')
+
+def test_pages_follow_the_cursor():
+    '''Check that the pages, each starting after the last id of the previous one, list every id once'''
+    search = ClientSearch(IDS)
+    ids, cursor = [], None
+    while True:
+        page, cursor, total = search.search(cursor=cursor, limit=3)
+        ids += page
+        if cursor is None:
+            break
+    assert ids == sorted(IDS) and total == len(IDS)
+
+def test_filters_and_added_clients():
+    '''Check that the filters are read by row position, including the clients added after startup'''
+    search = ClientSearch(IDS)
+    search.add(100003, len(IDS))
+    keep = np.zeros(len(IDS) + 1, dtype=bool)
+    keep[[0, 1, len(IDS)]] = True
+    assert search.search('1000', limit=2) == ([1000, 100001], 100001, 4)
+    assert search.search('1000', limit=10, keep=keep) == ([100001, 100002, 100003], None, 3)
+
+def test_filters_computed_on_a_snapshot():
+    '''Check that a search reads the snapshot it is given, and leaves out the clients past the end of the filters'''
+    search = ClientSearch(IDS)
+    snapshot = search.snapshot()
+    search.add(100003, len(IDS))
+    keep = np.ones(len(IDS), dtype=bool)
+    assert search.search('1000', limit=10, keep=keep, snapshot=snapshot) == ([1000, 100001, 100002], None, 3)
+    assert search.search('1000', limit=10, keep=keep) == ([1000, 100001, 100002], None, 3)
+    assert search.search('1000', limit=10) == ([1000, 100001, 100002, 100003], None, 4)
+
+@pytest.mark.parametrize('merge_size', [2, 100])
+def test_added_ids_searched_with_the_others(merge_size):
+    '''Check that the added ids are listed in order with the loaded ones, before and after they are merged'''
+    search = ClientSearch(IDS, merge_size=merge_size)
+    for position, id in enumerate([100003, 5, 100000], start=len(IDS)):
+        search.add(id, position)
+    assert len(search.snapshot().added_ids) == (1 if merge_size == 2 else 3)
+    ids, cursor = [], None
+    while True:
+        page, cursor, total = search.search(cursor=cursor, limit=2)
+        ids += page
+        if cursor is None:
+            break
+    assert ids == sorted(IDS + [100003, 5, 100000]) and total == len(IDS) + 3
+    assert search.search('10000', limit=3) == ([100000, 100001, 100002], 100002, 4)
+
+    search.truncate(len(IDS) + 1)
+    assert len(search) == len(IDS) + 1
+    assert search.search('10000', limit=10) == ([100001, 100002, 100003], None, 3)
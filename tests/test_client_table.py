@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+from client_table import ClientTable
+from row_buffer import RowBuffer
+
+def test_row_buffer_grows():
+    '''Check that appended rows are kept in order when the capacity doubles'''
+    buffer = RowBuffer(2, capacity=2)
+    for row in range(5):
+        assert buffer.append([[row, row]]) == row
+    assert len(buffer) == 5
+    assert buffer.values()[:, 0].tolist() == [0, 1, 2, 3, 4]
+
+def test_client_table_take():
+    '''Check that loaded and added clients are taken in the requested order'''
+    data = pd.DataFrame({'SK_ID_CURR': [100001, 100002], 'a': [1.0, np.nan], 'b': [3.0, 4.0]})
+    table = ClientTable(data)
+    assert table.append([100003, 5.0, 6.0]) == 2
+    assert len(table) == 3
+
+    rows = table.take([2, 0])
+    assert rows['SK_ID_CURR'].tolist() == [100003, 100001]
+    assert rows['a'].tolist() == [5.0, 1.0]
+    assert table.take([1])['SK_ID_CURR'].tolist() == [100002]
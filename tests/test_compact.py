@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+from compact import CompactFrame, column_dtypes, UINT8, FLOAT32, FLOAT64
+from client_table import ClientTable
+from feature_store import FeatureStore
+
+def get_clients():
+    return pd.DataFrame({'SK_ID_CURR': [100001, 100002, 100003],
+                         'NAME_FAMILY_STATUS_Married': [1.0, 0.0, np.nan],
+                         'AMT_CREDIT': [406597.5, 1293502.5, np.nan],
+                         'EXT_SOURCE_2': [0.2629485927471776, 0.6222457752555098, 0.5559120833904428]})
+
+def test_column_dtypes():
+    '''Check that one-hots are uint8 and numerics float32 only when their values are kept'''
+    values = get_clients().iloc[:, 1:].to_numpy()
+    assert column_dtypes(values).tolist() == [UINT8, FLOAT32, FLOAT64]
+    assert column_dtypes(values, float32=True).tolist() == [UINT8, FLOAT32, FLOAT32]
+
+def test_take_round_trips():
+    '''Check that rows are read back exactly, missing values included, in the requested order'''
+    data = get_clients()
+    frame = CompactFrame.from_frame(data, block_size=2)
+    assert frame.shape == data.shape
+    assert frame.columns.to_list() == data.columns.to_list()
+    rows = frame.take([2, 0])
+    pd.testing.assert_frame_equal(rows, data.iloc[[2, 0]])
+    np.testing.assert_array_equal(frame.column('NAME_FAMILY_STATUS_Married'), data['NAME_FAMILY_STATUS_Married'])
+    assert frame.memory_usage()['total'] < frame.memory_usage()['asFloat64']
+
+def test_features_and_client_table():
+    '''Check that the features share the blocks and that a client table reads a compact frame'''
+    data = get_clients()
+    frame = CompactFrame.from_frame(data)
+    features = frame.features()
+    assert features.columns.to_list() == data.columns[1:].to_list()
+    assert all(a is b for a, b in zip(features.blocks, frame.blocks))
+
+    table = ClientTable(frame)
+    table.append([100004, 1.0, 100.0, 0.5])
+    rows = table.take([3, 1])
+    assert rows['SK_ID_CURR'].tolist() == [100004, 100002]
+    assert rows['EXT_SOURCE_2'].tolist() == [0.5, 0.6222457752555098]
+
+def test_publish_attaches_blocks(tmp_path):
+    '''Check that a compact frame is compacted once, then attached from the feature store'''
+    data = get_clients()
+    calls = []
+    def compact():
+        calls.append(1)
+        return CompactFrame.from_frame(data)
+
+    ids, columns = data['SK_ID_CURR'], data.columns[1:]
+    CompactFrame.publish(FeatureStore(str(tmp_path), {'size': 3}), 'clients', ids, columns, compact)
+    frame = CompactFrame.publish(FeatureStore(str(tmp_path), {'size': 3}), 'clients', ids, columns, compact)
+    assert len(calls) == 1
+    assert isinstance(frame.blocks[UINT8], np.memmap)
+    pd.testing.assert_frame_equal(frame.take([0, 1, 2]), data)
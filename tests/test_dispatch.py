@@ -0,0 +1,52 @@
+import asyncio
+import threading
+import time
+import pytest
+from dispatch import Dispatcher
+
+def test_dispatcher_limits_group_concurrency():
+    '''Check that a group never runs more calls at once than its limit, while other groups keep running'''
+    dispatcher = Dispatcher(4, {'heavy': 1})
+    running = []
+    lock = threading.Lock()
+
+    def heavy():
+        with lock:
+            running.append(1)
+            concurrent = len(running)
+        time.sleep(0.02)
+        with lock:
+            running.pop()
+        return concurrent
+
+    async def main():
+        heavy_calls = [dispatcher.run('heavy', heavy) for _ in range(5)]
+        light_call = dispatcher.run('light', lambda: threading.current_thread().name)
+        return await asyncio.gather(*heavy_calls), await light_call
+
+    concurrency, thread_name = asyncio.run(main())
+    assert max(concurrency) == 1
+    assert thread_name.startswith('dispatch')
+    assert dispatcher.metrics['heavy']['completed'] == 5
+    assert dispatcher.metrics['heavy']['maxWaiting'] >= 4
+    assert dispatcher.queue_depth() == {'heavy': 0, 'light': 0}
+
+def test_offload_keeps_exceptions_and_signature():
+    '''Check that offloaded endpoints raise the same exceptions and keep their signature'''
+    dispatcher = Dispatcher(2)
+
+    @dispatcher.offload('lookup')
+    def endpoint(id: int):
+        if id < 0:
+            raise KeyError(id)
+        return id
+
+    assert asyncio.run(endpoint(3)) == 3
+    with pytest.raises(KeyError):
+        asyncio.run(endpoint(-1))
+    assert endpoint.__wrapped__.__annotations__ == {'id': int}
+
+def test_limits_leave_free_workers():
+    '''Check that limited groups can not take every worker'''
+    with pytest.raises(ValueError):
+        Dispatcher(4, {'heavy': 2, 'slow': 2})
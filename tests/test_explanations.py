@@ -0,0 +1,167 @@
+import threading
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+import shap
+from lightgbm import LGBMClassifier
+from explanations import ExplanationService, NativeExplainer, ImportanceSummaries, score_edges, segment_labels
+from feature_store import FeatureStore, exclusive
+
+def make_service(store=None):
+    '''Explanations of a small model, with a shap explainer like the one of the API'''
+    rng = np.random.default_rng(0)
+    features = pd.DataFrame(rng.normal(size=(300, 5)), columns=[f'f{i}' for i in range(5)])
+    target = (features['f0'] + features['f1'] > 0).astype(int)
+    model = LGBMClassifier(n_estimators=10, verbose=-1).fit(features, target)
+    explainer = shap.TreeExplainer(model)
+    return ExplanationService(explainer, features, 'v1', cache_size=2, store=store, block_size=64), explainer
+
+def test_explain_matches_explainer():
+    '''Check that a client computed on demand gets the shap values of the full matrix, and is cached'''
+    service, explainer = make_service()
+    expected = np.asarray(explainer.shap_values(service.features)[0], dtype=np.float32)
+    np.testing.assert_allclose(service.explain(7), expected[7], rtol=1e-6)
+    assert (7, 'v1') in service.cache
+    assert service.matrix is None
+
+def test_backfill_publishes_matrix(tmp_path):
+    '''Check that the backfilled matrix is published, then attached by the next service'''
+    service, _ = make_service(FeatureStore(str(tmp_path), {'model': 'v1'}))
+    service.explain(3)
+    service.start_backfill().join()
+    assert service.matrix.dtype == np.float32
+    assert service.status()['backfilled'] == 300
+    assert len(service.cache) == 0
+
+    attached, _ = make_service(FeatureStore(str(tmp_path), {'model': 'v1'}))
+    assert isinstance(attached.matrix, np.memmap)
+    np.testing.assert_array_equal(attached.explain(3), service.matrix[3])
+
+def test_backfill_does_not_hold_lock_files(tmp_path):
+    '''Check that neither the startup lock nor the shap lock is held while the matrix is computed'''
+    service, explainer = make_service(FeatureStore(str(tmp_path), {'model': 'v1'}))
+    service.lock_path = str(tmp_path / '.shap.lock')
+    computing, release = threading.Event(), threading.Event()
+    def shap_values(features):
+        computing.set()
+        release.wait(5)
+        return explainer.shap_values(features)
+    service.explainer = type('SlowExplainer', (), {'shap_values': staticmethod(shap_values)})()
+
+    backfill = service.start_backfill()
+    assert computing.wait(5)
+    acquired = []
+    def acquire():
+        for lock_path in [tmp_path / '.startup.lock', tmp_path / '.shap.lock']:
+            with exclusive(str(lock_path)):
+                acquired.append(lock_path.name)
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    thread.join(timeout=5)
+    assert acquired == ['.startup.lock', '.shap.lock']
+    release.set()
+    backfill.join()
+    assert isinstance(service.matrix, np.memmap)
+
+def test_global_importance():
+    '''Check that the global importance is the mean absolute shap value of every feature'''
+    service, explainer = make_service()
+    expected = pd.Series(np.abs(explainer.shap_values(service.features)[0]).mean(axis=0), index=service.features.columns)
+    importance = service.importance(k=3)
+    assert list(importance) == expected.nlargest(3).index.to_list()
+    np.testing.assert_allclose(list(importance.values()), expected.nlargest(3).to_numpy(), rtol=1e-5)
+
+def test_added_client_in_summaries():
+    '''Check that a client added after startup is explained and counted in the summaries, before and after they are built'''
+    service, explainer = make_service()
+    new = service.features.iloc[[5]]
+    added = []
+    service.rows = lambda positions: pd.concat([service.features, new, new]).iloc[positions]
+    service.segments = lambda positions: {'gender': np.where(np.asarray(positions) < 300, 'Man', 'Woman')}
+    service.added = lambda: np.array(added, dtype=np.int64)
+
+    added.append(300)
+    values = service.add(300)
+    np.testing.assert_allclose(values, service.explain(5), rtol=1e-6)
+    assert service.summaries is None
+    assert service.importance('gender', 'Woman', k=5) == pytest.approx(dict(zip(service.features.columns, np.abs(values))))
+    added.append(301)
+    service.add(301)
+    assert service.summaries.segments()['gender'] == {'Man': 300, 'Woman': 2}
+
+def test_added_clients_shared_between_versions():
+    '''Check that a version gets in its summaries the clients added while another version was active'''
+    active, _ = make_service()
+    previous, _ = make_service()
+    added = []
+    for service in [active, previous]:
+        service.rows = lambda positions, features=service.features: pd.concat([features, features.iloc[[5, 6]]]).iloc[positions]
+        service.added = lambda: np.array(added, dtype=np.int64)
+    previous.importance()
+
+    for position in [300, 301]:
+        added.append(position)
+        active.add(position)
+    previous.importance()
+    assert previous.summaries.segments()['all'] == {'all': 302}
+    assert previous.status()['clients'] == 302
+
+def test_add_does_not_wait_for_matrix():
+    '''Check that a client is added while the matrix is being computed, and merged in the summaries once it is done'''
+    service, _ = make_service()
+    service.rows = lambda positions: pd.concat([service.features, service.features.iloc[[5]]]).iloc[positions]
+    service.added = lambda: np.array([300], dtype=np.int64)
+
+    with service.lock:
+        thread = threading.Thread(target=service.add, args=(300,))
+        thread.start()
+        thread.join(timeout=5)
+        assert not thread.is_alive()
+    service.importance()
+    assert service.summaries.segments()['all'] == {'all': 301}
+
+def test_segment_labels():
+    '''Check that clients get the category of their one-hot encoded column and their decile of score'''
+    data = pd.DataFrame({'CODE_GENDER': [0, 1, np.nan], 'NAME_INCOME_TYPE_Working': [1, 0, 0],
+                         'NAME_INCOME_TYPE_Student': [0, 1, 0], 'NAME_EDUCATION_TYPE_Highereducation': [1, 1, 1],
+                         'NAME_FAMILY_STATUS_Married': [0, 0, 1]})
+    scores = np.array([100, 500, 900])
+    segments = segment_labels(data, scores, score_edges(np.arange(1000)))
+    assert segments['gender'].tolist() == ['Man', 'Woman', 'Man']
+    assert segments['incomeType'].tolist() == ['Working', 'Student', 'Missing']
+    assert segments['familyStatus'].tolist() == ['Missing', 'Missing', 'Married']
+    assert segments['scoreDecile'].tolist() == ['2', '6', '10']
+
+def test_importance_summaries_incremental():
+    '''Check that adding clients in several calls gives the same summaries as adding them at once'''
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=(100, 4))
+    segments = {'gender': np.where(rng.random(100) < 0.5, 'Man', 'Woman')}
+
+    at_once = ImportanceSummaries(['a', 'b', 'c', 'd'])
+    at_once.add(values, segments)
+    incremental = ImportanceSummaries(['a', 'b', 'c', 'd'])
+    for start in range(0, 100, 30):
+        incremental.add(values[start:start + 30], {'gender': segments['gender'][start:start + 30]})
+
+    assert incremental.segments() == at_once.segments()
+    for label in ['Man', 'Woman']:
+        mask = segments['gender'] == label
+        expected = pd.Series(np.abs(values[mask]).mean(axis=0), index=['a', 'b', 'c', 'd']).nlargest(2)
+        top = incremental.top('gender', label, k=2)
+        assert list(top) == expected.index.to_list()
+        np.testing.assert_allclose(list(top.values()), expected.to_numpy())
+
+def test_native_explainer_matches_pickled_explainer():
+    '''Check that LightGBM contributions give the shap values of the pickled explainer, for one row and a batch'''
+    model = joblib.load('models/lightgbm_classifier.pkl')
+    explainer = joblib.load('models/lightgbm_shap_explainer.pkl')
+    features = pd.read_csv('data/processed/test_feature_engineering_encoded.csv.gz', nrows=200).drop(columns=['SK_ID_CURR'])
+
+    native = NativeExplainer(model)
+    for batch in [features.iloc[:1], features]:
+        expected = explainer.shap_values(batch)
+        values = native.shap_values(batch)
+        np.testing.assert_allclose(values[0], expected[0], rtol=0, atol=1e-10)
+        np.testing.assert_allclose(values[1], expected[1], rtol=0, atol=1e-10)
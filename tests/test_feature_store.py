@@ -0,0 +1,41 @@
+import threading
+import numpy as np
+from feature_store import FeatureStore, exclusive
+
+def test_publish_attaches_memory_mapped_array(tmp_path):
+    '''Check that a published array is computed once, then attached with memory mapping'''
+    calls = []
+    def compute():
+        calls.append(1)
+        return np.arange(6, dtype=np.float64).reshape(3, 2)
+
+    store = FeatureStore(str(tmp_path), {'size': 1})
+    first = store.publish('features', compute)
+    second = FeatureStore(str(tmp_path), {'size': 1}).publish('features', compute)
+    assert len(calls) == 1
+    assert isinstance(second, np.memmap)
+    np.testing.assert_array_equal(first, second)
+
+def test_publish_recomputes_stale_array(tmp_path):
+    '''Check that an array published from other data is computed again'''
+    FeatureStore(str(tmp_path), {'size': 1}).publish('features', lambda: np.zeros(3))
+    array = FeatureStore(str(tmp_path), {'size': 2}).publish('features', lambda: np.ones(3))
+    np.testing.assert_array_equal(array, np.ones(3))
+
+def test_exclusive_serializes_builders(tmp_path):
+    '''Check that only one holder of the lock runs at a time'''
+    lock_path = str(tmp_path / '.lock')
+    active, overlaps = [], []
+    def build():
+        with exclusive(lock_path):
+            active.append(1)
+            overlaps.append(len(active))
+            threading.Event().wait(0.01)
+            active.pop()
+
+    threads = [threading.Thread(target=build) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert overlaps == [1, 1, 1, 1]
@@ -0,0 +1,52 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from metrics import Histogram, Metrics, MetricsMiddleware, NO_SPAN, instrumented_json_response
+
+def test_histogram_exposition():
+    '''Check that buckets are cumulative and that every label set has its own series'''
+    histogram = Histogram('latency_seconds', 'Latency', ['span'], buckets=(0.01, 0.1))
+    for value in [0.005, 0.05, 0.5]:
+        histogram.observe(value, 'lookup')
+    histogram.observe(0.01, 'shap')
+
+    lines = histogram.expose()
+    assert lines[:2] == ['# HELP latency_seconds Latency', '# TYPE latency_seconds histogram']
+    assert 'latency_seconds_bucket{span="lookup",le="0.01"} 1' in lines
+    assert 'latency_seconds_bucket{span="lookup",le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{span="lookup",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{span="lookup"} 3' in lines
+    # Bucket bounds are inclusive
+    assert 'latency_seconds_bucket{span="shap",le="0.01"} 1' in lines
+    assert 'latency_seconds_sum{span="shap"} 0.01' in lines
+
+def test_spans_disabled():
+    '''Check that spans are not recorded when the metrics are disabled'''
+    metrics = Metrics(enabled=False)
+    with metrics.span('lookup') as span:
+        assert span is NO_SPAN
+    assert metrics.spans.series == {}
+
+    metrics = Metrics(enabled=True)
+    with metrics.span('lookup'):
+        pass
+    assert metrics.spans.series[('lookup',)][2] == 1
+
+def test_middleware_labels_by_route():
+    '''Check that requests are observed per route template and status, and that serialization is a span'''
+    metrics = Metrics(enabled=True)
+    app = FastAPI(default_response_class=instrumented_json_response(metrics))
+    app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+    @app.get('/api/clients/{id}')
+    async def get_client(id: int):
+        return {'clientId': id}
+
+    client = TestClient(app)
+    assert client.get('/api/clients/1').json() == {'clientId': 1}
+    client.get('/api/clients/2')
+    client.get('/unknown')
+
+    assert metrics.requests.series[('GET', '/api/clients/{id}', '200')][2] == 2
+    assert metrics.requests.series[('GET', 'unmatched', '404')][2] == 1
+    assert metrics.spans.series[('serialization',)][2] == 2
+    assert 'credit_api_request_duration_seconds_count{method="GET",route="/api/clients/{id}",status="200"} 2' in metrics.expose()
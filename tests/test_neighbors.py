@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from neighbors import build_index, save_index, load_index, build_graph, load_graph
+
+@pytest.fixture(scope='module')
+def get_scaled_data():
+    '''Random scaled features, with a zero row like a client with only median values'''
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(500, 20))
+    data[10] = 0
+    return data
+
+def test_exact_index_matches_sklearn(get_scaled_data):
+    '''Check that the exact engine finds the same neighbors as sklearn brute force'''
+    data = get_scaled_data
+    expected_distances, expected_indices = build_index('sklearn', data).kneighbors(data[20:40], 50)
+    distances, indices = build_index('exact', data, block_size=64).kneighbors(data[20:40], 50)
+    assert (indices == expected_indices).mean() > 0.99
+    np.testing.assert_allclose(distances, expected_distances, atol=1e-5)
+
+def test_ivf_index_exhaustive_probe_is_exact(get_scaled_data):
+    '''Check that probing every cell of the approximate engine gives the exact neighbors'''
+    data = get_scaled_data
+    _, expected_indices = build_index('exact', data).kneighbors(data[20:40], 50)
+    index = build_index('ivf', data, n_lists=10)
+    _, indices = index.kneighbors(data[20:40], 50, n_probe=10)
+    assert (indices == expected_indices).mean() > 0.99
+
+def test_ivf_index_returns_enough_neighbors(get_scaled_data):
+    '''Check that more cells are probed when the closest ones hold less vectors than asked'''
+    data = get_scaled_data
+    _, indices = build_index('ivf', data, n_lists=20, n_probe=1).kneighbors(data[:5], 200)
+    assert indices.shape == (5, 200)
+    assert all(len(np.unique(row)) == 200 for row in indices)
+
+@pytest.mark.parametrize('kind', ['exact', 'ivf', 'sklearn'])
+def test_index_add_matches_refit(get_scaled_data, kind):
+    '''Check that rows inserted after fitting are found like rows of a fitted index'''
+    data = get_scaled_data
+    _, expected_indices = build_index('exact', data).kneighbors(data[20:40], 50)
+    index = build_index(kind, data[:450], **({'n_lists': 10} if kind == 'ivf' else {}))
+    for start in range(450, 500, 10):
+        assert index.add(data[start:start + 10]) == start
+    params = {'n_probe': 10} if kind == 'ivf' else {}
+    _, indices = index.kneighbors(data[20:40], 50, **params)
+    assert (indices == expected_indices).mean() > 0.99
+
+@pytest.mark.parametrize('kind', ['exact', 'ivf', 'sklearn'])
+def test_index_truncate_drops_added_rows(get_scaled_data, kind):
+    '''Check that truncating an index forgets the inserted rows and the next row gets their position'''
+    data = get_scaled_data
+    index = build_index(kind, data[:100], **({'n_lists': 4} if kind == 'ivf' else {}))
+    index.add(data[100:110])
+    index.truncate(100)
+    _, indices = index.kneighbors(data[100:110], 100, **({'n_probe': 4} if kind == 'ivf' else {}))
+    assert indices.max() < 100
+    assert index.add(data[200:201]) == 100
+
+def test_index_round_trip(get_scaled_data, tmp_path):
+    '''Check that a stored index is only opened for the data it was built from'''
+    data = get_scaled_data
+    index = build_index('ivf', data, n_lists=10)
+    save_index(index, str(tmp_path / 'index'), signature={'size': 1})
+    assert load_index(str(tmp_path / 'index'), signature={'size': 2}) is None
+    loaded = load_index(str(tmp_path / 'index'), signature={'size': 1})
+    np.testing.assert_array_equal(loaded.kneighbors(data[:5], 10)[1], index.kneighbors(data[:5], 10)[1])
+
+def test_graph_matches_exact_index(get_scaled_data, tmp_path):
+    '''Check that the precomputed graph holds the exact neighbors of every row'''
+    data = get_scaled_data
+    build_graph(data, str(tmp_path / 'graph'), 30, signature={'size': 1}, block_size=64, n_jobs=2)
+    graph = load_graph(str(tmp_path / 'graph'), signature={'size': 1})
+    distances, expected_indices = build_index('exact', data).kneighbors(data[20:40], 30)
+    assert len(graph) == len(data)
+    for row, position in enumerate(range(20, 40)):
+        indices, similarities = graph.neighbors(position)
+        assert (indices == expected_indices[row]).mean() > 0.9
+        np.testing.assert_allclose(similarities, 1 - distances[row], atol=1e-3)
+    assert load_graph(str(tmp_path / 'graph'), signature={'size': 2}) is None
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+from sklearn.impute import SimpleImputer
+from sklearn.preprocessing import StandardScaler
+from preprocessing import Preprocessor
+
+def make_data(n_rows=200, seed=0):
+    '''Clients with missing values and a constant column'''
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame(rng.normal(10, 3, size=(n_rows, 4)), columns=['a', 'b', 'c', 'd'])
+    data = data.mask(rng.random(data.shape) < 0.2)
+    data['e'] = 1.0
+    data.insert(0, 'SK_ID_CURR', np.arange(n_rows))
+    return data
+
+def test_preprocessor_matches_sklearn():
+    '''Check that imputation and scaling give the same values as SimpleImputer and StandardScaler'''
+    data = make_data()
+    features = data.drop(columns=['SK_ID_CURR'])
+    fill = SimpleImputer(strategy='median').fit_transform(features)
+    scaled = StandardScaler().fit_transform(fill)
+
+    preprocessor = Preprocessor.fit(data)
+    np.testing.assert_allclose(preprocessor.impute(features), fill)
+    np.testing.assert_allclose(preprocessor.transform(features), scaled, atol=1e-12)
+
+def test_preprocessor_transforms_new_applicant():
+    '''Check that a single new row is transformed like the rows of a batch'''
+    data = make_data()
+    preprocessor = Preprocessor.fit(data)
+    new = make_data(10, seed=1).drop(columns=['SK_ID_CURR']).to_numpy()
+    np.testing.assert_array_equal(preprocessor.transform(new[3]), preprocessor.transform(new)[3])
+
+def test_preprocessor_save_load(tmp_path):
+    '''Check that a stored preprocessor is loaded with the same arrays and version'''
+    preprocessor = Preprocessor.fit(make_data(), source='clients.csv.gz')
+    preprocessor.save(str(tmp_path))
+    loaded = Preprocessor.load(str(tmp_path))
+    assert loaded.version == preprocessor.version
+    assert loaded.feature_names == ['a', 'b', 'c', 'd', 'e']
+    np.testing.assert_array_equal(loaded.scales, preprocessor.scales)
+    assert Preprocessor.load(str(tmp_path / 'missing')) is None
+    assert Preprocessor.fit(make_data(seed=2)).version != preprocessor.version
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+from profiles import ProfileStore, decode_one_hot
+from compact import CompactFrame
+
+def get_clients():
+    return pd.DataFrame({
+        'SK_ID_CURR': [100001, 100002],
+        'CODE_GENDER': [1.0, 0.0], 'CNT_CHILDREN': [0.0, np.nan], 'FLAG_OWN_CAR': [1.0, 0.0], 'FLAG_OWN_REALTY': [0.0, 1.0],
+        'DAYS_BIRTH': [-12000.0, -20000.0], 'DAYS_EMPLOYED': [-800.0, np.nan], 'DAYS_REGISTRATION': [-3000.0, -100.0],
+        'EXT_SOURCE_1': [0.5, np.nan], 'EXT_SOURCE_2': [0.25, 0.75], 'EXT_SOURCE_3': [np.nan, 0.125],
+        'AMT_INCOME_TOTAL': [202500.0, 135000.0], 'AMT_CREDIT': [406597.5, 270000.0], 'AMT_ANNUITY': [24700.5, 0.0],
+        'PAYMENT_RATE': [0.060749, 0.0], 'CREDIT_INCOME_PERCENT': [2.007889, 2.0],
+        'NAME_FAMILY_STATUS_Married': [0.0, 1.0], 'NAME_FAMILY_STATUS_Single': [1.0, 0.0],
+        'NAME_EDUCATION_TYPE_Higher': [0.0, 0.0], 'NAME_EDUCATION_TYPE_Secondary': [1.0, np.nan],
+        'NAME_INCOME_TYPE_Working': [1.0, 0.0], 'NAME_INCOME_TYPE_Pensioner': [0.0, 1.0]
+    })
+
+def test_decode_one_hot():
+    '''Check that the set column of every row is found, -1 when none is'''
+    block = np.array([[0, 1, 0], [1, 0, 0], [0, 0, np.nan], [1, 0, 1]])
+    assert decode_one_hot(block).tolist() == [1, 0, -1, 2]
+
+def test_personal_information():
+    '''Check the decoded labels and the derived age, missing values are None'''
+    store = ProfileStore(get_clients())
+    first, second = store.personal(0), store.personal(1)
+    assert first['gender'] == 'Woman' and first['countChildren'] == 'No children' and first['ownCar'] == 'Yes'
+    assert first['age'] == 33
+    assert first['civilStatus'] == 'Single' and first['educationType'] == 'Secondary'
+    assert second['countChildren'] is None
+    assert second['civilStatus'] == 'Married' and second['educationType'] == ''
+
+def test_bank_information():
+    '''Check the derived seniority, loan length and ratios, missing values count as 0'''
+    store = ProfileStore(CompactFrame.from_frame(get_clients()), block_size=1)
+    first, second = store.bank(0), store.bank(1)
+    assert first['seniority'] == 2 and first['lengthCredit'] == 198 and first['paymentRate'] == 6.07
+    assert first['extSource3'] == 0.0 and first['incomeType'] == 'Working'
+    assert second['seniority'] == 0 and second['lengthCredit'] is None and second['incomeType'] == 'Pensioner'
+
+def test_added_clients_are_decoded_from_their_row():
+    '''Check that a client beyond the loaded ones is decoded from the rows given by position'''
+    data = get_clients()
+    store = ProfileStore(data.iloc[:1], rows=lambda positions: data.iloc[positions])
+    assert len(store) == 1
+    assert store.personal(1) == ProfileStore(data).personal(1)
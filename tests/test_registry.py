@@ -0,0 +1,69 @@
+import threading
+import numpy as np
+import pytest
+from registry import ClientProbabilities, ModelRegistry, ModelVersion
+
+def load(source):
+    '''Fake loader: the version is the name of the file'''
+    if source == 'broken.pkl':
+        raise ValueError('Model broken.pkl was trained on other features')
+    return ModelVersion(source.replace('.pkl', ''), None, None, None, source=source)
+
+def test_registry_swaps_and_rolls_back():
+    '''Check that a loaded version is warmed up before being active, and that rollback restores the previous one'''
+    warmed = []
+    registry = ModelRegistry(load, warm_up=lambda version: warmed.append(version.version))
+    registry.load_version('v1.pkl')
+    registry.load_async('v2.pkl').join()
+    assert warmed == ['v1', 'v2']
+    assert registry.active.version == 'v2'
+    assert [version['version'] for version in registry.status()['history']] == ['v1']
+
+    assert registry.rollback().version == 'v1'
+    with pytest.raises(LookupError):
+        registry.rollback()
+
+def test_registry_keeps_active_version_when_load_fails():
+    '''Check that a failed load is reported and the active version keeps serving'''
+    registry = ModelRegistry(load)
+    registry.load_version('v1.pkl')
+    registry.load_async('broken.pkl').join()
+    assert registry.active.version == 'v1'
+    assert registry.status()['pending']['state'] == 'failed'
+    # A failed load does not block the next one
+    registry.load_async('v2.pkl').join()
+    assert registry.active.version == 'v2'
+
+def test_registry_pending_status_under_lock():
+    '''Check that a second load is refused while one warms up, and that a status read is not changed afterwards'''
+    warming, release = threading.Event(), threading.Event()
+    def warm_up(version):
+        warming.set()
+        release.wait(5)
+    registry = ModelRegistry(load, warm_up=warm_up)
+    thread = registry.load_async('v1.pkl')
+    assert warming.wait(5)
+    pending = registry.status()['pending']
+    assert pending == {'state': 'warming up', 'source': 'v1.pkl', 'version': 'v1'}
+    with pytest.raises(RuntimeError):
+        registry.load_async('v2.pkl')
+    release.set()
+    thread.join()
+    assert registry.status()['pending'] is None and registry.active.version == 'v1'
+    assert pending['state'] == 'warming up'
+    registry.load_async('v2.pkl').join()
+    assert registry.active.version == 'v2'
+
+def test_client_probabilities_scored_once():
+    '''Check that loaded clients are scored once, added clients are kept when ingested and only the others are scored'''
+    scored = []
+    def score(positions):
+        scored.append(positions.tolist())
+        return np.stack([1 - positions / 100, positions / 100], axis=1)
+
+    probabilities = ClientProbabilities(score, n_loaded=4, block_size=3)
+    assert probabilities()[:, 1].tolist() == [0, 0.01, 0.02, 0.03]
+    probabilities.add(4, [0.5, 0.5])
+    assert probabilities(6)[:, 1].tolist() == [0, 0.01, 0.02, 0.03, 0.5, 0.05]
+    assert probabilities(6).shape == (6, 2) and len(probabilities(3)) == 3
+    assert scored == [[0, 1, 2], [3], [5]]
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+from snapshot import build_snapshot, load_snapshot, is_fresh, snapshot_path
+
+@pytest.fixture
+def get_csv_file(tmp_path):
+    '''Write a small processed csv.gz file to snapshot'''
+    data = pd.DataFrame({
+        'SK_ID_CURR': [100001, 100005, 100013],
+        'CODE_GENDER': [0, 1, 1],
+        'AMT_CREDIT': [568800.0, np.nan, 663264.0],
+        'PAYMENT_RATE': [0.036, np.inf, 0.105]
+    })
+    file = tmp_path / 'test_feature_engineering_encoded.csv.gz'
+    data.to_csv(file, index=False)
+    return str(file), data
+
+def test_snapshot_path(get_csv_file):
+    '''Check that the snapshot is stored next to the source file'''
+    file, _ = get_csv_file
+    assert snapshot_path(file).endswith('test_feature_engineering_encoded.snapshot')
+
+def test_snapshot_round_trip(get_csv_file):
+    '''Check that loading a snapshot gives the same dataframe as parsing the csv.gz file'''
+    file, data = get_csv_file
+    snapshot_dir = build_snapshot(file)
+    loaded = load_snapshot(snapshot_dir)
+    expected = data.replace([np.inf, -np.inf], np.nan)
+    assert loaded.columns.to_list() == expected.columns.to_list()
+    assert loaded['SK_ID_CURR'].dtype == np.int64
+    pd.testing.assert_frame_equal(loaded, expected, check_dtype=False)
+
+def test_snapshot_is_memory_mapped(get_csv_file):
+    '''Check that features are not read into memory when the snapshot is opened'''
+    file, _ = get_csv_file
+    loaded = load_snapshot(build_snapshot(file))
+    values = loaded['AMT_CREDIT'].values
+    while values.base is not None and not isinstance(values, np.memmap):
+        values = values.base
+    assert isinstance(values, np.memmap)
+
+def test_snapshot_freshness(get_csv_file):
+    '''Check that a snapshot is considered stale when the source file changes'''
+    file, data = get_csv_file
+    assert not is_fresh(file)
+    build_snapshot(file)
+    assert is_fresh(file)
+    pd.concat([data, data.assign(SK_ID_CURR=100020)]).to_csv(file, index=False)
+    assert not is_fresh(file)
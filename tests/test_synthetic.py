@@ -0,0 +1,64 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# The generator is part of the benchmarks, not of the API
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+from synthetic import ClientSchema, detect_one_hot_groups, generate
+
+def reference_clients(n_clients=2000, seed=0):
+    '''Encoded clients with two one-hot groups, a flag, correlated amounts and missing values'''
+    rng = np.random.default_rng(seed)
+    family = rng.choice(3, n_clients, p=[0.5, 0.3, 0.2])
+    income = rng.choice(2, n_clients)
+    credit = rng.lognormal(11, 0.5, n_clients)
+    data = pd.DataFrame({
+        'SK_ID_CURR': np.arange(n_clients),
+        'FLAG_OWN_CAR': (rng.random(n_clients) < 0.3).astype(float),
+        'FLAG_OWN_REALTY': (rng.random(n_clients) < 0.7).astype(float),
+        'AMT_CREDIT': credit,
+        'AMT_ANNUITY': credit / rng.uniform(10, 20, n_clients),
+        'EXT_SOURCE_1': np.where(rng.random(n_clients) < 0.4, np.nan, rng.uniform(0, 1, n_clients)),
+        'CNT_CHILDREN': rng.poisson(0.5, n_clients).astype(float),
+    })
+    for position, status in enumerate(['Married', 'Single', 'Widow']):
+        data[f'NAME_FAMILY_STATUS_{status}'] = (family == position).astype(float)
+    for position, income_type in enumerate(['Working', 'Pensioner']):
+        data[f'NAME_INCOME_TYPE_{income_type}'] = (income == position).astype(float)
+    data['PAYMENT_RATE'] = data['AMT_ANNUITY'] / data['AMT_CREDIT']
+    return data
+
+def test_detect_one_hot_groups():
+    '''Check that one-hot groups are found and named by their full prefix, flags set together are not grouped'''
+    groups = detect_one_hot_groups(reference_clients().drop(columns=['SK_ID_CURR']))
+    assert groups == {'NAME_FAMILY_STATUS': ['NAME_FAMILY_STATUS_Married', 'NAME_FAMILY_STATUS_Single', 'NAME_FAMILY_STATUS_Widow'],
+                      'NAME_INCOME_TYPE': ['NAME_INCOME_TYPE_Working', 'NAME_INCOME_TYPE_Pensioner']}
+
+def test_schema_keeps_distributions():
+    '''Check that generated clients keep the columns, one-hot groups, frequencies, missing values and correlations'''
+    reference = reference_clients()
+    schema = ClientSchema.infer(reference)
+    data = schema.generate(20000, first_id=500000, seed=1)
+
+    assert data.columns.tolist() == reference.columns.tolist()
+    assert data['SK_ID_CURR'].tolist() == list(range(500000, 520000))
+    family = data.filter(regex='^NAME_FAMILY_STATUS_')
+    assert (family.sum(axis=1) == 1).all()
+    assert np.allclose(family.mean(), [0.5, 0.3, 0.2], atol=0.02)
+    assert set(data['CNT_CHILDREN'].unique()) <= set(reference['CNT_CHILDREN'].unique())
+    assert abs(data['EXT_SOURCE_1'].isna().mean() - 0.4) < 0.02
+    assert abs(data['AMT_CREDIT'].median() / reference['AMT_CREDIT'].median() - 1) < 0.05
+    assert data[['AMT_CREDIT', 'AMT_ANNUITY']].corr().iloc[0, 1] > 0.8
+    # Ratios of the feature engineering are recomputed
+    assert np.allclose(data['PAYMENT_RATE'], data['AMT_ANNUITY'] / data['AMT_CREDIT'])
+
+def test_generate_with_rules():
+    '''Check that clients generated from the model columns have exactly one category per one-hot group'''
+    columns = ['CODE_GENDER', 'DAYS_BIRTH', 'AMT_CREDIT', 'AMT_ANNUITY', 'PAYMENT_RATE', 
+               'NAME_FAMILY_STATUS_Married', 'NAME_FAMILY_STATUS_Single']
+    data = generate(columns, 100, first_id=10, target=True)
+
+    assert data.columns.tolist() == ['SK_ID_CURR', 'TARGET'] + columns
+    assert (data.filter(regex='^NAME_FAMILY_STATUS_').sum(axis=1) == 1).all()
+    assert (data['DAYS_BIRTH'] < 0).all()
@@ -0,0 +1,27 @@
+import pytest
+from timings import StageTimings
+
+def test_stage_timings():
+    '''Check that stages are timed in order, accumulated when run again and timed when they fail'''
+    timings = StageTimings()
+    with timings.stage('read'):
+        pass
+    with timings.stage('model'):
+        pass
+    with pytest.raises(ValueError):
+        with timings.stage('read'):
+            raise ValueError('failed')
+
+    assert list(timings.durations) == ['read', 'model']
+    assert all(duration >= 0 for duration in timings.durations.values())
+
+def test_stage_timings_observe():
+    '''Check that every run of a stage is passed to observe'''
+    observed = []
+    timings = StageTimings(observe=lambda name, duration: observed.append(name))
+    for name in ['read', 'read', 'scale']:
+        with timings.stage(name):
+            pass
+
+    assert observed == ['read', 'read', 'scale']
+    assert list(timings.durations) == ['read', 'scale']
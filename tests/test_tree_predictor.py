@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from lightgbm import LGBMClassifier
+from tree_predictor import CompiledPredictor, numba
+
+ENGINES = ['numpy'] + (['numba'] if numba is not None else [])
+
+def make_data(n_rows=600, n_features=8, seed=0):
+    '''Features with missing values and exact zeros, so that every split branch is used'''
+    rng = np.random.default_rng(seed)
+    features = rng.normal(size=(n_rows, n_features))
+    features[rng.random(features.shape) < 0.1] = np.nan
+    features[rng.random(features.shape) < 0.1] = 0
+    target = (np.nan_to_num(features[:, 0]) + np.nan_to_num(features[:, 1]) > 0).astype(int)
+    return features, target
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('params', [{}, {'zero_as_missing': True}, {'use_missing': False}])
+def test_predict_proba_matches_lightgbm(engine, params):
+    '''Check that probabilities match predict_proba whatever the handling of missing values'''
+    features, target = make_data()
+    model = LGBMClassifier(n_estimators=20, max_depth=4, verbose=-1, **params).fit(features, target)
+    predictor = CompiledPredictor.from_model(model, engine=engine)
+
+    test_features, _ = make_data(seed=1)
+    for batch in [test_features[:1], test_features[:10], test_features]:
+        np.testing.assert_allclose(predictor.predict_proba(batch), model.predict_proba(batch), rtol=0, atol=1e-12)
+
+def test_predict_proba_checks_number_of_features():
+    '''Check that rows with a wrong number of features are rejected'''
+    features, target = make_data()
+    model = LGBMClassifier(n_estimators=2, verbose=-1).fit(features, target)
+    with pytest.raises(ValueError):
+        CompiledPredictor.from_model(model).predict_proba(features[:, :3])